@@ -5,6 +5,35 @@
 # Global state variables
 __DIRENV_INSTANT_ENV_FILE=""
 __DIRENV_INSTANT_STDERR_FILE=""
+__DIRENV_INSTANT_ENV_GEN=""
+# The failure whose error this shell has seen, see `start`. Not exported, so
+# it is only passed to start.
+__DIRENV_INSTANT_FAILED=""
+
+# Evaluate the cached environment unless this generation is already applied
+_direnv_load_env() {
+  [[ -n $__DIRENV_INSTANT_ENV_FILE ]] && [[ -f $__DIRENV_INSTANT_ENV_FILE ]] || return 0
+
+  # Read the stamp first: if the daemon replaces the env in between we
+  # remember the older generation and simply apply the new env again later
+  local gen=""
+  read -r gen 2>/dev/null <"$__DIRENV_INSTANT_ENV_FILE.gen"
+  if [[ -n $gen ]] && [[ $gen == "$__DIRENV_INSTANT_ENV_GEN" ]]; then
+    return 0
+  fi
+
+  # Only the variables that changed since the generation we applied last
+  local delta=""
+  if [[ -n $__DIRENV_INSTANT_ENV_GEN ]] && [[ -f $__DIRENV_INSTANT_ENV_FILE.delta ]]; then
+    delta=$(<"$__DIRENV_INSTANT_ENV_FILE.delta")
+  fi
+  if [[ -n $gen ]] && [[ ${delta%%$'\n'*} == "# $__DIRENV_INSTANT_ENV_GEN $gen" ]]; then
+    eval "$delta"
+  else
+    eval "$(<"$__DIRENV_INSTANT_ENV_FILE")"
+  fi
+  __DIRENV_INSTANT_ENV_GEN=$gen
+}
 
 # SIGUSR1 handler - loads environment when signaled by Rust daemon
 _direnv_handler() {
@@ -18,9 +47,7 @@ _direnv_handler() {
   fi
 
   # Load environment variables (keep file as cache for next time)
-  if [[ -n $__DIRENV_INSTANT_ENV_FILE ]] && [[ -f $__DIRENV_INSTANT_ENV_FILE ]]; then
-    eval "$(<"$__DIRENV_INSTANT_ENV_FILE")"
-  fi
+  _direnv_load_env
 }
 
 # Main hook called on directory changes and prompts
@@ -28,20 +55,20 @@ _direnv_hook() {
   export DIRENV_INSTANT_SHELL_PID=$$
 
   # Load cached environment immediately if available and caching is enabled
-  if [[ ${DIRENV_INSTANT_USE_CACHE:-1} == 1 ]] && [[ -n $__DIRENV_INSTANT_ENV_FILE ]] && [[ -f $__DIRENV_INSTANT_ENV_FILE ]]; then
-    eval "$(<"$__DIRENV_INSTANT_ENV_FILE")"
+  if [[ ${DIRENV_INSTANT_USE_CACHE:-1} == 1 ]]; then
+    _direnv_load_env
   fi
 
   local previous_exit_status=$?;
   trap -- '' SIGINT;
-  eval "$(direnv-instant start)"
+  eval "$(__DIRENV_INSTANT_FAILED=$__DIRENV_INSTANT_FAILED direnv-instant start)"
   trap - SIGINT;
   return $previous_exit_status;
 }
 
 # Cleanup on shell exit
 _direnv_exit_cleanup() {
-  direnv-instant stop
+  direnv-instant stop --leave
 }
 
 # Initialize hooks if not already done
@@ -0,0 +1,68 @@
+use std::env;
+use std::ffi::{OsStr, OsString};
+use std::os::unix::ffi::OsStrExt;
+use std::process::{Command, Stdio};
+
+/// Variables bash sets itself, which say nothing about the baseline
+const SHELL_VARS: [&str; 4] = ["_", "PWD", "OLDPWD", "SHLVL"];
+
+/// Put our environment back to how it was before direnv loaded anything, so
+/// direnv's output is a project's whole env rather than a change to whatever
+/// project the caller had loaded. Returns false, leaving the environment
+/// alone, if direnv fails to unload. Only safe while single-threaded.
+pub fn unload(direnv_cmd: &str) -> bool {
+    if env::var_os("DIRENV_DIFF").is_some() {
+        let Some(baseline) = baseline_env(direnv_cmd) else {
+            return false;
+        };
+        apply_env(&baseline);
+    }
+    for key in ["DIRENV_DIR", "DIRENV_FILE", "DIRENV_DIFF", "DIRENV_WATCHES"] {
+        unsafe { env::remove_var(key) };
+    }
+    true
+}
+
+/// The environment from before direnv loaded anything, from letting direnv
+/// unload the current project the way `cd`ing out of it would
+fn baseline_env(direnv_cmd: &str) -> Option<Vec<(OsString, OsString)>> {
+    let output = Command::new("bash")
+        .args([
+            "-c",
+            r#"eval "$("$0" export bash)" && exec env -0"#,
+            direnv_cmd,
+        ])
+        .current_dir("/")
+        .stdin(Stdio::null())
+        .stderr(Stdio::null())
+        .output()
+        .ok()?;
+    if !output.status.success() {
+        return None;
+    }
+    let vars = output
+        .stdout
+        .split(|&b| b == 0)
+        .filter_map(|entry| {
+            let eq = entry.iter().position(|&b| b == b'=')?;
+            Some((
+                OsStr::from_bytes(&entry[..eq]).to_os_string(),
+                OsStr::from_bytes(&entry[eq + 1..]).to_os_string(),
+            ))
+        })
+        .filter(|(key, _)| !SHELL_VARS.iter().any(|v| key == v))
+        .collect();
+    Some(vars)
+}
+
+/// Replace our environment with `vars`, apart from the shell variables
+fn apply_env(vars: &[(OsString, OsString)]) {
+    for (key, _) in env::vars_os() {
+        if !SHELL_VARS.iter().any(|v| key == *v) && !vars.iter().any(|(k, _)| *k == key) {
+            unsafe { env::remove_var(key) };
+        }
+    }
+    for (key, value) in vars {
+        unsafe { env::set_var(key, value) };
+    }
+}
@@ -0,0 +1,54 @@
+use std::fs;
+use std::path::PathBuf;
+
+/// A cgroup v2 of its own for an evaluation, so cancelling it can reach
+/// descendants that left its process group. Only available where our cgroup
+/// is delegated to us, e.g. a systemd user scope.
+pub struct EvalCgroup {
+    path: PathBuf,
+}
+
+impl EvalCgroup {
+    /// Create a child of our own cgroup, if we are allowed to
+    pub fn create() -> Option<Self> {
+        let own = fs::read_to_string("/proc/self/cgroup").ok()?;
+        // The unified hierarchy's line is "0::<path>"
+        let relative = own.lines().find_map(|line| line.strip_prefix("0::"))?;
+        let relative = relative.trim_start_matches('/');
+        if relative.is_empty() {
+            return None; // Not going to litter the root cgroup
+        }
+
+        let base = PathBuf::from("/sys/fs/cgroup");
+        if !base.join("cgroup.controllers").exists() {
+            return None; // Legacy or hybrid hierarchy
+        }
+        let path = base
+            .join(relative)
+            .join(format!("direnv-instant-{}", std::process::id()));
+        fs::create_dir(&path).ok()?;
+        Some(Self { path })
+    }
+
+    /// Move the calling process into the cgroup; its children follow
+    pub fn enter(&self) -> bool {
+        fs::write(self.path.join("cgroup.procs"), "0").is_ok()
+    }
+
+    pub fn populated(&self) -> bool {
+        fs::read_to_string(self.path.join("cgroup.events"))
+            .is_ok_and(|events| events.lines().any(|line| line == "populated 1"))
+    }
+
+    /// SIGKILL everything in the cgroup (Linux 5.14+)
+    pub fn kill(&self) {
+        let _ = fs::write(self.path.join("cgroup.kill"), "1");
+    }
+}
+
+impl Drop for EvalCgroup {
+    fn drop(&mut self) {
+        // Fails while processes the evaluation left running are still in it
+        let _ = fs::remove_dir(&self.path);
+    }
+}
@@ -0,0 +1,95 @@
+use std::env;
+use std::os::fd::{AsFd, BorrowedFd};
+use std::path::PathBuf;
+
+#[cfg(target_os = "linux")]
+use nix::sys::inotify::{AddWatchFlags, InitFlags, Inotify, WatchDescriptor};
+#[cfg(target_os = "linux")]
+use std::collections::HashSet;
+#[cfg(target_os = "linux")]
+use std::ffi::OsString;
+
+/// Keep the daemon running after an evaluation and re-evaluate whenever one
+/// of the env's inputs changes
+pub fn enabled() -> bool {
+    env::var("DIRENV_INSTANT_WATCH").is_ok_and(|v| v == "1")
+}
+
+/// Notices changes to the files an env was derived from.
+///
+/// Editors and git replace files instead of writing them in place, so the
+/// directories containing them are watched and events are matched by name.
+pub struct ChangeWatcher {
+    #[cfg(target_os = "linux")]
+    inotify: Inotify,
+    #[cfg(target_os = "linux")]
+    names: HashSet<(WatchDescriptor, OsString)>,
+    #[cfg(not(target_os = "linux"))]
+    unsupported: std::convert::Infallible,
+}
+
+impl ChangeWatcher {
+    /// Start watching `paths`. Returns `None` if none of them can be watched.
+    #[cfg(target_os = "linux")]
+    pub fn new(paths: &[PathBuf]) -> Option<Self> {
+        let inotify = Inotify::init(InitFlags::IN_NONBLOCK | InitFlags::IN_CLOEXEC).ok()?;
+        let mask = AddWatchFlags::IN_CLOSE_WRITE
+            | AddWatchFlags::IN_ATTRIB
+            | AddWatchFlags::IN_CREATE
+            | AddWatchFlags::IN_DELETE
+            | AddWatchFlags::IN_MOVED_FROM
+            | AddWatchFlags::IN_MOVED_TO;
+
+        let mut names = HashSet::new();
+        for path in paths {
+            let (Some(dir), Some(name)) = (path.parent(), path.file_name()) else {
+                continue;
+            };
+            // Watching a directory twice returns the same descriptor
+            if let Ok(wd) = inotify.add_watch(dir, mask) {
+                names.insert((wd, name.to_owned()));
+            }
+        }
+        (!names.is_empty()).then_some(Self { inotify, names })
+    }
+
+    #[cfg(not(target_os = "linux"))]
+    pub fn new(_paths: &[PathBuf]) -> Option<Self> {
+        None
+    }
+
+    /// Consume pending events. Returns true if any of them concerns a watched file.
+    #[cfg(target_os = "linux")]
+    pub fn changed(&self) -> bool {
+        let mut changed = false;
+        while let Ok(events) = self.inotify.read_events() {
+            changed |= events.into_iter().any(|event| {
+                // Lost events or a removed directory may hide a change
+                event
+                    .mask
+                    .intersects(AddWatchFlags::IN_Q_OVERFLOW | AddWatchFlags::IN_IGNORED)
+                    || event
+                        .name
+                        .is_some_and(|name| self.names.contains(&(event.wd, name)))
+            });
+        }
+        changed
+    }
+
+    #[cfg(not(target_os = "linux"))]
+    pub fn changed(&self) -> bool {
+        match self.unsupported {}
+    }
+}
+
+impl AsFd for ChangeWatcher {
+    #[cfg(target_os = "linux")]
+    fn as_fd(&self) -> BorrowedFd<'_> {
+        self.inotify.as_fd()
+    }
+
+    #[cfg(not(target_os = "linux"))]
+    fn as_fd(&self) -> BorrowedFd<'_> {
+        match self.unsupported {}
+    }
+}
@@ -1,4 +1,19 @@
 pub mod hook;
+pub mod prewarm;
+pub mod profile;
 pub mod start;
+pub mod stats;
 pub mod stop;
+pub mod supervisor;
 pub mod watch;
+
+use nix::unistd::getppid;
+use std::env;
+
+/// The shell the hooks run us for
+pub fn shell_pid() -> i32 {
+    env::var("DIRENV_INSTANT_SHELL_PID")
+        .ok()
+        .and_then(|s| s.parse().ok())
+        .unwrap_or_else(|| getppid().as_raw())
+}
@@ -0,0 +1,5 @@
+use crate::prewarm;
+
+pub fn run() {
+    prewarm::run("direnv");
+}
@@ -0,0 +1,199 @@
+use nix::errno::Errno;
+use nix::pty::{ForkptyResult, forkpty};
+use nix::sys::wait::{WaitStatus, waitpid};
+use nix::unistd::read;
+use std::env;
+use std::fs::{self, remove_file};
+use std::os::fd::OwnedFd;
+use std::os::unix::fs::PermissionsExt;
+use std::path::{Path, PathBuf};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::baseline;
+use crate::daemon::{
+    PTY_WINSIZE, TempFiles, child_process, create_temp_file, direnv_export_command, get_runtime_dir,
+};
+use crate::lookup;
+use crate::profile::{self, Breakdown, OutputLine, Step};
+
+/// The trace and the rc file enabling it, removed once we are done
+struct TraceFiles {
+    trace: PathBuf,
+    rc: PathBuf,
+}
+
+impl TraceFiles {
+    fn create(runtime_dir: &Path) -> std::io::Result<Self> {
+        let trace = create_temp_file(runtime_dir, "profile_trace")?;
+        let rc = create_temp_file(runtime_dir, "profile_rc")
+            .and_then(|rc| fs::write(&rc, profile::TRACE_RC).map(|_| rc))
+            .inspect_err(|_| {
+                let _ = remove_file(&trace);
+            })?;
+        Ok(Self { trace, rc })
+    }
+}
+
+impl Drop for TraceFiles {
+    fn drop(&mut self) {
+        let _ = remove_file(&self.trace);
+        let _ = remove_file(&self.rc);
+    }
+}
+
+fn now() -> f64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map_or(0.0, |d| d.as_secs_f64())
+}
+
+/// Evaluate the current project's .envrc like the daemon does and print where
+/// the time went
+pub fn run(args: &[String]) {
+    let json = match args {
+        [] => false,
+        [flag] if flag == "--json" => true,
+        _ => {
+            eprintln!("Usage: direnv-instant profile [--json]");
+            std::process::exit(1);
+        }
+    };
+
+    let Some(envrc_dir) = env::current_dir()
+        .ok()
+        .and_then(|cwd| lookup::find_envrc_root(&cwd).root)
+    else {
+        eprintln!("direnv-instant: No .envrc found");
+        std::process::exit(1);
+    };
+    let runtime_dir = get_runtime_dir(&envrc_dir);
+    let files = fs::create_dir_all(&runtime_dir)
+        .and_then(|_| fs::set_permissions(&runtime_dir, PermissionsExt::from_mode(0o700)))
+        .and_then(|_| {
+            Ok((
+                TempFiles::create(&runtime_dir)?,
+                TraceFiles::create(&runtime_dir)?,
+            ))
+        });
+    let (temp, trace) = match files {
+        Ok(files) => files,
+        Err(e) => {
+            eprintln!("direnv-instant: Failed to create temp files: {}", e);
+            std::process::exit(1);
+        }
+    };
+
+    // Unload the project first, or direnv has nothing to do in a project the
+    // shell has loaded already and nothing is traced
+    if !baseline::unload("direnv") {
+        eprintln!("direnv-instant: Failed to unload the current env");
+        std::process::exit(1);
+    }
+
+    let mut command = direnv_export_command("direnv");
+    command
+        .env("BASH_ENV", &trace.rc)
+        .env("__DIRENV_INSTANT_TRACE", &trace.trace);
+
+    let started = now();
+    let (status, output) = match unsafe { forkpty(Some(&PTY_WINSIZE), None) } {
+        Ok(ForkptyResult::Parent { child, master }) => {
+            let output = read_output(master, started, !json);
+            let status = match waitpid(child, None) {
+                Ok(WaitStatus::Exited(_, code)) => code,
+                _ => 1,
+            };
+            (status, output)
+        }
+        Ok(ForkptyResult::Child) => child_process(command, &temp.env),
+        Err(e) => {
+            eprintln!("direnv-instant: forkpty failed: {}", e);
+            std::process::exit(1);
+        }
+    };
+    let finished = now();
+
+    let events = profile::parse_trace(&fs::read_to_string(&trace.trace).unwrap_or_default());
+    let breakdown = profile::attribute(&events, started, finished);
+    let envrc = envrc_dir.join(".envrc");
+    if json {
+        println!(
+            "{}",
+            profile::to_json(&envrc, finished - started, status, &breakdown, &output)
+        );
+    } else {
+        print_breakdown(
+            &envrc,
+            finished - started,
+            status,
+            &breakdown,
+            events.is_empty(),
+        );
+    }
+}
+
+/// Collect direnv's output until it exits, echoing it with timestamps
+fn read_output(master: OwnedFd, started: f64, echo: bool) -> Vec<OutputLine> {
+    let mut lines = Vec::new();
+    let mut pending = Vec::new();
+    let mut buf = [0u8; 4096];
+    loop {
+        let n = match read(&master, &mut buf) {
+            Ok(0) | Err(Errno::EIO) => break,
+            Ok(n) => n,
+            Err(Errno::EINTR) => continue,
+            Err(_) => break,
+        };
+        let seconds = now() - started;
+        pending.extend_from_slice(&buf[..n]);
+        while let Some(end) = pending.iter().position(|&b| b == b'\n') {
+            let line: Vec<u8> = pending.drain(..=end).collect();
+            let text = String::from_utf8_lossy(&line).trim_end().to_string();
+            if echo {
+                eprintln!("[{:>7.3}s] {}", seconds, text);
+            }
+            lines.push(OutputLine { seconds, text });
+        }
+    }
+    if !pending.is_empty() {
+        let text = String::from_utf8_lossy(&pending).trim_end().to_string();
+        if echo {
+            eprintln!("[{:>7.3}s] {}", now() - started, text);
+        }
+        lines.push(OutputLine {
+            seconds: now() - started,
+            text,
+        });
+    }
+    lines
+}
+
+fn print_breakdown(envrc: &Path, total: f64, status: i32, breakdown: &Breakdown, untraced: bool) {
+    println!(
+        "{}: {:.3}s (exit status {})",
+        envrc.display(),
+        total,
+        status
+    );
+    if untraced {
+        println!("No trace was recorded, profiling needs direnv to run bash 5 or newer");
+        return;
+    }
+    let print_steps = |title: &str, steps: &[Step]| {
+        println!();
+        println!("{:>9}{:>7}{:>7}  {}", "seconds", "share", "count", title);
+        for step in steps {
+            println!(
+                "{:>9.3}{:>6.1}%{:>7}  {}",
+                step.seconds,
+                100.0 * step.seconds / total.max(f64::EPSILON),
+                step.count,
+                step.name
+            );
+        }
+    };
+    print_steps("phase", &breakdown.phases);
+    if !breakdown.lines.is_empty() {
+        print_steps(".envrc line", &breakdown.lines);
+    }
+}
@@ -1,75 +1,168 @@
+use crate::commands::shell_pid;
 use crate::daemon::{
-    DaemonContext, direnv_export_command, get_socket_path, notify_daemon, start_daemon, stop_daemon,
+    DaemonContext, debug_log, direnv_export_command, get_project_cache_dir, get_runtime_dir,
+    get_socket_path, leave_daemon, notify_daemon, start_daemon,
 };
+use crate::failures;
+use crate::freshness;
+use crate::lookup;
 use crate::mux::Multiplexer;
-use nix::unistd::getppid;
+use crate::prewarm;
+use crate::projects;
+use crate::stats::{self, Span};
+use crate::supervisor;
 use std::env;
+use std::fs;
 use std::os::unix::process::CommandExt;
 use std::path::{Path, PathBuf};
 use std::process::Stdio;
+use std::time::Instant;
 
 pub fn run() {
+    let mut span = Span::start("start");
     let direnv = "direnv";
-    let parent_pid = env::var("DIRENV_INSTANT_SHELL_PID")
-        .ok()
-        .and_then(|s| s.parse().ok())
-        .unwrap_or_else(|| getppid().as_raw());
+    let parent_pid = shell_pid();
 
     // Find .envrc directory
     let envrc_dir = match find_envrc() {
         Some(dir) => dir,
         None => {
             println!("unset __DIRENV_INSTANT_CURRENT_DIR");
+            println!("unset __DIRENV_INSTANT_ENV_FILE");
+            println!("unset __DIRENV_INSTANT_ENV_GEN");
+            // Nothing to load here and nothing loaded that direnv would have to unload
+            if env::var_os("DIRENV_DIR").is_none() && env::var_os("DIRENV_DIFF").is_none() {
+                return;
+            }
+            drop(span);
             run_direnv_sync(direnv, false);
             return;
         }
     };
+    span.project = Some(envrc_dir.clone());
+
+    let nothing_loaded = ["__DIRENV_INSTANT_CURRENT_DIR", "DIRENV_DIR", "DIRENV_DIFF"]
+        .iter()
+        .all(|name| env::var_os(name).is_none());
 
     // Check if we need to restart daemon (different directory)
+    let mut same_dir = false;
     if let Ok(current) = env::var("__DIRENV_INSTANT_CURRENT_DIR") {
         let current_dir = PathBuf::from(&current);
         if current_dir != envrc_dir {
-            stop_daemon(&get_socket_path(&current_dir));
+            leave_daemon(&get_socket_path(&current_dir), parent_pid);
+            println!("unset __DIRENV_INSTANT_ENV_GEN");
+        } else {
+            same_dir = true;
+        }
+    }
+    if !same_dir {
+        let _ = projects::record_visit(&envrc_dir);
+        if prewarm::enabled() {
+            prewarm::spawn_if_due();
         }
     }
     export_path_var("__DIRENV_INSTANT_CURRENT_DIR", &envrc_dir);
 
     // If not in a multiplexer, just run direnv synchronously
     if Multiplexer::detect().is_none() {
+        drop(span);
         run_direnv_sync(direnv, true);
         return;
     }
 
-    // Set up daemon context
-    let ctx = match DaemonContext::new(parent_pid, envrc_dir) {
-        Ok(ctx) => ctx,
-        Err(e) => {
-            eprintln!("direnv-instant: Failed to create temp files: {}", e);
-            run_direnv_sync(direnv, true);
+    // The shell already has this project's env applied; skip the daemon entirely
+    // if nothing direnv watches has changed since it was produced
+    let cache_dir = get_project_cache_dir(&envrc_dir);
+    let applied =
+        same_dir && env::var_os("__DIRENV_INSTANT_ENV_FILE") == Some(cache_dir.join("env").into());
+    if applied && freshness::is_fresh(&cache_dir) {
+        return;
+    }
+
+    export_path_var("__DIRENV_INSTANT_ENV_FILE", &cache_dir.join("env"));
+    export_path_var(
+        "__DIRENV_INSTANT_STDERR_FILE",
+        &get_runtime_dir(&envrc_dir).join("env.stderr"),
+    );
+
+    // A new shell, e.g. a new pane, has nothing applied yet. Hand it the env
+    // from an earlier evaluation now and only revalidate it in the background.
+    // A shell coming from another project goes through direnv, which unloads
+    // that project's env first.
+    if nothing_loaded
+        && use_cache()
+        && emit_cached_env(&cache_dir)
+        && freshness::is_fresh(&cache_dir)
+    {
+        return;
+    }
+
+    // direnv refused or failed on exactly this .envrc before: don't run it
+    // again until the .envrc or what is allowed changes. Shells see the error
+    // once, from the hook when the evaluation finishes or from here.
+    if let Some(key) = failures::key(&envrc_dir) {
+        let shown = env::var("__DIRENV_INSTANT_FAILED").is_ok_and(|k| k == key);
+        if !shown {
+            // A plain shell variable, so it doesn't leak into every process
+            println!("__DIRENV_INSTANT_FAILED='{}'", key);
+        }
+        if let Some(log) = failures::cached(&cache_dir, &key) {
+            if !shown {
+                eprint!("{}", log);
+            }
             return;
         }
-    };
-    export_path_var("__DIRENV_INSTANT_ENV_FILE", &ctx.env_file);
-    export_path_var("__DIRENV_INSTANT_STDERR_FILE", &ctx.stderr_file);
+    }
+
+    // Temp files are only allocated by the daemon once it actually runs direnv
+    let ctx = DaemonContext::new(Some(parent_pid), envrc_dir);
 
     // Check if daemon is already running
     if ctx.socket_path.exists() && notify_daemon(&ctx.socket_path, parent_pid) {
         return;
     }
 
+    // A single long-lived supervisor owns all evaluations; one write and we're done
+    if supervisor::enabled() && supervisor::request_eval(parent_pid, &ctx.envrc_dir) {
+        return;
+    }
+
+    let spawn_started = Instant::now();
     start_daemon(direnv, &ctx);
+    stats::record("spawn", Some(&ctx.envrc_dir), spawn_started.elapsed());
 }
 
 fn find_envrc() -> Option<PathBuf> {
-    let mut dir = env::current_dir().ok()?;
-    loop {
-        if dir.join(".envrc").exists() {
-            return Some(dir);
-        }
-        if !dir.pop() {
-            return None;
-        }
-    }
+    let cwd = env::current_dir().ok()?;
+    let started = Instant::now();
+    let lookup = lookup::find_envrc_root(&cwd);
+    stats::record("lookup", lookup.root.as_deref(), started.elapsed());
+    debug_log(&format!(
+        "envrc lookup for {}: {} stats ({})",
+        cwd.display(),
+        lookup.stats,
+        if lookup.cached { "cached" } else { "walked" }
+    ));
+    lookup.root
+}
+
+fn use_cache() -> bool {
+    env::var("DIRENV_INSTANT_USE_CACHE").map_or(true, |v| v != "0")
+}
+
+/// Print the cached env for the shell to evaluate, along with its generation
+/// so the hook doesn't apply it again. Returns false if there is none.
+fn emit_cached_env(cache_dir: &Path) -> bool {
+    // The stamp first, like the hooks: if the env is replaced in between,
+    // the shell applies the new one again later
+    let generation = fs::read_to_string(cache_dir.join("env.gen")).unwrap_or_default();
+    let Ok(export_script) = fs::read_to_string(cache_dir.join("env")) else {
+        return false;
+    };
+    println!("{}", export_script.trim_end());
+    println!("__DIRENV_INSTANT_ENV_GEN='{}'", generation.trim());
+    true
 }
 
 fn run_direnv_sync(direnv: &str, show_errors: bool) {
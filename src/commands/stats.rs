@@ -0,0 +1,82 @@
+use std::collections::BTreeMap;
+
+use crate::stats;
+
+/// Known events, in the order they happen
+const EVENTS: &[&str] = &[
+    "start",
+    "lookup",
+    "spawn",
+    "first_output",
+    "mux_spawn",
+    "eval",
+    "store_env",
+    "notify",
+];
+
+/// Print latency percentiles per project and event
+pub fn run() {
+    let events = stats::load();
+    if events.is_empty() {
+        eprintln!(
+            "direnv-instant: No stats in {}, set DIRENV_INSTANT_STATS=1 to record them",
+            stats::stats_file().display()
+        );
+        std::process::exit(1);
+    }
+
+    let mut projects: BTreeMap<String, BTreeMap<String, Vec<u64>>> = BTreeMap::new();
+    for event in events {
+        let project = match &event.project {
+            Some(project) => project.display().to_string(),
+            None => "(no project)".to_string(),
+        };
+        projects
+            .entry(project)
+            .or_default()
+            .entry(event.event)
+            .or_default()
+            .push(event.micros);
+    }
+
+    for (project, timings) in projects {
+        println!("{}", project);
+        println!(
+            "  {:<14}{:>7}{:>10}{:>10}{:>10}{:>10}",
+            "event", "count", "p50", "p90", "p99", "max"
+        );
+        let mut timings: Vec<_> = timings.into_iter().collect();
+        timings.sort_by_key(|(name, _)| {
+            EVENTS
+                .iter()
+                .position(|e| e == name)
+                .unwrap_or(EVENTS.len())
+        });
+        for (name, mut samples) in timings {
+            samples.sort_unstable();
+            println!(
+                "  {:<14}{:>7}{:>10}{:>10}{:>10}{:>10}",
+                name,
+                samples.len(),
+                format_micros(percentile(&samples, 50)),
+                format_micros(percentile(&samples, 90)),
+                format_micros(percentile(&samples, 99)),
+                format_micros(samples[samples.len() - 1]),
+            );
+        }
+    }
+}
+
+/// Nearest-rank percentile of sorted, non-empty `samples`
+fn percentile(samples: &[u64], p: usize) -> u64 {
+    let rank = (samples.len() * p).div_ceil(100).max(1);
+    samples[rank - 1]
+}
+
+fn format_micros(micros: u64) -> String {
+    match micros {
+        0..1_000 => format!("{}us", micros),
+        1_000..1_000_000 => format!("{:.1}ms", micros as f64 / 1e3),
+        _ => format!("{:.2}s", micros as f64 / 1e6),
+    }
+}
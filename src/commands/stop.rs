@@ -1,10 +1,17 @@
-use crate::daemon::{get_socket_path, stop_daemon};
+use crate::commands::shell_pid;
+use crate::daemon::{get_socket_path, leave_daemon, stop_daemon};
 use std::env;
 use std::path::PathBuf;
 
-pub fn run() {
+/// Cancel the current project's evaluation. With `--leave`, as the shell
+/// exits, the `DIRENV_INSTANT_ON_LEAVE` policy applies instead.
+pub fn run(args: &[String]) {
     if let Ok(dir) = env::var("__DIRENV_INSTANT_CURRENT_DIR") {
         let socket_path = get_socket_path(&PathBuf::from(dir));
-        stop_daemon(&socket_path);
+        if args.iter().any(|a| a == "--leave") {
+            leave_daemon(&socket_path, shell_pid());
+        } else {
+            stop_daemon(&socket_path);
+        }
     }
 }
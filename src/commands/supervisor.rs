@@ -0,0 +1,12 @@
+use crate::supervisor;
+
+pub fn run(args: &[String]) {
+    match args.first().map(|s| s.as_str()) {
+        None => supervisor::run_foreground(),
+        Some("stop") => supervisor::stop_supervisor(),
+        Some(other) => {
+            eprintln!("Unknown supervisor command: {}", other);
+            std::process::exit(1);
+        }
+    }
+}
@@ -5,8 +5,7 @@ use nix::sys::socket::{ControlMessageOwned, MsgFlags, recvmsg};
 use nix::sys::termios::{InputFlags, LocalFlags, SetArg, Termios, tcgetattr, tcsetattr};
 use nix::sys::time::{TimeVal, TimeValLike};
 use nix::unistd::{isatty, read, write};
-use std::fs::File;
-use std::io::{self, IoSliceMut, Stdin, Write};
+use std::io::{self, ErrorKind, IoSliceMut, Stdin, Write};
 use std::os::fd::{AsFd, AsRawFd, FromRawFd, OwnedFd, RawFd};
 use std::os::unix::net::UnixStream;
 use std::path::Path;
@@ -15,6 +14,9 @@ use std::time::{Duration, Instant};
 
 static WATCH_RUNNING: AtomicBool = AtomicBool::new(true);
 
+/// How long to wait for the daemon to bind its socket
+const SOCKET_WAIT: Duration = Duration::from_secs(5);
+
 extern "C" fn sigint_handler(_: nix::libc::c_int) {
     WATCH_RUNNING.store(false, Ordering::SeqCst);
 }
@@ -54,27 +56,21 @@ impl Drop for RawModeGuard<'_> {
     }
 }
 
-pub fn run(log_path: &Path, socket_path: &Path) {
+pub fn run(socket_path: &Path) {
     let handler = SigHandler::Handler(sigint_handler);
     let action = SigAction::new(handler, SaFlags::empty(), SigSet::empty());
     unsafe {
         let _ = sigaction(Signal::SIGINT, &action);
     }
 
-    // Open log file for reading (should exist by now, but wait up to 5 seconds as safety margin)
-    let log_file = {
-        let start = Instant::now();
-        let timeout = Duration::from_secs(5);
-        loop {
-            if let Ok(f) = File::open(log_path) {
-                break f;
-            }
-            if start.elapsed() > timeout {
-                eprintln!("Timeout waiting for log file");
-                std::process::exit(1);
-            }
-            std::thread::sleep(Duration::from_millis(100));
-        }
+    let Some(first) = wait_for_socket(socket_path) else {
+        std::process::exit(1);
+    };
+    let mut first = Some(first);
+    let mut connect = || {
+        first
+            .take()
+            .map_or_else(|| UnixStream::connect(socket_path), Ok)
     };
 
     let stdin = io::stdin();
@@ -82,7 +78,7 @@ pub fn run(log_path: &Path, socket_path: &Path) {
 
     // Socket 1: Get PTY fd if stdin is a terminal (then close)
     let pty_master = if stdin_is_terminal {
-        match UnixStream::connect(socket_path) {
+        match connect() {
             Ok(mut watch_socket) => {
                 // Request PTY fd
                 if watch_socket.write_all(b"WATCH\n").is_err() {
@@ -156,8 +152,10 @@ pub fn run(log_path: &Path, socket_path: &Path) {
         None
     };
 
-    // Socket 2: Monitor daemon exit (long-lived connection)
-    let socket = UnixStream::connect(socket_path).unwrap_or_else(|_| std::process::exit(1));
+    // Socket 2: Stream direnv's output until the daemon exits (long-lived connection)
+    let socket = connect()
+        .and_then(|mut socket| socket.write_all(b"STREAM\n").map(|_| socket))
+        .unwrap_or_else(|_| std::process::exit(1));
 
     let mut buf = [0u8; 8192];
     let stdout = io::stdout();
@@ -169,9 +167,8 @@ pub fn run(log_path: &Path, socket_path: &Path) {
         if stdin_is_terminal && pty_master.is_some() {
             fds.insert(stdin.as_fd());
         }
-        let mut timeout = TimeVal::milliseconds(100);
 
-        match select(None, Some(&mut fds), None, None, Some(&mut timeout)) {
+        match select(None, Some(&mut fds), None, None, None) {
             Ok(_) => {
                 // Check if stdin has data to forward to PTY
                 if stdin_is_terminal
@@ -191,22 +188,13 @@ pub fn run(log_path: &Path, socket_path: &Path) {
                     }
                 }
 
-                // Check if socket closed (daemon done)
                 if fds.contains(socket.as_fd()) {
                     match read(&socket, &mut buf) {
-                        Ok(0) => {
-                            // Socket closed - daemon is done, output remaining log data and exit
-                            while let Ok(n) = read(&log_file, &mut buf) {
-                                if n == 0 {
-                                    break;
-                                }
-                                let _ = handle.write_all(&buf[..n]);
-                            }
+                        // Socket closed - daemon is done
+                        Ok(0) => break,
+                        Ok(n) => {
+                            let _ = handle.write_all(&buf[..n]);
                             let _ = handle.flush();
-                            break;
-                        }
-                        Ok(_) => {
-                            // Unexpected data on socket, ignore
                         }
                         Err(_) => break,
                     }
@@ -214,21 +202,68 @@ pub fn run(log_path: &Path, socket_path: &Path) {
             }
             Err(_) => break,
         }
-
-        // Poll log file on every iteration (regular files don't work with select)
-        match read(&log_file, &mut buf) {
-            Ok(0) => {
-                // No data available yet, continue
-            }
-            Ok(n) => {
-                let _ = handle.write_all(&buf[..n]);
-                let _ = handle.flush();
-            }
-            Err(_) => {}
-        }
     }
 
     if !WATCH_RUNNING.load(Ordering::SeqCst) {
         stop_daemon(socket_path);
     }
 }
+
+/// Wait until the daemon accepts connections on its socket, so watch can be
+/// started before the evaluation it follows. Blocks on inotify for the socket
+/// being created and only polls where inotify isn't available.
+fn wait_for_socket(socket_path: &Path) -> Option<UnixStream> {
+    let deadline = Instant::now() + SOCKET_WAIT;
+    let notifier = socket_notifier(socket_path);
+    let mut buf = [0u8; 4096];
+    let mut waited = false;
+    loop {
+        match UnixStream::connect(socket_path) {
+            Ok(stream) => return Some(stream),
+            Err(e) if e.kind() == ErrorKind::NotFound => {}
+            // Bound but not listening yet
+            Err(e) if waited && e.kind() == ErrorKind::ConnectionRefused => {}
+            Err(_) => return None,
+        }
+        let remaining = deadline.saturating_duration_since(Instant::now());
+        if remaining.is_zero() || !WATCH_RUNNING.load(Ordering::SeqCst) {
+            return None;
+        }
+
+        let mut fds = FdSet::new();
+        let wait = match notifier {
+            Some(ref notifier) => {
+                fds.insert(notifier.as_fd());
+                remaining
+            }
+            None => remaining.min(Duration::from_millis(100)),
+        };
+        let mut timeout = TimeVal::microseconds(wait.as_micros() as i64);
+        let _ = select(None, Some(&mut fds), None, None, Some(&mut timeout));
+        if let Some(ref notifier) = notifier {
+            while matches!(read(notifier, &mut buf), Ok(n) if n > 0) {}
+        }
+        waited = true;
+    }
+}
+
+/// An fd that becomes readable whenever an entry is created in the socket's
+/// directory
+#[cfg(any(target_os = "linux", target_os = "android"))]
+fn socket_notifier(socket_path: &Path) -> Option<OwnedFd> {
+    use nix::sys::inotify::{AddWatchFlags, InitFlags, Inotify};
+
+    let inotify = Inotify::init(InitFlags::IN_NONBLOCK | InitFlags::IN_CLOEXEC).ok()?;
+    inotify
+        .add_watch(
+            socket_path.parent()?,
+            AddWatchFlags::IN_CREATE | AddWatchFlags::IN_MOVED_TO,
+        )
+        .ok()?;
+    Some(inotify.into())
+}
+
+#[cfg(not(any(target_os = "linux", target_os = "android")))]
+fn socket_notifier(_socket_path: &Path) -> Option<OwnedFd> {
+    None
+}
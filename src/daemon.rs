@@ -1,41 +1,46 @@
 use nix::errno::Errno;
 use nix::libc;
+use nix::poll::{PollFd, PollFlags, PollTimeout, poll};
 use nix::pty::{ForkptyResult, Winsize, forkpty};
-use nix::sys::select::{FdSet, select};
-use nix::sys::signal::{Signal, kill};
+use nix::sys::signal::{Signal, killpg};
 use nix::sys::socket::{ControlMessage, MsgFlags, sendmsg};
-use nix::sys::time::{TimeVal, TimeValLike};
 use nix::sys::wait::{WaitPidFlag, WaitStatus, waitpid};
 use nix::unistd::{ForkResult, Pid, dup2_stderr, dup2_stdin, dup2_stdout, fork, read, setsid};
 use std::collections::hash_map::DefaultHasher;
+use std::env;
 use std::ffi::OsString;
-use std::fs::{File, remove_file};
+use std::fs::{self, DirBuilder, File, OpenOptions, remove_file};
 use std::hash::{Hash, Hasher};
-use std::io::{BufRead, BufReader, IoSlice, Write};
-use std::os::fd::{AsFd, AsRawFd, OwnedFd};
+use std::io::{ErrorKind, IoSlice, Read, Write};
+use std::os::fd::{AsFd, AsRawFd, BorrowedFd, OwnedFd};
 use std::os::unix::ffi::OsStringExt;
-use std::os::unix::fs::PermissionsExt;
+use std::os::unix::fs::{DirBuilderExt, MetadataExt, PermissionsExt};
 use std::os::unix::net::{UnixListener, UnixStream};
 use std::path::{Path, PathBuf};
 use std::process::{Command, Stdio};
-use std::sync::atomic::{AtomicBool, Ordering};
-use std::sync::{Arc, Mutex};
-use std::{env, thread};
+use std::time::{Duration, Instant, SystemTime};
 
+use crate::baseline;
+use crate::cgroup::EvalCgroup;
+use crate::changes::{self, ChangeWatcher};
+use crate::exports;
+use crate::failures;
+use crate::freshness;
+use crate::history;
 use crate::mux::{self, Multiplexer};
+use crate::output::{OUTPUT_CAPACITY, OutputBuffer, StderrMode};
+use crate::scheduler::{self, Slot, Ticket};
+use crate::stats;
+use crate::subscribers::Subscribers;
 
-const PTY_WINSIZE: Winsize = Winsize {
+pub const PTY_WINSIZE: Winsize = Winsize {
     ws_row: 24,
     ws_col: 80,
     ws_xpixel: 0,
     ws_ypixel: 0,
 };
 
-pub fn get_runtime_dir(envrc_dir: &Path) -> PathBuf {
-    let mut hasher = DefaultHasher::new();
-    envrc_dir.hash(&mut hasher);
-    let dir_hash = hasher.finish();
-
+pub fn get_cache_dir() -> PathBuf {
     let cache_base = env::var("XDG_CACHE_HOME")
         .map(PathBuf::from)
         .unwrap_or_else(|_| {
@@ -44,16 +49,66 @@ pub fn get_runtime_dir(envrc_dir: &Path) -> PathBuf {
                 .unwrap_or_else(|_| PathBuf::from("/tmp"))
         });
 
-    cache_base
-        .join("direnv-instant")
-        .join(format!("{:x}", dir_hash))
+    cache_base.join("direnv-instant")
+}
+
+/// Sockets, locks and files that only live as long as an evaluation. They
+/// are written often and needn't survive a reboot, so they go to the tmpfs at
+/// `$XDG_RUNTIME_DIR` rather than next to the cache, which may be on a network
+/// filesystem. Without one, a private directory in /tmp; if that isn't ours,
+/// the cache directory.
+pub fn get_runtime_base() -> PathBuf {
+    if let Some(dir) = env::var_os("XDG_RUNTIME_DIR").map(PathBuf::from)
+        && dir.is_absolute()
+        && dir.is_dir()
+    {
+        return dir.join("direnv-instant");
+    }
+
+    let uid = unsafe { libc::getuid() };
+    let fallback = PathBuf::from(format!("/tmp/direnv-instant-{}", uid));
+    let _ = DirBuilder::new().mode(0o700).create(&fallback);
+    match fs::symlink_metadata(&fallback) {
+        Ok(m) if m.is_dir() && m.uid() == uid && m.mode() & 0o077 == 0 => fallback,
+        _ => get_cache_dir(),
+    }
+}
+
+fn project_dir_name(envrc_dir: &Path) -> String {
+    let mut hasher = DefaultHasher::new();
+    envrc_dir.hash(&mut hasher);
+    format!("{:x}", hasher.finish())
+}
+
+/// Where a project's env and what it was derived from are cached
+pub fn get_project_cache_dir(envrc_dir: &Path) -> PathBuf {
+    get_cache_dir().join(project_dir_name(envrc_dir))
+}
+
+/// Where a project's daemon keeps its socket, temp files and output
+pub fn get_runtime_dir(envrc_dir: &Path) -> PathBuf {
+    get_runtime_base().join(project_dir_name(envrc_dir))
+}
+
+/// Append a line to `DIRENV_INSTANT_DEBUG_LOG`, if set
+pub fn debug_log(message: &str) {
+    if let Ok(debug_log) = env::var("DIRENV_INSTANT_DEBUG_LOG")
+        && let Ok(mut logfile) = OpenOptions::new().create(true).append(true).open(debug_log)
+    {
+        let _ = writeln!(
+            logfile,
+            "direnv-instant[{}]: {}",
+            std::process::id(),
+            message
+        );
+    }
 }
 
 pub fn get_socket_path(envrc_dir: &Path) -> PathBuf {
     get_runtime_dir(envrc_dir).join("daemon.sock")
 }
 
-fn create_temp_file(runtime_dir: &Path, prefix: &str) -> std::io::Result<PathBuf> {
+pub fn create_temp_file(runtime_dir: &Path, prefix: &str) -> std::io::Result<PathBuf> {
     let template = runtime_dir.join(format!("{}.XXXXXX", prefix));
     let mut bytes = template.into_os_string().into_vec();
     bytes.push(0); // null terminator
@@ -71,47 +126,68 @@ fn create_temp_file(runtime_dir: &Path, prefix: &str) -> std::io::Result<PathBuf
 }
 
 pub struct DaemonContext {
-    pub parent_pid: i32,
+    /// Shell to notify, if the evaluation was started on behalf of one
+    pub parent_pid: Option<i32>,
+    pub envrc_dir: PathBuf,
+    pub cache_dir: PathBuf,
+    pub runtime_dir: PathBuf,
     pub socket_path: PathBuf,
     pub env_file: PathBuf,
+    pub gen_file: PathBuf,
+    pub delta_file: PathBuf,
     pub stderr_file: PathBuf,
-    pub temp_file: PathBuf,
-    pub temp_stderr: PathBuf,
     pub multiplexer: Option<Multiplexer>,
 }
 
 impl DaemonContext {
-    pub fn new(parent_pid: i32, envrc_dir: PathBuf) -> std::io::Result<Self> {
+    pub fn new(parent_pid: Option<i32>, envrc_dir: PathBuf) -> Self {
+        let cache_dir = get_project_cache_dir(&envrc_dir);
         let runtime_dir = get_runtime_dir(&envrc_dir);
 
-        // Create runtime directory if it doesn't exist (needed for mkstemp)
-        std::fs::create_dir_all(&runtime_dir)?;
-        // Ensure owner-only permissions even if directory already exists
-        std::fs::set_permissions(&runtime_dir, PermissionsExt::from_mode(0o700))?;
-
-        let temp_file = create_temp_file(&runtime_dir, "env")?;
-        let temp_stderr = create_temp_file(&runtime_dir, "env_stderr")?;
-
-        Ok(Self {
+        Self {
             parent_pid,
+            envrc_dir,
             socket_path: runtime_dir.join("daemon.sock"),
-            env_file: runtime_dir.join("env"),
+            env_file: cache_dir.join("env"),
+            gen_file: cache_dir.join("env.gen"),
+            delta_file: cache_dir.join("env.delta"),
             stderr_file: runtime_dir.join("env.stderr"),
-            temp_file,
-            temp_stderr,
             multiplexer: Multiplexer::detect(),
-        })
+            cache_dir,
+            runtime_dir,
+        }
+    }
+}
+
+/// Output files of a single evaluation. They are only allocated once the
+/// daemon actually runs direnv and are renamed into place when it succeeds.
+pub struct TempFiles {
+    pub env: PathBuf,
+    pub stderr: PathBuf,
+}
+
+impl TempFiles {
+    pub fn create(runtime_dir: &Path) -> std::io::Result<Self> {
+        let env = create_temp_file(runtime_dir, "env")?;
+        let stderr = create_temp_file(runtime_dir, "env_stderr").inspect_err(|_| {
+            let _ = remove_file(&env);
+        })?;
+        Ok(Self { env, stderr })
+    }
+}
+
+impl Drop for TempFiles {
+    fn drop(&mut self) {
+        // Clean up temp files if they weren't renamed
+        let _ = remove_file(&self.env);
+        let _ = remove_file(&self.stderr);
     }
 }
 
 struct Cleanup<'a>(&'a DaemonContext);
 impl Drop for Cleanup<'_> {
     fn drop(&mut self) {
-        let ctx = self.0;
-        let _ = remove_file(&ctx.socket_path);
-        // Clean up temp files if they weren't renamed
-        let _ = remove_file(&ctx.temp_file);
-        let _ = remove_file(&ctx.temp_stderr);
+        let _ = remove_file(&self.0.socket_path);
     }
 }
 
@@ -127,15 +203,54 @@ pub fn stop_daemon(socket_path: &Path) {
     let _ = send_daemon_message(socket_path, "STOP\n");
 }
 
+/// Unsubscribe a shell leaving the project. Its evaluation finishes in the
+/// background to populate the cache, unless `DIRENV_INSTANT_ON_LEAVE=stop`.
+pub fn leave_daemon(socket_path: &Path, shell_pid: i32) {
+    if env::var("DIRENV_INSTANT_ON_LEAVE").is_ok_and(|v| v == "stop") {
+        stop_daemon(socket_path);
+    } else {
+        let _ = send_daemon_message(socket_path, &format!("DETACH {shell_pid}\n"));
+    }
+}
+
+/// How long an evaluation nobody waits for anymore may keep running
+fn detach_budget() -> Duration {
+    let secs = env::var("DIRENV_INSTANT_DETACH_BUDGET")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(DEFAULT_DETACH_BUDGET_SECS);
+    Duration::from_secs(secs)
+}
+
 pub fn start_daemon(direnv_cmd: &str, ctx: &DaemonContext) {
-    // Check if daemon already running
+    // Check if daemon already running, another shell may have just started it
     if ctx.socket_path.exists() {
-        if UnixStream::connect(&ctx.socket_path).is_ok() {
+        if subscribe(ctx) {
             return; // Already running
         }
         let _ = remove_file(&ctx.socket_path); // Stale socket
     }
 
+    // Bind before forking, so a STOP or DETACH right after we return isn't lost
+    let Some(listener) = bind_socket(ctx) else {
+        // Lost the race to start it, wait for the winner instead
+        subscribe(ctx);
+        return;
+    };
+    daemonize(|| serve(direnv_cmd, ctx, listener));
+}
+
+/// Subscribe our shell to a running daemon. Returns false if there is none.
+fn subscribe(ctx: &DaemonContext) -> bool {
+    match ctx.parent_pid {
+        Some(pid) => notify_daemon(&ctx.socket_path, pid),
+        None => UnixStream::connect(&ctx.socket_path).is_ok(),
+    }
+}
+
+/// Run `f` in a fully detached grandchild process; returns in the caller once
+/// the intermediate child has exited
+pub fn daemonize(f: impl FnOnce()) {
     match unsafe { fork() } {
         Ok(ForkResult::Parent { child }) => {
             let _ = waitpid(child, None);
@@ -152,7 +267,11 @@ pub fn start_daemon(direnv_cmd: &str, ctx: &DaemonContext) {
 
                     // For debugging, allow redirecting to a log file instead of /dev/null
                     if let Ok(debug_log) = env::var("DIRENV_INSTANT_DEBUG_LOG") {
-                        if let Ok(logfile) = File::create(&debug_log) {
+                        if let Ok(logfile) = OpenOptions::new()
+                            .create(true)
+                            .append(true)
+                            .open(&debug_log)
+                        {
                             dup2_stdout(&logfile).ok();
                             dup2_stderr(&logfile).ok();
                         }
@@ -161,7 +280,8 @@ pub fn start_daemon(direnv_cmd: &str, ctx: &DaemonContext) {
                         dup2_stderr(&devnull).expect("Failed to redirect stderr");
                     }
 
-                    run_direnv(direnv_cmd, ctx);
+                    f();
+                    std::process::exit(0);
                 }
                 Err(e) => {
                     eprintln!("direnv-instant: Second fork failed: {}", e);
@@ -182,73 +302,152 @@ pub fn direnv_export_command(direnv_cmd: &str) -> Command {
     cmd
 }
 
-fn handle_socket_commands(
-    listener: UnixListener,
-    notify_pids: Arc<Mutex<Vec<i32>>>,
-    should_stop: Arc<AtomicBool>,
-    pty_master: Arc<Mutex<Option<OwnedFd>>>,
-) {
-    for stream in listener.incoming().flatten() {
-        let mut reader = BufReader::new(&stream);
-        let mut line = String::new();
-        if reader.read_line(&mut line).is_ok() {
-            if let Some(stripped) = line.strip_prefix("NOTIFY ") {
-                if let Ok(pid) = stripped.trim().parse::<i32>() {
-                    notify_pids.lock().expect("Failed to lock").push(pid);
-                }
-            } else if line.starts_with("STOP") {
-                should_stop.store(true, Ordering::Relaxed);
-                break;
-            } else if line.starts_with("WATCH") {
-                // Send PTY master fd to watch command via SCM_RIGHTS
-                if let Some(ref owned_fd) = *pty_master.lock().expect("Failed to lock") {
-                    let iov = [IoSlice::new(b"OK\n")];
-                    let fds = [owned_fd.as_raw_fd()];
-                    let cmsg = ControlMessage::ScmRights(&fds);
-                    if let Err(e) =
-                        sendmsg::<()>(stream.as_raw_fd(), &iov, &[cmsg], MsgFlags::empty(), None)
-                    {
-                        eprintln!(
-                            "direnv-instant: Failed to send PTY fd to WATCH client: {}",
-                            e
-                        );
-                    }
-                } else {
-                    // PTY master not available, send error response
-                    eprintln!("direnv-instant: WATCH requested but PTY master not available");
-                    let iov = [IoSlice::new(b"ERR\n")];
-                    if let Err(e) =
-                        sendmsg::<()>(stream.as_raw_fd(), &iov, &[], MsgFlags::empty(), None)
-                    {
-                        eprintln!(
-                            "direnv-instant: Failed to send error response to WATCH client: {}",
-                            e
-                        );
-                    }
-                }
+pub fn bind_socket(ctx: &DaemonContext) -> Option<UnixListener> {
+    // Owner-only permissions, even if the directories already exist
+    let bound = [&ctx.runtime_dir, &ctx.cache_dir]
+        .into_iter()
+        .try_for_each(|dir| {
+            fs::create_dir_all(dir)?;
+            fs::set_permissions(dir, PermissionsExt::from_mode(0o700))
+        })
+        .and_then(|_| UnixListener::bind(&ctx.socket_path));
+    // Someone else may have started evaluating this project in the meantime
+    bound
+        .inspect_err(|e| {
+            if e.kind() != ErrorKind::AddrInUse {
+                eprintln!("direnv-instant: Failed to bind socket: {}", e)
             }
-        }
+        })
+        .ok()
+}
+
+pub fn run_direnv(direnv_cmd: &str, ctx: &DaemonContext) {
+    if let Some(listener) = bind_socket(ctx) {
+        serve(direnv_cmd, ctx, listener);
     }
 }
 
-fn run_direnv(direnv_cmd: &str, ctx: &DaemonContext) {
+/// Evaluate on behalf of everyone connecting to `listener`
+pub fn serve(direnv_cmd: &str, ctx: &DaemonContext, listener: UnixListener) {
     let _cleanup = Cleanup(ctx);
+    let mut temp = match TempFiles::create(&ctx.runtime_dir) {
+        Ok(temp) => temp,
+        Err(e) => {
+            eprintln!("direnv-instant: Failed to create temp files: {}", e);
+            return;
+        }
+    };
+    listener
+        .set_nonblocking(true)
+        .expect("Failed to make socket non-blocking");
+
+    // Evaluate on the env from before direnv loaded anything, so the cached
+    // env is the project's whole env for any shell, not just a change to what
+    // the shell that started us had loaded
+    let snapshot = baseline::unload(direnv_cmd);
+    if !snapshot {
+        eprintln!(
+            "direnv-instant: Failed to unload the current env, not recording freshness index"
+        );
+    }
+
+    let mut event_loop = EventLoop::new(ctx, listener);
+    // Re-evaluations in watch mode are background work, unless a shell asked for them
+    let mut foreground = ctx.parent_pid.is_some();
+    // The env our shells hold on top of ours, once we have given them one
+    let mut held = None;
+    while let Some(inputs) = evaluate(
+        direnv_cmd,
+        ctx,
+        &mut event_loop,
+        &temp,
+        foreground,
+        held.as_deref(),
+        snapshot,
+    ) {
+        let watcher = changes::enabled()
+            .then(|| ChangeWatcher::new(&inputs))
+            .flatten();
+        let Some(watcher) = watcher else {
+            event_loop.close();
+            break;
+        };
+        if !event_loop.wait_for_change(&watcher) {
+            break;
+        }
+        debug_log(&format!("re-evaluating {}", ctx.envrc_dir.display()));
+        foreground = event_loop.evaluation_requested;
+        held = std::fs::read_to_string(&ctx.env_file).ok();
+        temp = match TempFiles::create(&ctx.runtime_dir) {
+            Ok(temp) => temp,
+            Err(e) => {
+                eprintln!("direnv-instant: Failed to create temp files: {}", e);
+                return;
+            }
+        };
+    }
+}
+
+/// Run direnv once there is a free slot, in our environment with `held`, the
+/// env shells have applied, on top. Returns the files the result was derived
+/// from, or `None` if we were stopped. `snapshot` says whether our environment
+/// is the unloaded baseline, see `serve`.
+fn evaluate(
+    direnv_cmd: &str,
+    ctx: &DaemonContext,
+    event_loop: &mut EventLoop,
+    temp: &TempFiles,
+    foreground: bool,
+    held: Option<&str>,
+    snapshot: bool,
+) -> Option<Vec<PathBuf>> {
+    // Our socket is already bound, so shells asking for this project while
+    // we are queued subscribe to this evaluation instead of starting another
+    let _slot = event_loop.wait_for_slot(foreground)?;
 
-    let listener = UnixListener::bind(&ctx.socket_path).expect("Failed to bind socket");
-    let notify_pids = Arc::new(Mutex::new(vec![ctx.parent_pid]));
-    let should_stop = Arc::new(AtomicBool::new(false));
-    let pty_master: Arc<Mutex<Option<OwnedFd>>> = Arc::new(Mutex::new(None));
+    // What direnv watched last time, in case this evaluation fails before
+    // saying what it watches
+    let mut watched = freshness::watched(&ctx.cache_dir);
+    if watched.is_empty() {
+        watched = failures::watched(&ctx.cache_dir);
+    }
 
-    let notify_clone = notify_pids.clone();
-    let stop_clone = should_stop.clone();
-    let pty_clone = pty_master.clone();
-    thread::spawn(move || handle_socket_commands(listener, notify_clone, stop_clone, pty_clone));
+    // The cached env is stale from the moment a new evaluation starts
+    freshness::invalidate(&ctx.cache_dir);
+    let eval_started = SystemTime::now();
+    let failure_key = failures::key(&ctx.envrc_dir);
+    let cgroup = EvalCgroup::create();
 
     match unsafe { forkpty(Some(&PTY_WINSIZE), None) } {
-        Ok(ForkptyResult::Parent { child, master }) => {
-            parent_process(child, master, notify_pids, ctx, should_stop, pty_master)
+        Ok(ForkptyResult::Parent { child, master }) => parent_process(
+            direnv_cmd,
+            &EvalProcess {
+                pid: child,
+                cgroup,
+                failure_key,
+                watched,
+                held: held.map(str::to_string),
+                snapshot,
+            },
+            master,
+            event_loop,
+            ctx,
+            temp,
+            eval_started,
+        ),
+        Ok(ForkptyResult::Child) => {
+            if let Some(cgroup) = &cgroup {
+                cgroup.enter();
+            }
+            let mut command = direnv_export_command(direnv_cmd);
+            for statement in held.map(exports::parse).unwrap_or_default() {
+                match statement.value {
+                    Some(value) => command.env(statement.key, value),
+                    None => command.env_remove(statement.key),
+                };
+            }
+            child_process(command, &temp.env)
         }
-        Ok(ForkptyResult::Child) => child_process(direnv_cmd, &ctx.temp_file),
         Err(e) => {
             eprintln!("direnv-instant: forkpty failed: {}", e);
             std::process::exit(1);
@@ -256,9 +455,8 @@ fn run_direnv(direnv_cmd: &str, ctx: &DaemonContext) {
     }
 }
 
-fn child_process(direnv_cmd: &str, temp_file: &Path) -> ! {
-    let mut command = direnv_export_command(direnv_cmd);
-
+/// Run `command`, direnv's export, in the forkpty child with its stdout going to `temp_file`
+pub fn child_process(mut command: Command, temp_file: &Path) -> ! {
     // Set up stdout redirection - if this fails, write error to stderr (PTY)
     let stdout_file = match File::create(temp_file) {
         Ok(f) => f,
@@ -275,7 +473,11 @@ fn child_process(direnv_cmd: &str, temp_file: &Path) -> ! {
     let status = match command.status() {
         Ok(s) => s,
         Err(e) => {
-            eprintln!("direnv-instant: Failed to execute {}: {}", direnv_cmd, e);
+            eprintln!(
+                "direnv-instant: Failed to execute {}: {}",
+                command.get_program().to_string_lossy(),
+                e
+            );
             std::process::exit(1);
         }
     };
@@ -283,119 +485,749 @@ fn child_process(direnv_cmd: &str, temp_file: &Path) -> ! {
     std::process::exit(status.code().unwrap_or(1));
 }
 
-fn copy_pty_to_logfile(
-    master: &OwnedFd,
-    log_file: &mut File,
-    should_stop: &Arc<AtomicBool>,
-    ctx: &DaemonContext,
-) -> bool {
-    use std::time::Instant;
+/// How long a watched file has to stay untouched before we re-evaluate
+const SETTLE_DELAY: Duration = Duration::from_millis(300);
+/// How often an idle daemon checks whether its shells are still around
+const SHELL_CHECK_INTERVAL: Duration = Duration::from_secs(60);
+/// How long a cancelled evaluation gets to exit on SIGTERM
+const TEARDOWN_GRACE: Duration = Duration::from_secs(2);
+/// How long we wait for SIGKILLed processes to go away before giving up
+const TEARDOWN_KILL_WAIT: Duration = Duration::from_secs(1);
+const TEARDOWN_POLL: Duration = Duration::from_millis(10);
+/// How long detached evaluations may run by default
+const DEFAULT_DETACH_BUDGET_SECS: u64 = 10 * 60;
+/// How often a queued evaluation checks for a free slot without inotify
+const SLOT_RETRY: Duration = Duration::from_millis(50);
+/// How often it checks anyway, for daemons that died holding a slot without
+/// waking anyone
+const SLOT_RECHECK: Duration = Duration::from_secs(1);
+/// How long a control socket client gets to send its request
+const CLIENT_TIMEOUT: Duration = Duration::from_secs(1);
+/// Longer requests are not ours
+const MAX_REQUEST_LEN: usize = 4096;
+
+/// A control socket connection that hasn't sent a complete request yet
+struct Client {
+    stream: UnixStream,
+    request: Vec<u8>,
+    deadline: Instant,
+}
+
+/// A `watch` client streaming our output. Its connection also tells it when we're done.
+struct Watcher {
+    stream: UnixStream,
+    /// Output it couldn't take yet
+    pending: Vec<u8>,
+}
+
+impl Watcher {
+    /// Write as much pending output as the socket takes. Returns false once
+    /// the watcher is gone or has fallen a buffer's worth behind its replay.
+    fn flush(&mut self) -> bool {
+        while !self.pending.is_empty() {
+            match self.stream.write(&self.pending) {
+                Ok(n) => {
+                    self.pending.drain(..n);
+                }
+                Err(e) if e.kind() == ErrorKind::WouldBlock => break,
+                Err(e) if e.kind() == ErrorKind::Interrupted => {}
+                Err(_) => return false,
+            }
+        }
+        self.pending.len() <= 2 * OUTPUT_CAPACITY
+    }
+}
+
+enum Outcome {
+    Completed,
+    Stopped,
+}
 
-    let mux_delay_ms = mux::mux_delay_ms();
+/// Which of the daemon's own fds poll() found ready
+#[derive(Default)]
+struct Ready {
+    pty: bool,
+    other: bool,
+}
 
-    let mut buf = [0u8; 8192];
-    let mut total_bytes = 0;
-    let mut mux_spawned = false;
-    let start = Instant::now();
+/// The daemon's single event loop: buffers direnv's PTY output and streams
+/// it to watchers, serves control socket clients and spawns the multiplexer pane once the
+/// delay expires. Sleeps in poll() until one of those needs attention.
+struct EventLoop<'a> {
+    ctx: &'a DaemonContext,
+    /// PTY of the running evaluation
+    master: Option<OwnedFd>,
+    listener: UnixListener,
+    clients: Vec<Client>,
+    watchers: Vec<Watcher>,
+    subscribers: Subscribers,
+    /// A shell subscribed since the last evaluation, its cached env is stale
+    evaluation_requested: bool,
+    /// When we give up, once every shell has left
+    detach_deadline: Option<Instant>,
+    output: OutputBuffer,
+}
 
-    loop {
-        if should_stop.load(Ordering::Relaxed) {
-            return false;
+impl<'a> EventLoop<'a> {
+    fn new(ctx: &'a DaemonContext, listener: UnixListener) -> Self {
+        let mut subscribers = Subscribers::default();
+        if let Some(pid) = ctx.parent_pid {
+            subscribers.add(pid);
         }
+        Self {
+            ctx,
+            master: None,
+            listener,
+            clients: Vec::new(),
+            watchers: Vec::new(),
+            subscribers,
+            evaluation_requested: false,
+            detach_deadline: None,
+            output: OutputBuffer::new(OUTPUT_CAPACITY),
+        }
+    }
+
+    fn run(&mut self) -> Outcome {
+        let started = Instant::now();
+        let predicted = history::predict(&self.ctx.cache_dir);
+        let mux_deadline = started + mux::pane_delay(predicted);
+        let project = Some(self.ctx.envrc_dir.as_path());
+        let mut mux_pending = self.ctx.multiplexer.is_some();
+        let mut buf = [0u8; 8192];
+
+        loop {
+            let now = Instant::now();
+            if self.detach_deadline.is_some_and(|d| now >= d) {
+                debug_log("detached evaluation ran out of time");
+                return Outcome::Stopped;
+            }
+            if mux_pending
+                && !self.output.is_empty()
+                && now >= mux_deadline
+                && let Some(multiplexer) = self.ctx.multiplexer
+            {
+                let spawn_started = Instant::now();
+                let _ = multiplexer.spawn(self.ctx);
+                stats::record("mux_spawn", project, spawn_started.elapsed());
+                mux_pending = false;
+            }
+
+            // Until the delay expires the timer is one more deadline to wake up for;
+            // after that the pane is spawned as soon as there is output to show
+            let mut deadline = self
+                .clients
+                .iter()
+                .map(|c| c.deadline)
+                .chain(self.detach_deadline)
+                .min();
+            if mux_pending && now < mux_deadline {
+                deadline = Some(deadline.map_or(mux_deadline, |d| d.min(mux_deadline)));
+            }
+            let timeout = deadline.map_or(PollTimeout::NONE, |d| {
+                // Round up so we don't wake up just before the deadline
+                PollTimeout::try_from(d - now + Duration::from_micros(999))
+                    .unwrap_or(PollTimeout::MAX)
+            });
 
-        let mut fds = FdSet::new();
-        fds.insert(master.as_fd());
-        let mut timeout = TimeVal::milliseconds(100);
+            let pty_ready = match self.poll_once(timeout, None) {
+                Ok(Some(ready)) => ready.pty,
+                Ok(None) => return Outcome::Stopped,
+                Err(Errno::EINTR) => continue,
+                Err(e) => {
+                    eprintln!("direnv-instant: poll error: {}", e);
+                    return Outcome::Completed;
+                }
+            };
+            if !pty_ready {
+                continue;
+            }
 
-        match select(None, Some(&mut fds), None, None, Some(&mut timeout)) {
-            Ok(_) if fds.contains(master.as_fd()) => match read(master, &mut buf) {
-                Ok(0) | Err(Errno::EIO) => return true,
+            let Some(master) = &self.master else {
+                return Outcome::Completed;
+            };
+            match read(master, &mut buf) {
+                Ok(0) | Err(Errno::EIO) => return Outcome::Completed,
                 Ok(n) => {
-                    total_bytes += n;
-                    let _ = log_file.write_all(&buf[..n]);
-                    let _ = log_file.flush();
+                    if self.output.is_empty() {
+                        stats::record("first_output", project, started.elapsed());
+                    }
+                    self.output.push(&buf[..n]);
+                    self.watchers.retain_mut(|watcher| {
+                        watcher.pending.extend_from_slice(&buf[..n]);
+                        watcher.flush()
+                    });
                 }
+                Err(Errno::EAGAIN | Errno::EINTR) => {}
                 Err(e) => {
                     eprintln!("direnv-instant: PTY read error: {}", e);
-                    return true;
+                    return Outcome::Completed;
                 }
-            },
-            Err(e) => {
-                eprintln!("direnv-instant: PTY select error: {}", e);
+            }
+        }
+    }
+
+    /// Serve the control socket until one of the env's inputs has settled after
+    /// a change, or a shell finds its cached env stale. Returns false once we
+    /// are stopped or none of our shells is left.
+    fn wait_for_change(&mut self, changes: &ChangeWatcher) -> bool {
+        self.evaluation_requested = false;
+        let mut settle_deadline = None;
+        let mut shell_check = Instant::now();
+
+        loop {
+            let now = Instant::now();
+            if self.evaluation_requested || settle_deadline.is_some_and(|d| now >= d) {
                 return true;
             }
-            _ => {
-                // Timeout elapsed, check if we should spawn the multiplexer
-                let elapsed_ms = start.elapsed().as_millis() as u64;
-                if !mux_spawned
-                    && elapsed_ms >= mux_delay_ms
-                    && total_bytes > 0
-                    && let Some(multiplexer) = ctx.multiplexer
-                {
-                    let _ = multiplexer.spawn(ctx);
-                    mux_spawned = true;
+            if now >= shell_check {
+                self.subscribers.forget_exited();
+                shell_check = now + SHELL_CHECK_INTERVAL;
+            }
+            if self.subscribers.is_empty() {
+                return false;
+            }
+
+            let deadline = self
+                .clients
+                .iter()
+                .map(|c| c.deadline)
+                .chain(settle_deadline)
+                .fold(shell_check, Instant::min);
+            let timeout = PollTimeout::try_from(deadline - now + Duration::from_micros(999))
+                .unwrap_or(PollTimeout::MAX);
+
+            match self.poll_once(timeout, Some(changes.as_fd())) {
+                Ok(Some(ready)) => {
+                    if ready.other && changes.changed() {
+                        settle_deadline = Some(Instant::now() + SETTLE_DELAY);
+                    }
                 }
-                continue;
+                Ok(None) => return false,
+                Err(Errno::EINTR) => {}
+                Err(e) => {
+                    eprintln!("direnv-instant: poll error: {}", e);
+                    return false;
+                }
+            }
+        }
+    }
+
+    /// Serve the control socket until an evaluation slot is free and it is
+    /// our turn. A shell subscribing while we wait makes us foreground work,
+    /// which goes ahead of background work. Returns `None` if we were stopped
+    /// or our detached budget ran out.
+    fn wait_for_slot(&mut self, foreground: bool) -> Option<Slot> {
+        let Some(max_jobs) = scheduler::max_jobs() else {
+            return Some(Slot::unlimited());
+        };
+        // Watch before getting in line, so no slot freed in between is missed
+        let notifier = scheduler::notifier();
+        let Some(mut ticket) = Ticket::new(foreground) else {
+            return Some(Slot::unlimited());
+        };
+        let mut buf = [0u8; 4096];
+        let mut queued = false;
+        loop {
+            // Shells that left don't wait for us anymore
+            ticket.set_foreground(
+                (foreground || self.evaluation_requested) && self.detach_deadline.is_none(),
+            );
+            if let Some(slot) = ticket.try_acquire(max_jobs) {
+                return Some(slot);
+            }
+            let now = Instant::now();
+            if self.detach_deadline.is_some_and(|d| now >= d) {
+                return None;
+            }
+            if !queued {
+                queued = true;
+                debug_log(&format!(
+                    "{} waits for an evaluation slot",
+                    self.ctx.envrc_dir.display()
+                ));
+            }
+
+            let recheck = now
+                + if notifier.is_some() {
+                    SLOT_RECHECK
+                } else {
+                    SLOT_RETRY
+                };
+            let deadline = self
+                .clients
+                .iter()
+                .map(|c| c.deadline)
+                .chain(self.detach_deadline)
+                .fold(recheck, Instant::min);
+            let timeout = PollTimeout::try_from(deadline - now + Duration::from_micros(999))
+                .unwrap_or(PollTimeout::MAX);
+            match self.poll_once(timeout, notifier.as_ref().map(|n| n.as_fd())) {
+                Ok(Some(ready)) => {
+                    if ready.other
+                        && let Some(notifier) = &notifier
+                    {
+                        while matches!(read(notifier, &mut buf), Ok(n) if n > 0) {}
+                    }
+                }
+                Ok(None) => return None,
+                Err(Errno::EINTR) => {}
+                Err(e) => {
+                    eprintln!("direnv-instant: poll error: {}", e);
+                    return None;
+                }
+            }
+        }
+    }
+
+    /// Wait up to `timeout` for activity and serve the control socket.
+    /// Returns which of the PTY and `other` are readable, or `None` if a client sent STOP.
+    fn poll_once(
+        &mut self,
+        timeout: PollTimeout,
+        other: Option<BorrowedFd<'_>>,
+    ) -> nix::Result<Option<Ready>> {
+        let now = Instant::now();
+        self.clients.retain(|c| c.deadline > now);
+
+        // The listener comes first, then whichever of the PTY and `other` we
+        // have, then the subscribed shells' pidfds
+        let mut pty_index = None;
+        let mut other_index = None;
+        let mut pidfd_count = 0;
+        let ready: Vec<bool> = {
+            let mut fds = Vec::with_capacity(
+                self.clients.len() + self.watchers.len() + self.subscribers.len() + 3,
+            );
+            fds.push(PollFd::new(self.listener.as_fd(), PollFlags::POLLIN));
+            if let Some(master) = &self.master {
+                pty_index = Some(fds.len());
+                fds.push(PollFd::new(master.as_fd(), PollFlags::POLLIN));
+            }
+            if let Some(other) = other {
+                other_index = Some(fds.len());
+                fds.push(PollFd::new(other, PollFlags::POLLIN));
+            }
+            for pidfd in self.subscribers.pidfds() {
+                fds.push(PollFd::new(pidfd, PollFlags::POLLIN));
+                pidfd_count += 1;
+            }
+            for client in &self.clients {
+                fds.push(PollFd::new(client.stream.as_fd(), PollFlags::POLLIN));
+            }
+            for watcher in &self.watchers {
+                // Only wake up for watchers that have output waiting
+                let events = if watcher.pending.is_empty() {
+                    PollFlags::empty()
+                } else {
+                    PollFlags::POLLOUT
+                };
+                fds.push(PollFd::new(watcher.stream.as_fd(), events));
+            }
+            poll(&mut fds, timeout)?;
+            fds.iter()
+                .map(|fd| fd.revents().is_some_and(|r| !r.is_empty()))
+                .collect()
+        };
+        let own = Ready {
+            pty: pty_index.is_some_and(|i| ready[i]),
+            other: other_index.is_some_and(|i| ready[i]),
+        };
+        let first_pidfd = 1 + usize::from(pty_index.is_some()) + usize::from(other_index.is_some());
+        let (ready_pidfds, rest) = ready[first_pidfd..].split_at(pidfd_count);
+        let (ready_clients, ready_watchers) = rest.split_at(self.clients.len());
+        if ready_pidfds.contains(&true) && self.subscribers.forget_exited() {
+            self.unsubscribed();
+        }
+
+        let mut ready_watchers = ready_watchers.iter();
+        self.watchers
+            .retain_mut(|watcher| !ready_watchers.next().is_some_and(|r| *r) || watcher.flush());
+
+        let mut readable = Vec::new();
+        for (client, ready) in std::mem::take(&mut self.clients)
+            .into_iter()
+            .zip(ready_clients)
+        {
+            if *ready {
+                readable.push(client);
+            } else {
+                self.clients.push(client);
+            }
+        }
+        if ready[0] {
+            // Requests usually arrive together with the connection, try them right away
+            readable.extend(self.accept_clients());
+        }
+
+        let mut stopped = false;
+        for client in readable {
+            stopped |= self.read_request(client);
+        }
+        Ok((!stopped).then_some(own))
+    }
+
+    fn accept_clients(&mut self) -> Vec<Client> {
+        let mut accepted = Vec::new();
+        loop {
+            match self.listener.accept() {
+                Ok((stream, _)) => {
+                    if stream.set_nonblocking(true).is_ok() {
+                        accepted.push(Client {
+                            stream,
+                            request: Vec::new(),
+                            deadline: Instant::now() + CLIENT_TIMEOUT,
+                        });
+                    }
+                }
+                Err(e) if e.kind() == ErrorKind::WouldBlock => break,
+                Err(e) => {
+                    eprintln!("direnv-instant: accept failed: {}", e);
+                    break;
+                }
+            }
+        }
+        accepted
+    }
+
+    /// Read what the client sent so far and handle its request once complete.
+    /// Returns true if it asked us to stop.
+    fn read_request(&mut self, mut client: Client) -> bool {
+        let mut buf = [0u8; 512];
+        loop {
+            match client.stream.read(&mut buf) {
+                // A request without trailing newline is complete at EOF
+                Ok(0) => return self.handle_request(client.stream, &client.request),
+                Ok(n) => {
+                    client.request.extend_from_slice(&buf[..n]);
+                    if let Some(end) = client.request.iter().position(|&b| b == b'\n') {
+                        return self.handle_request(client.stream, &client.request[..end]);
+                    }
+                    if client.request.len() > MAX_REQUEST_LEN {
+                        return false;
+                    }
+                }
+                Err(e) if e.kind() == ErrorKind::WouldBlock => {
+                    self.clients.push(client);
+                    return false;
+                }
+                Err(e) if e.kind() == ErrorKind::Interrupted => {}
+                Err(_) => return false,
+            }
+        }
+    }
+
+    fn handle_request(&mut self, stream: UnixStream, request: &[u8]) -> bool {
+        let line = String::from_utf8_lossy(request);
+        if let Some(pid) = line.strip_prefix("NOTIFY ") {
+            if let Ok(pid) = pid.trim().parse::<i32>() {
+                self.subscribers.add(pid);
+                self.evaluation_requested = true;
+                self.detach_deadline = None;
+            }
+        } else if let Some(pid) = line.strip_prefix("DETACH ") {
+            if let Ok(pid) = pid.trim().parse::<i32>() {
+                self.subscribers.remove(pid);
+                self.unsubscribed();
+            }
+        } else if line.starts_with("STOP") {
+            return true;
+        } else if line.starts_with("STATUS") {
+            reply(stream, &format!("subscribers {}\n", self.subscribers.len()));
+        } else if line.starts_with("WATCH") {
+            if let Some(master) = &self.master {
+                send_pty_master(&stream, master);
             }
+        } else if line.starts_with("STREAM") {
+            // Replay what the late watcher missed, then keep it posted
+            let mut watcher = Watcher {
+                stream,
+                pending: self.output.replay(),
+            };
+            if watcher.flush() {
+                self.watchers.push(watcher);
+            }
+            if self.master.is_none() {
+                // Between evaluations there is nothing more to follow
+                self.finish_watchers();
+            }
+        }
+        false
+    }
+
+    /// Once every shell has left or exited, the evaluation is on a budget
+    fn unsubscribed(&mut self) {
+        if self.subscribers.is_empty() && self.detach_deadline.is_none() {
+            self.detach_deadline = Some(Instant::now() + detach_budget());
+        }
+    }
+
+    /// Stop taking requests before we exit. Shells whose NOTIFY was already
+    /// on its way rely on us to signal them, so serve those first.
+    fn close(&mut self) {
+        let _ = remove_file(&self.ctx.socket_path);
+        loop {
+            let now = Instant::now();
+            let timeout =
+                self.clients
+                    .iter()
+                    .map(|c| c.deadline)
+                    .min()
+                    .map_or(PollTimeout::ZERO, |d| {
+                        PollTimeout::try_from(d.saturating_duration_since(now))
+                            .unwrap_or(PollTimeout::MAX)
+                    });
+            match self.poll_once(timeout, None) {
+                Ok(Some(_)) | Err(Errno::EINTR) if !self.clients.is_empty() => {}
+                _ => break,
+            }
+        }
+        self.subscribers.notify_pending();
+    }
+
+    /// Hand the remaining output to the watchers before we exit and close their connections
+    fn finish_watchers(&mut self) {
+        for mut watcher in self.watchers.drain(..) {
+            let _ = watcher.stream.set_nonblocking(false);
+            let _ = watcher.stream.set_write_timeout(Some(CLIENT_TIMEOUT));
+            let _ = watcher.stream.write_all(&watcher.pending);
+        }
+    }
+}
+
+/// Answer a control socket client
+fn reply(mut stream: UnixStream, response: &str) {
+    let _ = stream.set_nonblocking(false);
+    let _ = stream.set_write_timeout(Some(CLIENT_TIMEOUT));
+    let _ = stream.write_all(response.as_bytes());
+}
+
+/// Send the PTY master fd to a `watch` client via SCM_RIGHTS
+fn send_pty_master(stream: &UnixStream, master: &OwnedFd) {
+    let iov = [IoSlice::new(b"OK\n")];
+    let fds = [master.as_raw_fd()];
+    let cmsg = ControlMessage::ScmRights(&fds);
+    if let Err(e) = sendmsg::<()>(stream.as_raw_fd(), &iov, &[cmsg], MsgFlags::empty(), None) {
+        eprintln!(
+            "direnv-instant: Failed to send PTY fd to WATCH client: {}",
+            e
+        );
+    }
+}
+
+/// The forkpty child running direnv. It leads a session and process group of
+/// its own, which everything the evaluation starts inherits.
+struct EvalProcess {
+    pid: Pid,
+    cgroup: Option<EvalCgroup>,
+    /// The inputs it started from, for remembering that direnv failed on them
+    failure_key: Option<String>,
+    /// The files direnv watched the last time
+    watched: Vec<PathBuf>,
+    /// The env it ran on top of ours, see `evaluate`
+    held: Option<String>,
+    /// Whether it ran on the unloaded baseline, so its output is the whole env
+    snapshot: bool,
+}
+
+impl EvalProcess {
+    /// Cancel the evaluation: SIGTERM its process group, and SIGKILL whatever
+    /// is left of it and its cgroup after a grace period
+    fn terminate(&self) {
+        let started = Instant::now();
+        let _ = killpg(self.pid, Signal::SIGTERM);
+        let mut killed = false;
+        loop {
+            // Reap our child so its zombie doesn't count as alive
+            let _ = waitpid(self.pid, Some(WaitPidFlag::WNOHANG));
+            let alive = killpg(self.pid, None).is_ok()
+                || self.cgroup.as_ref().is_some_and(EvalCgroup::populated);
+            let elapsed = started.elapsed();
+            if !alive || elapsed >= TEARDOWN_GRACE + TEARDOWN_KILL_WAIT {
+                break;
+            }
+            if !killed && elapsed >= TEARDOWN_GRACE {
+                let _ = killpg(self.pid, Signal::SIGKILL);
+                if let Some(cgroup) = &self.cgroup {
+                    cgroup.kill();
+                }
+                killed = true;
+            }
+            std::thread::sleep(TEARDOWN_POLL);
         }
+        debug_log(&format!(
+            "cancelled evaluation, teardown took {}ms{}",
+            started.elapsed().as_millis(),
+            if killed { " (SIGKILL needed)" } else { "" }
+        ));
     }
 }
 
 fn parent_process(
-    child: Pid,
+    direnv_cmd: &str,
+    child: &EvalProcess,
     master: OwnedFd,
-    notify_pids: Arc<Mutex<Vec<i32>>>,
+    event_loop: &mut EventLoop,
     ctx: &DaemonContext,
-    should_stop: Arc<AtomicBool>,
-    pty_master: Arc<Mutex<Option<OwnedFd>>>,
-) {
-    // Store PTY master fd for WATCH command (duplicate it to keep it alive)
-    *pty_master.lock().expect("Failed to lock") = master.try_clone().ok();
-
-    // Create temp stderr file for writing direnv PTY output
-    let mut log_file = match File::create(&ctx.temp_stderr) {
-        Ok(f) => f,
-        Err(e) => {
-            eprintln!("direnv-instant: Failed to create stderr log file: {}", e);
-            let _ = kill(child, Signal::SIGTERM);
-            std::process::exit(1);
-        }
-    };
-
-    let completed = copy_pty_to_logfile(&master, &mut log_file, &should_stop, &ctx);
-    if !completed {
-        let _ = kill(child, Signal::SIGTERM);
-        return;
+    temp: &TempFiles,
+    eval_started: SystemTime,
+) -> Option<Vec<PathBuf>> {
+    event_loop.output = OutputBuffer::new(OUTPUT_CAPACITY);
+    event_loop.master = Some(master);
+    let outcome = event_loop.run();
+    event_loop.master = None;
+    if let Outcome::Stopped = outcome {
+        // We are gone as far as shells are concerned, they needn't wait for the teardown
+        let _ = remove_file(&ctx.socket_path);
+        child.terminate();
+        return None;
     }
 
     let success = matches!(
-        waitpid(child, Some(WaitPidFlag::empty())),
+        waitpid(child.pid, Some(WaitPidFlag::empty())),
         Ok(WaitStatus::Exited(_, 0))
     );
+    let exited = Instant::now();
+    let project = Some(ctx.envrc_dir.as_path());
+    if let Ok(duration) = eval_started.elapsed() {
+        stats::record("eval", project, duration);
+    }
 
-    // Check if stderr file has actual content (not just empty file we created)
-    let has_stderr = ctx
-        .temp_stderr
-        .metadata()
-        .map(|m| m.len() > 0)
-        .unwrap_or(false);
+    // The output only goes to disk now, capped for the shell to display
+    let shell_log = event_loop.output.shell_log(StderrMode::from_env(), success);
+    match &child.failure_key {
+        _ if success => failures::clear(&ctx.cache_dir),
+        Some(key) => {
+            // A failure is retried once any of the files direnv watches change
+            let watched = std::fs::read_to_string(&temp.env)
+                .ok()
+                .and_then(|script| freshness::watched_paths(direnv_cmd, &script))
+                .unwrap_or_else(|| child.watched.clone());
+            failures::record(&ctx.cache_dir, key, &watched, &shell_log)
+        }
+        None => {}
+    }
+    let has_stderr = !shell_log.is_empty() && std::fs::write(&temp.stderr, shell_log).is_ok();
 
     if has_stderr {
-        let _ = std::fs::rename(&ctx.temp_stderr, &ctx.stderr_file);
+        let _ = std::fs::rename(&temp.stderr, &ctx.stderr_file);
     }
     // Otherwise Cleanup Drop will remove it
 
-    // Only rename env file on success
-    let has_env = success && ctx.temp_file.exists();
-    if has_env {
-        let _ = std::fs::rename(&ctx.temp_file, &ctx.env_file);
+    // Only cache the env on success. It is written next to the cache rather
+    // than renamed, as the temp file lives on the runtime dir's filesystem.
+    // direnv's output is relative to the env it ran in, which for a
+    // re-evaluation has the held env on top of ours, so fold that back in.
+    let export_script = success
+        .then(|| std::fs::read_to_string(&temp.env).ok())
+        .flatten()
+        .and_then(|output| match &child.held {
+            Some(held) => exports::compose(held, &output),
+            None => Some(output),
+        });
+    let has_env = export_script.is_some();
+    let mut inputs = vec![ctx.envrc_dir.join(".envrc")];
+    if let Some(export_script) = export_script {
+        let previous = std::fs::read_to_string(&ctx.env_file).ok();
+        let store_started = Instant::now();
+        write_atomically(&ctx.env_file, &export_script);
+        stats::record("store_env", project, store_started.elapsed());
+        write_delta(ctx, previous.as_deref(), &export_script);
+        write_generation(ctx, &export_script);
+        inputs = record_watches(
+            direnv_cmd,
+            ctx,
+            &export_script,
+            eval_started,
+            child.snapshot,
+        );
+        if let Ok(duration) = eval_started.elapsed() {
+            let _ = history::record(&ctx.cache_dir, duration);
+        }
     }
     // Otherwise Cleanup Drop will remove it
 
+    // Pick up shells that subscribed while we were wrapping up
+    let _ = event_loop.poll_once(PollTimeout::ZERO, None);
+
     // Notify shells if we have anything to show
     if has_stderr || has_env {
-        for pid in notify_pids.lock().expect("Failed to lock").iter() {
-            let _ = kill(Pid::from_raw(*pid), Signal::SIGUSR1);
+        event_loop.subscribers.notify_all();
+        stats::record("notify", project, exited.elapsed());
+    }
+
+    event_loop.finish_watchers();
+    Some(inputs)
+}
+
+fn generation(export_script: &str) -> String {
+    let mut hasher = DefaultHasher::new();
+    export_script.hash(&mut hasher);
+    format!("{:x}", hasher.finish())
+}
+
+/// Replace `path` atomically so the hooks never read a partial file
+fn write_atomically(path: &Path, content: &str) {
+    let mut tmp = path.as_os_str().to_owned();
+    tmp.push(format!(".{}.tmp", std::process::id()));
+    let tmp = PathBuf::from(tmp);
+    if std::fs::write(&tmp, content).is_err() || std::fs::rename(&tmp, path).is_err() {
+        let _ = remove_file(&tmp);
+        let _ = remove_file(path);
+    }
+}
+
+/// Stamp the env file with a hash of its content, so the hooks can skip
+/// re-evaluating an env they have already applied. Written after the env file
+/// is in place: a shell racing with us at worst applies the new env twice.
+fn write_generation(ctx: &DaemonContext, export_script: &str) {
+    write_atomically(&ctx.gen_file, &format!("{}\n", generation(export_script)));
+}
+
+/// Write just the statements that changed since the previous env, headed by
+/// `# <from> <to>` generations. Shells that applied `<from>` evaluate this
+/// instead of the whole env file.
+fn write_delta(ctx: &DaemonContext, previous: Option<&str>, export_script: &str) {
+    let delta = previous.and_then(|previous| {
+        let statements = exports::delta(previous, export_script, |key| env::var(key).ok())?;
+        Some(format!(
+            "# {} {}\n{}",
+            generation(previous),
+            generation(export_script),
+            statements
+        ))
+    });
+    match delta {
+        Some(delta) => write_atomically(&ctx.delta_file, &delta),
+        None => {
+            let _ = remove_file(&ctx.delta_file);
         }
     }
 }
+
+/// Remember what the new env was derived from so `start` can skip re-running
+/// direnv while none of it changes. Returns those files.
+///
+/// Only a `snapshot`, the whole env rather than a change to what some shell
+/// had loaded, is recorded: anything else would be handed to new shells as
+/// their complete env.
+fn record_watches(
+    direnv_cmd: &str,
+    ctx: &DaemonContext,
+    export_script: &str,
+    eval_started: SystemTime,
+    snapshot: bool,
+) -> Vec<PathBuf> {
+    let envrc = ctx.envrc_dir.join(".envrc");
+    let Some(mut paths) = freshness::watched_paths(direnv_cmd, export_script) else {
+        return vec![envrc];
+    };
+    paths.push(envrc);
+
+    if !snapshot {
+        return paths;
+    }
+    if let Err(e) = freshness::record(&ctx.cache_dir, &paths, eval_started) {
+        eprintln!("direnv-instant: Not recording freshness index: {}", e);
+    }
+    paths
+}
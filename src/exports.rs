@@ -0,0 +1,225 @@
+use std::collections::HashMap;
+
+/// A single `export KEY=VALUE;` or `unset KEY;` statement from `direnv export zsh` output
+pub struct Statement<'a> {
+    pub key: &'a str,
+    /// Decoded value, `None` for `unset`
+    pub value: Option<String>,
+    /// The statement as it appears in the script
+    pub raw: &'a str,
+}
+
+/// Split a direnv export script into its statements.
+///
+/// Only understands the subset of shell that direnv emits: `export` and `unset`
+/// with bare, '...', "..." or $'...' quoted values. Anything else is skipped.
+pub fn parse(script: &str) -> Vec<Statement<'_>> {
+    split(script).filter_map(parse_statement).collect()
+}
+
+/// Look up the value a script exports for `key`, if any
+pub fn exported_value(script: &str, key: &str) -> Option<String> {
+    parse(script)
+        .into_iter()
+        .rev()
+        .find(|s| s.key == key)
+        .and_then(|s| s.value)
+}
+
+/// The statements of `new` a shell that already evaluated `old` still has to
+/// evaluate to end up with the same environment as evaluating `new` in full.
+/// Keys `old` set that `new` leaves alone are set back to their value in
+/// `base`, the environment `new` was produced in, or unset if it has none.
+///
+/// Returns `None` if either script contains something we don't understand.
+pub fn delta(old: &str, new: &str, base: impl Fn(&str) -> Option<String>) -> Option<String> {
+    let old_statements = parse_all(old)?;
+    let new_statements = parse_all(new)?;
+    let old = last_by_key(&old_statements);
+    let new = last_by_key(&new_statements);
+
+    let mut out = String::new();
+    for statement in &old_statements {
+        if new.contains_key(statement.key) || old[statement.key] != statement.raw {
+            continue;
+        }
+        match base(statement.key) {
+            Some(value) => out.push_str(&format!("export {}={};\n", statement.key, quote(&value))),
+            None => out.push_str(&format!("unset {};\n", statement.key)),
+        }
+    }
+    for statement in &new_statements {
+        // Keep only the last assignment of each changed key
+        if new[statement.key] == statement.raw && old.get(statement.key) != Some(&statement.raw) {
+            out.push_str(statement.raw);
+            out.push('\n');
+        }
+    }
+    Some(out)
+}
+
+/// The script that has the same effect as evaluating `first` and then `second`
+///
+/// Returns `None` if either script contains something we don't understand.
+pub fn compose(first: &str, second: &str) -> Option<String> {
+    let first = parse_all(first)?;
+    let second = parse_all(second)?;
+    let later = last_by_key(&second);
+
+    let mut out = String::new();
+    for statement in first.iter().filter(|s| !later.contains_key(s.key)) {
+        out.push_str(statement.raw);
+        out.push('\n');
+    }
+    for statement in &second {
+        out.push_str(statement.raw);
+        out.push('\n');
+    }
+    Some(out)
+}
+
+/// All statements of a script, or `None` if it contains anything else
+fn parse_all(script: &str) -> Option<Vec<Statement<'_>>> {
+    split(script).map(parse_statement).collect()
+}
+
+/// The last statement for each key
+fn last_by_key<'a>(statements: &[Statement<'a>]) -> HashMap<&'a str, &'a str> {
+    statements.iter().map(|s| (s.key, s.raw)).collect()
+}
+
+/// Quote `value` for the shell, the way it reads back with `unquote`
+fn quote(value: &str) -> String {
+    format!("'{}'", value.replace('\'', r"'\''"))
+}
+
+/// Raw, non-empty statements of a script
+fn split(script: &str) -> impl Iterator<Item = &str> {
+    let bytes = script.as_bytes();
+    let mut pos = 0;
+
+    std::iter::from_fn(move || {
+        while pos < bytes.len() && (bytes[pos].is_ascii_whitespace() || bytes[pos] == b';') {
+            pos += 1;
+        }
+        if pos >= bytes.len() {
+            return None;
+        }
+        let start = pos;
+        pos = statement_end(bytes, pos).min(bytes.len());
+        Some(script[start..pos].trim_end())
+    })
+}
+
+fn parse_statement(raw: &str) -> Option<Statement<'_>> {
+    let body = raw.trim_end_matches(';');
+    if let Some(key) = body.strip_prefix("unset ") {
+        return Some(Statement {
+            key: key.trim(),
+            value: None,
+            raw,
+        });
+    }
+    let (key, value) = body.strip_prefix("export ")?.split_once('=')?;
+    Some(Statement {
+        key: key.trim(),
+        value: Some(unquote(value)),
+        raw,
+    })
+}
+
+/// Index just past the `;` or newline terminating the statement at `pos`
+fn statement_end(bytes: &[u8], mut pos: usize) -> usize {
+    while pos < bytes.len() {
+        match bytes[pos] {
+            b'\\' => pos += 2,
+            b'\'' => pos = skip_quoted(bytes, pos + 1, b'\'', false),
+            b'"' => pos = skip_quoted(bytes, pos + 1, b'"', true),
+            b'$' if bytes.get(pos + 1) == Some(&b'\'') => {
+                // ANSI-C quoting allows backslash escapes, including \'
+                pos = skip_quoted(bytes, pos + 2, b'\'', true)
+            }
+            b';' | b'\n' => return pos + 1,
+            _ => pos += 1,
+        }
+    }
+    bytes.len()
+}
+
+fn skip_quoted(bytes: &[u8], mut pos: usize, quote: u8, escapes: bool) -> usize {
+    while pos < bytes.len() {
+        if escapes && bytes[pos] == b'\\' {
+            pos += 2;
+            continue;
+        }
+        if bytes[pos] == quote {
+            return pos + 1;
+        }
+        pos += 1;
+    }
+    bytes.len()
+}
+
+fn unquote(value: &str) -> String {
+    let mut out = Vec::new();
+    let bytes = value.as_bytes();
+    let mut i = 0;
+
+    while i < bytes.len() {
+        match bytes[i] {
+            b'\'' => {
+                i += 1;
+                while i < bytes.len() && bytes[i] != b'\'' {
+                    out.push(bytes[i]);
+                    i += 1;
+                }
+            }
+            b'"' => {
+                i += 1;
+                while i < bytes.len() && bytes[i] != b'"' {
+                    if bytes[i] == b'\\' && i + 1 < bytes.len() {
+                        i += 1;
+                    }
+                    out.push(bytes[i]);
+                    i += 1;
+                }
+            }
+            b'$' if bytes.get(i + 1) == Some(&b'\'') => {
+                i += 2;
+                while i < bytes.len() && bytes[i] != b'\'' {
+                    if bytes[i] == b'\\' && i + 1 < bytes.len() {
+                        i += 1;
+                        match bytes[i] {
+                            b'n' => out.push(b'\n'),
+                            b't' => out.push(b'\t'),
+                            b'r' => out.push(b'\r'),
+                            b'e' | b'E' => out.push(0x1b),
+                            b'x' => {
+                                let hex = value.get(i + 1..i + 3).unwrap_or("");
+                                match u8::from_str_radix(hex, 16) {
+                                    Ok(b) => {
+                                        out.push(b);
+                                        i += 2;
+                                    }
+                                    Err(_) => out.push(b'x'),
+                                }
+                            }
+                            other => out.push(other),
+                        }
+                    } else {
+                        out.push(bytes[i]);
+                    }
+                    i += 1;
+                }
+            }
+            b'\\' if i + 1 < bytes.len() => {
+                i += 1;
+                out.push(bytes[i]);
+            }
+            c => out.push(c),
+        }
+        i += 1;
+    }
+
+    String::from_utf8_lossy(&out).into_owned()
+}
@@ -0,0 +1,171 @@
+use std::collections::hash_map::DefaultHasher;
+use std::env;
+use std::fs;
+use std::hash::{Hash, Hasher};
+use std::io::Write;
+use std::path::{Path, PathBuf};
+use std::time::{Duration, SystemTime, UNIX_EPOCH};
+
+use crate::freshness::{Signature, signature};
+
+const FAILED_FILE: &str = "env.failed";
+
+/// How long a failure is trusted when nothing it depends on changes, as it
+/// may have been transient, like a download failing. direnv refusing to load
+/// an .envrc only changes with the allow state, which is part of the key.
+const FAILURE_TTL: Duration = Duration::from_secs(60);
+
+/// What direnv prints when it refuses to load an .envrc
+const BLOCKED_MARKER: &str = "direnv allow";
+
+/// Where direnv keeps its allow and deny lists, and its config, which can
+/// allow whole trees
+fn allow_state_paths() -> Vec<PathBuf> {
+    let home = env::var_os("HOME").map(PathBuf::from).unwrap_or_default();
+    let data =
+        env::var_os("XDG_DATA_HOME").map_or_else(|| home.join(".local/share"), PathBuf::from);
+    let config = env::var_os("DIRENV_CONFIG").map_or_else(
+        || {
+            env::var_os("XDG_CONFIG_HOME")
+                .map_or_else(|| home.join(".config"), PathBuf::from)
+                .join("direnv")
+        },
+        PathBuf::from,
+    );
+    vec![
+        data.join("direnv/allow"),
+        data.join("direnv/deny"),
+        config.join("direnv.toml"),
+        config.join("config.toml"),
+    ]
+}
+
+/// What an evaluation of `envrc_dir` depends on as far as direnv refusing or
+/// failing it goes: the .envrc's path and signature, so editing it or
+/// `direnv reload` retries, and direnv's allow state. Adding or removing an
+/// allow or deny entry changes the mtime of its directory. Only stats, as
+/// `start` asks on every prompt while the cached env is stale; any edit
+/// changes the signature, so the content needn't be hashed.
+pub fn key(envrc_dir: &Path) -> Option<String> {
+    let envrc = envrc_dir.join(".envrc");
+    let envrc_signature = signature(&envrc);
+    if envrc_signature == (0, 0, 0) {
+        return None;
+    }
+    let mut hasher = DefaultHasher::new();
+    envrc.hash(&mut hasher);
+    envrc_signature.hash(&mut hasher);
+    for path in allow_state_paths() {
+        signature(&path).hash(&mut hasher);
+    }
+    Some(format!("{:x}", hasher.finish()))
+}
+
+fn now() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map_or(0, |d| d.as_secs())
+}
+
+/// A recorded failure: the key it was recorded for, when it expires (0 for
+/// never), the files direnv watched along with their signatures, and the log
+struct Record {
+    key: String,
+    expires: u64,
+    watched: Vec<(Signature, PathBuf)>,
+    log: String,
+}
+
+fn read(cache_dir: &Path) -> Option<Record> {
+    let content = fs::read_to_string(cache_dir.join(FAILED_FILE)).ok()?;
+    let mut rest = content.as_str();
+    let mut line = || {
+        let (line, tail) = rest.split_once('\n')?;
+        rest = tail;
+        Some(line)
+    };
+    let key = line()?.to_string();
+    let expires = line()?.parse().ok()?;
+    let count: usize = line()?.parse().ok()?;
+    let mut watched = Vec::with_capacity(count);
+    for _ in 0..count {
+        let mut fields = line()?.splitn(4, ' ');
+        let (Some(mtime), Some(size), Some(ino), Some(path)) =
+            (fields.next(), fields.next(), fields.next(), fields.next())
+        else {
+            return None;
+        };
+        let recorded = (mtime.parse().ok()?, size.parse().ok()?, ino.parse().ok()?);
+        watched.push((recorded, PathBuf::from(path)));
+    }
+    Some(Record {
+        key,
+        expires,
+        watched,
+        log: rest.to_string(),
+    })
+}
+
+/// The error direnv gave for the inputs `key` describes, if it failed on them,
+/// none of the other files it watched changed since and the failure hasn't
+/// expired
+pub fn cached(cache_dir: &Path, key: &str) -> Option<String> {
+    let record = read(cache_dir)?;
+    let valid = record.key == key
+        && (record.expires == 0 || now() < record.expires)
+        && record
+            .watched
+            .iter()
+            .all(|(recorded, path)| signature(path) == *recorded);
+    valid.then_some(record.log)
+}
+
+/// The files the recorded failure depends on
+pub fn watched(cache_dir: &Path) -> Vec<PathBuf> {
+    read(cache_dir).map_or_else(Vec::new, |record| {
+        record.watched.into_iter().map(|(_, path)| path).collect()
+    })
+}
+
+/// Remember that direnv failed on the inputs `key` describes and on `watched`,
+/// and what it said
+pub fn record(cache_dir: &Path, key: &str, watched: &[PathBuf], log: &[u8]) {
+    let blocked = String::from_utf8_lossy(log).contains(BLOCKED_MARKER);
+    let expires = if blocked {
+        0
+    } else {
+        now() + FAILURE_TTL.as_secs()
+    };
+    let watched: Vec<&PathBuf> = watched
+        .iter()
+        .filter(|path| !path.to_string_lossy().contains('\n'))
+        .collect();
+
+    let path = cache_dir.join(FAILED_FILE);
+    let tmp = cache_dir.join(format!("{}.{}.tmp", FAILED_FILE, std::process::id()));
+    let written = fs::File::create(&tmp).and_then(|mut file| {
+        writeln!(file, "{}", key)?;
+        writeln!(file, "{}", expires)?;
+        writeln!(file, "{}", watched.len())?;
+        for path in watched {
+            let (mtime, size, ino) = signature(path);
+            writeln!(
+                file,
+                "{} {} {} {}",
+                mtime,
+                size,
+                ino,
+                path.to_string_lossy()
+            )?;
+        }
+        file.write_all(log)
+    });
+    if written.and_then(|_| fs::rename(&tmp, &path)).is_err() {
+        let _ = fs::remove_file(&tmp);
+        let _ = fs::remove_file(&path);
+    }
+}
+
+pub fn clear(cache_dir: &Path) {
+    let _ = fs::remove_file(cache_dir.join(FAILED_FILE));
+}
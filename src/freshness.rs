@@ -0,0 +1,138 @@
+use std::fs::{self, File};
+use std::io::{self, BufRead, BufReader, Write};
+use std::os::unix::fs::MetadataExt;
+use std::path::{Path, PathBuf};
+use std::process::{Command, Stdio};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::exports;
+
+const INDEX_FILE: &str = "watches";
+
+/// File timestamps come from the kernel's coarse clock, which can lag behind
+/// `SystemTime::now()` by a tick
+const MTIME_SLACK_NS: i128 = 20_000_000;
+
+/// (mtime in ns, size, inode) of a path, all zero if it does not exist
+pub type Signature = (i128, u64, u64);
+
+pub fn signature(path: &Path) -> Signature {
+    match fs::metadata(path) {
+        Ok(m) => (
+            i128::from(m.mtime()) * 1_000_000_000 + i128::from(m.mtime_nsec()),
+            m.size(),
+            m.ino(),
+        ),
+        Err(_) => (0, 0, 0),
+    }
+}
+
+/// Returns true if the cached env in `cache_dir` was produced from exactly the
+/// files that are on disk now, i.e. re-running direnv would give the same result.
+pub fn is_fresh(cache_dir: &Path) -> bool {
+    let Ok(index) = File::open(cache_dir.join(INDEX_FILE)) else {
+        return false;
+    };
+    if !cache_dir.join("env").exists() {
+        return false;
+    }
+
+    for line in BufReader::new(index).lines() {
+        let Ok(line) = line else {
+            return false;
+        };
+        let mut fields = line.splitn(4, ' ');
+        let (Some(mtime), Some(size), Some(ino), Some(path)) =
+            (fields.next(), fields.next(), fields.next(), fields.next())
+        else {
+            return false;
+        };
+        let recorded = (
+            mtime.parse().unwrap_or(-1),
+            size.parse().unwrap_or(u64::MAX),
+            ino.parse().unwrap_or(u64::MAX),
+        );
+        if signature(Path::new(path)) != recorded {
+            return false;
+        }
+    }
+    true
+}
+
+/// The files the cached env in `cache_dir` was produced from
+pub fn watched(cache_dir: &Path) -> Vec<PathBuf> {
+    let Ok(index) = fs::read_to_string(cache_dir.join(INDEX_FILE)) else {
+        return Vec::new();
+    };
+    index
+        .lines()
+        .filter_map(|line| line.splitn(4, ' ').nth(3))
+        .map(PathBuf::from)
+        .collect()
+}
+
+/// Drop the index so the cache is considered stale until the next successful run
+pub fn invalidate(cache_dir: &Path) {
+    let _ = fs::remove_file(cache_dir.join(INDEX_FILE));
+}
+
+/// Record the current state of `paths` as the inputs of the cached env.
+///
+/// Files modified after `eval_started` may have changed while direnv was reading
+/// them, so in that case no index is written and the next prompt re-evaluates.
+pub fn record(cache_dir: &Path, paths: &[PathBuf], eval_started: SystemTime) -> io::Result<()> {
+    let started_ns = eval_started
+        .duration_since(UNIX_EPOCH)
+        .map(|d| d.as_nanos() as i128)
+        .unwrap_or(0);
+
+    let mut index = String::new();
+    for path in paths {
+        let path_str = path.to_string_lossy();
+        if path_str.contains('\n') {
+            return Err(io::Error::other("watched path contains a newline"));
+        }
+        let (mtime, size, ino) = signature(path);
+        if mtime >= started_ns - MTIME_SLACK_NS {
+            return Err(io::Error::other(format!(
+                "{} changed during evaluation",
+                path.display()
+            )));
+        }
+        index.push_str(&format!("{mtime} {size} {ino} {path_str}\n"));
+    }
+
+    let tmp = cache_dir.join(format!("{INDEX_FILE}.tmp"));
+    File::create(&tmp)?.write_all(index.as_bytes())?;
+    fs::rename(&tmp, cache_dir.join(INDEX_FILE))
+}
+
+/// Resolve the files direnv watches for an export, using `direnv watch-print`
+/// to decode `DIRENV_WATCHES`.
+///
+/// direnv only prints variables that differ from the calling environment, so if
+/// the export does not mention `DIRENV_WATCHES` the inherited value still applies.
+pub fn watched_paths(direnv_cmd: &str, export_script: &str) -> Option<Vec<PathBuf>> {
+    let watches = exports::exported_value(export_script, "DIRENV_WATCHES")
+        .or_else(|| std::env::var("DIRENV_WATCHES").ok())?;
+
+    let output = Command::new(direnv_cmd)
+        .args(["watch-print", "--null"])
+        .env("DIRENV_WATCHES", watches)
+        .stdin(Stdio::null())
+        .stderr(Stdio::null())
+        .output()
+        .ok()?;
+    if !output.status.success() {
+        return None;
+    }
+
+    Some(
+        output
+            .stdout
+            .split(|&b| b == 0)
+            .filter(|p| !p.is_empty())
+            .map(|p| PathBuf::from(String::from_utf8_lossy(p).into_owned()))
+            .collect(),
+    )
+}
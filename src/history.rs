@@ -0,0 +1,40 @@
+use std::fs::{self, File};
+use std::io::Write;
+use std::path::Path;
+use std::time::Duration;
+
+const HISTORY_FILE: &str = "durations";
+/// How many of a project's most recent evaluations its prediction is based on
+const MAX_SAMPLES: usize = 8;
+
+fn load(cache_dir: &Path) -> Vec<u64> {
+    fs::read_to_string(cache_dir.join(HISTORY_FILE))
+        .unwrap_or_default()
+        .lines()
+        .filter_map(|line| line.parse().ok())
+        .collect()
+}
+
+/// Remember how long a successful evaluation of the project took
+pub fn record(cache_dir: &Path, duration: Duration) -> std::io::Result<()> {
+    let mut samples = load(cache_dir);
+    samples.push(duration.as_millis().try_into().unwrap_or(u64::MAX));
+    let excess = samples.len().saturating_sub(MAX_SAMPLES);
+    samples.drain(..excess);
+
+    let content: String = samples.iter().map(|ms| format!("{ms}\n")).collect();
+    let tmp = cache_dir.join(format!("{HISTORY_FILE}.tmp"));
+    File::create(&tmp)?.write_all(content.as_bytes())?;
+    fs::rename(&tmp, cache_dir.join(HISTORY_FILE))
+}
+
+/// How long the next evaluation will likely take: the median of the recent
+/// ones, so a single cold build doesn't skew it. `None` without history.
+pub fn predict(cache_dir: &Path) -> Option<Duration> {
+    let mut samples = load(cache_dir);
+    samples.sort_unstable();
+    samples
+        .get(samples.len() / 2)
+        .copied()
+        .map(Duration::from_millis)
+}
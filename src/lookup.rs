@@ -0,0 +1,172 @@
+use std::fs::{self, File};
+use std::io::Write;
+use std::os::unix::fs::MetadataExt;
+use std::path::{Path, PathBuf};
+
+use crate::daemon::get_cache_dir;
+
+const LOOKUP_FILE: &str = "envrc-lookup";
+const MAX_ENTRIES: usize = 64;
+
+/// Result of an envrc root lookup, with the number of stat calls it took
+pub struct Lookup {
+    pub root: Option<PathBuf>,
+    pub stats: usize,
+    pub cached: bool,
+}
+
+/// A memoised lookup: the envrc root for `dir` (if any), and the mtimes that
+/// `dir` and each ancestor up to the root (or `/`) had when it was walked.
+/// Creating or deleting an `.envrc` bumps the mtime of its directory.
+struct Entry {
+    dir: PathBuf,
+    root: Option<PathBuf>,
+    mtimes: Vec<i128>,
+}
+
+impl Entry {
+    fn parse(line: &str) -> Option<Self> {
+        let mut fields = line.split('\t');
+        let mtimes = fields
+            .next()?
+            .split(',')
+            .map(|mtime| mtime.parse().ok())
+            .collect::<Option<_>>()?;
+        let dir = PathBuf::from(fields.next()?);
+        let root = match fields.next()? {
+            "" => None,
+            root => Some(PathBuf::from(root)),
+        };
+        Some(Self { dir, root, mtimes })
+    }
+
+    fn format(&self) -> Option<String> {
+        let root = match &self.root {
+            Some(root) => path_field(root)?,
+            None => "",
+        };
+        let mtimes: Vec<String> = self.mtimes.iter().map(i128::to_string).collect();
+        Some(format!(
+            "{}\t{}\t{}",
+            mtimes.join(","),
+            path_field(&self.dir)?,
+            root
+        ))
+    }
+
+    /// Check the entry with a stat of each directory that was walked. Unlike
+    /// looking up a missing `.envrc`, stats of directories that exist are
+    /// cached by network filesystems.
+    fn validate(&self, stats: &mut usize) -> bool {
+        let dirs: Vec<&Path> = self.dir.ancestors().collect();
+        if dirs.len() < self.mtimes.len() {
+            return false;
+        }
+        for (dir, mtime) in dirs.iter().zip(&self.mtimes) {
+            *stats += 1;
+            if dir_mtime(dir) == Some(*mtime) {
+                continue;
+            }
+            // Directories like $HOME change all the time (history files, lock
+            // files), so only give up on the entry if an .envrc came or went
+            *stats += 1;
+            let is_root = self.root.as_deref() == Some(*dir);
+            if dir.join(".envrc").exists() != is_root {
+                return false;
+            }
+        }
+        true
+    }
+}
+
+/// Paths containing the field or record separator are simply not cached
+fn path_field(path: &Path) -> Option<&str> {
+    path.to_str().filter(|s| !s.contains(['\t', '\n']))
+}
+
+fn dir_mtime(dir: &Path) -> Option<i128> {
+    fs::metadata(dir)
+        .ok()
+        .map(|m| i128::from(m.mtime()) * 1_000_000_000 + i128::from(m.mtime_nsec()))
+}
+
+/// Find the closest ancestor of `dir` (inclusive) containing an `.envrc`.
+///
+/// Negative lookups of `.envrc` in every ancestor are expensive on network
+/// filesystems (NFS typically does not cache them), so results are memoised
+/// in the cache dir. A hit only stats the directories that were walked.
+pub fn find_envrc_root(dir: &Path) -> Lookup {
+    let cache_file = get_cache_dir().join(LOOKUP_FILE);
+    let mut entries: Vec<Entry> = fs::read_to_string(&cache_file)
+        .unwrap_or_default()
+        .lines()
+        .filter_map(Entry::parse)
+        .collect();
+
+    let mut stats = 0;
+    if let Some(entry) = entries.iter().find(|e| e.dir == dir)
+        && entry.validate(&mut stats)
+    {
+        return Lookup {
+            root: entry.root.clone(),
+            stats,
+            cached: true,
+        };
+    }
+
+    // Take each mtime before looking for the .envrc so that a concurrent
+    // create invalidates what we record
+    let mut mtimes = Some(Vec::new());
+    let mut root = None;
+    let mut current = dir.to_path_buf();
+    loop {
+        stats += 2;
+        let mtime = dir_mtime(&current);
+        mtimes = mtimes.zip(mtime).map(|(mut mtimes, mtime)| {
+            mtimes.push(mtime);
+            mtimes
+        });
+        if current.join(".envrc").exists() {
+            root = Some(current);
+            break;
+        }
+        if !current.pop() {
+            break;
+        }
+    }
+
+    entries.retain(|e| e.dir != dir);
+    if let Some(mtimes) = mtimes {
+        entries.insert(
+            0,
+            Entry {
+                dir: dir.to_path_buf(),
+                root: root.clone(),
+                mtimes,
+            },
+        );
+        entries.truncate(MAX_ENTRIES);
+    }
+    let _ = store(&cache_file, &entries);
+
+    Lookup {
+        root,
+        stats,
+        cached: false,
+    }
+}
+
+fn store(cache_file: &Path, entries: &[Entry]) -> std::io::Result<()> {
+    let content: String = entries
+        .iter()
+        .filter_map(Entry::format)
+        .map(|line| line + "\n")
+        .collect();
+
+    if let Some(parent) = cache_file.parent() {
+        fs::create_dir_all(parent)?;
+    }
+    let tmp = cache_file.with_extension(format!("{}.tmp", std::process::id()));
+    File::create(&tmp)?.write_all(content.as_bytes())?;
+    fs::rename(&tmp, cache_file)
+}
@@ -1,6 +1,22 @@
+mod baseline;
+mod cgroup;
+mod changes;
 mod commands;
 mod daemon;
+mod exports;
+mod failures;
+mod freshness;
+mod history;
+mod lookup;
 mod mux;
+mod output;
+mod prewarm;
+mod profile;
+mod projects;
+mod scheduler;
+mod stats;
+mod subscribers;
+mod supervisor;
 
 use std::env;
 use std::path::Path;
@@ -9,13 +25,17 @@ fn main() {
     let args: Vec<String> = env::args().collect();
     match args.get(1).map(|s| s.as_str()) {
         Some("start") => commands::start::run(),
-        Some("stop") => commands::stop::run(),
+        Some("stop") => commands::stop::run(&args[2..]),
+        Some("supervisor") => commands::supervisor::run(&args[2..]),
+        Some("prewarm") => commands::prewarm::run(),
+        Some("stats") => commands::stats::run(),
+        Some("profile") => commands::profile::run(&args[2..]),
         Some("watch") => {
-            if args.len() < 4 {
-                eprintln!("Usage: {} watch <fifo_path> <socket_path>", args[0]);
+            if args.len() < 3 {
+                eprintln!("Usage: {} watch <socket_path>", args[0]);
                 std::process::exit(1);
             }
-            commands::watch::run(Path::new(&args[2]), Path::new(&args[3]));
+            commands::watch::run(Path::new(&args[2]));
         }
         Some("hook") => {
             if args.len() < 3 {
@@ -25,7 +45,10 @@ fn main() {
             commands::hook::run(&args[2]);
         }
         _ => {
-            eprintln!("Usage: {} <start|stop|watch|hook>", args[0]);
+            eprintln!(
+                "Usage: {} <start|stop|watch|hook|supervisor|prewarm|stats|profile>",
+                args[0]
+            );
             std::process::exit(1);
         }
     }
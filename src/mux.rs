@@ -2,6 +2,7 @@ use std::{
     env,
     io::{self, Error},
     process::Command,
+    time::Duration,
 };
 
 use crate::daemon::DaemonContext;
@@ -77,12 +78,7 @@ impl Multiplexer {
 
         command
             .args(mux_args)
-            .args([
-                &bin,
-                "watch",
-                &ctx.temp_stderr.to_string_lossy(),
-                &ctx.socket_path.to_string_lossy(),
-            ])
+            .args([&bin, "watch", &ctx.socket_path.to_string_lossy()])
             .spawn()
             .map(|_| ())
     }
@@ -95,3 +91,15 @@ pub fn mux_delay_ms() -> u64 {
         .map(|s| s * 1000)
         .unwrap_or(4000)
 }
+
+/// When to show the pane, given how long the evaluation is predicted to take.
+/// Projects that usually outlast the delay get it right away; for quicker
+/// ones it only appears once the evaluation clearly overruns its usual time.
+pub fn pane_delay(predicted: Option<Duration>) -> Duration {
+    let delay = Duration::from_millis(mux_delay_ms());
+    match predicted {
+        Some(predicted) if predicted >= delay => Duration::ZERO,
+        Some(predicted) => delay.max(predicted * 2),
+        None => delay,
+    }
+}
@@ -0,0 +1,201 @@
+use std::collections::VecDeque;
+use std::env;
+
+/// How much of the most recent output the daemon keeps for late watchers
+pub const OUTPUT_CAPACITY: usize = 1 << 20;
+/// How much of the start of the output is kept, it usually says what is being built
+const HEAD_CAPACITY: usize = 16 << 10;
+/// Budget for the log the shell prints once the evaluation is done. The head
+/// gets whatever a short tail leaves over.
+const SHELL_HEAD: usize = 8 << 10;
+const SHELL_TAIL: usize = 24 << 10;
+/// direnv's own lines kept for the summary
+const MAX_DIRENV_LINES: usize = 64;
+const MAX_LINE_LEN: usize = 4096;
+/// Lines of build output the summary shows when the evaluation failed
+const FAILURE_TAIL_LINES: usize = 20;
+
+/// What the shell is shown once an evaluation is done
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum StderrMode {
+    /// The start and end of the output, capped in size
+    Log,
+    /// Only direnv's own lines, plus the end of the output on failure
+    Summary,
+}
+
+impl StderrMode {
+    pub fn from_env() -> Self {
+        match env::var("DIRENV_INSTANT_STDERR").as_deref() {
+            Ok("summary") => Self::Summary,
+            _ => Self::Log,
+        }
+    }
+}
+
+/// The output of an evaluation with bounded memory: its first
+/// `HEAD_CAPACITY` bytes, its last `capacity` bytes and direnv's own lines
+pub struct OutputBuffer {
+    head: Vec<u8>,
+    tail: VecDeque<u8>,
+    capacity: usize,
+    /// Bytes between head and tail that were dropped
+    dropped: usize,
+    direnv_lines: Vec<Vec<u8>>,
+    /// Start of a line that hasn't been terminated yet
+    partial_line: Vec<u8>,
+}
+
+impl OutputBuffer {
+    pub fn new(capacity: usize) -> Self {
+        Self {
+            head: Vec::new(),
+            tail: VecDeque::new(),
+            capacity,
+            dropped: 0,
+            direnv_lines: Vec::new(),
+            partial_line: Vec::new(),
+        }
+    }
+
+    pub fn push(&mut self, mut data: &[u8]) {
+        self.collect_direnv_lines(data);
+
+        let room = HEAD_CAPACITY - self.head.len();
+        if room > 0 {
+            let (head, rest) = data.split_at(room.min(data.len()));
+            self.head.extend_from_slice(head);
+            data = rest;
+        }
+
+        // Only the tail of an oversized chunk can survive anyway
+        let skip = data.len().saturating_sub(self.capacity);
+        self.tail.extend(&data[skip..]);
+        let overflow = self.tail.len().saturating_sub(self.capacity);
+        self.tail.drain(..overflow);
+        self.dropped += skip + overflow;
+    }
+
+    fn collect_direnv_lines(&mut self, data: &[u8]) {
+        let mut rest = data;
+        while let Some(end) = rest.iter().position(|&b| b == b'\n') {
+            let mut line = std::mem::take(&mut self.partial_line);
+            line.extend_from_slice(&rest[..=end]);
+            rest = &rest[end + 1..];
+            if self.direnv_lines.len() < MAX_DIRENV_LINES && is_direnv_line(&line) {
+                self.direnv_lines.push(line);
+            }
+        }
+        // Long lines are cut, they are still recognisable
+        let keep = MAX_LINE_LEN.saturating_sub(self.partial_line.len());
+        self.partial_line
+            .extend_from_slice(&rest[..keep.min(rest.len())]);
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.head.is_empty()
+    }
+
+    /// Everything still buffered, for a watcher attaching late
+    pub fn replay(&self) -> Vec<u8> {
+        let mut out = self.head.clone();
+        if self.dropped > 0 {
+            out.extend_from_slice(&omitted(self.dropped));
+        }
+        let (front, back) = self.tail.as_slices();
+        out.extend_from_slice(front);
+        out.extend_from_slice(back);
+        out
+    }
+
+    /// What the shell prints once the evaluation is done, at most a few dozen KiB
+    pub fn shell_log(&self, mode: StderrMode, success: bool) -> Vec<u8> {
+        let tail: Vec<u8> = self.tail.iter().copied().collect();
+        let mut out = Vec::new();
+        match mode {
+            StderrMode::Log => {
+                let tail = line_suffix(&tail, SHELL_TAIL);
+                let head = line_prefix(&self.head, SHELL_HEAD + SHELL_TAIL - tail.len());
+                let total = self.head.len() + self.dropped + self.tail.len();
+                out.extend_from_slice(head);
+                if head.len() + tail.len() < total {
+                    out.extend_from_slice(&omitted(total - head.len() - tail.len()));
+                }
+                out.extend_from_slice(tail);
+            }
+            StderrMode::Summary => {
+                for line in &self.direnv_lines {
+                    out.extend_from_slice(line);
+                }
+                if !success {
+                    let recent = if self.dropped > 0 {
+                        tail
+                    } else {
+                        [self.head.as_slice(), &tail].concat()
+                    };
+                    let lines = last_lines(&recent, FAILURE_TAIL_LINES);
+                    out.extend_from_slice(line_suffix(lines, SHELL_TAIL));
+                }
+            }
+        }
+        out
+    }
+}
+
+fn omitted(bytes: usize) -> Vec<u8> {
+    format!(
+        "\r\n[direnv-instant: {} bytes of output omitted]\r\n",
+        bytes
+    )
+    .into_bytes()
+}
+
+/// Lines direnv itself prints (`direnv: loading ...`), possibly colored
+fn is_direnv_line(line: &[u8]) -> bool {
+    let mut line = line;
+    // Skip SGR sequences like \x1b[31m
+    while let Some(rest) = line.strip_prefix(b"\x1b[") {
+        match rest.iter().position(|&b| b == b'm') {
+            Some(end) => line = &rest[end + 1..],
+            None => return false,
+        }
+    }
+    line.starts_with(b"direnv: ")
+}
+
+/// Up to `max` bytes from the start of `data`, cut after a newline if possible
+fn line_prefix(data: &[u8], max: usize) -> &[u8] {
+    if data.len() <= max {
+        return data;
+    }
+    match data[..max].iter().rposition(|&b| b == b'\n') {
+        Some(end) => &data[..=end],
+        None => &data[..max],
+    }
+}
+
+/// Up to `max` bytes from the end of `data`, starting after a newline if possible
+fn line_suffix(data: &[u8], max: usize) -> &[u8] {
+    if data.len() <= max {
+        return data;
+    }
+    let suffix = &data[data.len() - max..];
+    match suffix.iter().position(|&b| b == b'\n') {
+        Some(start) => &suffix[start + 1..],
+        None => suffix,
+    }
+}
+
+/// The last `count` lines of `data`
+fn last_lines(data: &[u8], count: usize) -> &[u8] {
+    // A trailing newline doesn't start another line
+    let body = data.strip_suffix(b"\n").unwrap_or(data);
+    let start = body
+        .iter()
+        .enumerate()
+        .rev()
+        .filter(|&(_, &b)| b == b'\n')
+        .nth(count.saturating_sub(1))
+        .map_or(0, |(i, _)| i + 1);
+    &data[start..]
+}
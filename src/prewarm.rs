@@ -0,0 +1,107 @@
+use nix::fcntl::{Flock, FlockArg};
+use nix::libc;
+use nix::unistd::chdir;
+use std::env;
+use std::fs::{File, remove_file};
+use std::os::unix::net::UnixStream;
+use std::time::{Duration, SystemTime};
+
+use crate::baseline;
+use crate::daemon::{
+    DaemonContext, daemonize, debug_log, get_cache_dir, get_runtime_base, run_direnv,
+};
+use crate::freshness;
+use crate::projects;
+
+/// How many of the most used projects are kept warm
+const PREWARM_COUNT: usize = 5;
+/// How often `start` kicks off a prewarm run in prewarm mode
+const PREWARM_INTERVAL: Duration = Duration::from_secs(60 * 60);
+
+pub fn enabled() -> bool {
+    env::var("DIRENV_INSTANT_PREWARM").is_ok_and(|v| v == "1")
+}
+
+/// Start a background prewarm run, unless the last one was started recently
+pub fn spawn_if_due() {
+    let stamp_path = get_cache_dir().join("prewarm.stamp");
+    let last_run = std::fs::metadata(&stamp_path).and_then(|m| m.modified());
+    if last_run.is_ok_and(|t| t.elapsed().is_ok_and(|age| age < PREWARM_INTERVAL)) {
+        return;
+    }
+
+    let stamped = File::options()
+        .create(true)
+        .truncate(false)
+        .write(true)
+        .open(&stamp_path)
+        .and_then(|stamp| stamp.set_modified(SystemTime::now()));
+    if stamped.is_ok() {
+        daemonize(|| run("direnv"));
+    }
+}
+
+/// Re-evaluate the most used projects whose cached env is stale, one at a
+/// time and at idle priority
+pub fn run(direnv_cmd: &str) {
+    let _ = std::fs::create_dir_all(get_runtime_base());
+    let Ok(lock_file) = File::create(get_runtime_base().join("prewarm.lock")) else {
+        return;
+    };
+    let Ok(_lock) = Flock::lock(lock_file, FlockArg::LockExclusiveNonblock) else {
+        return; // Another prewarm run is in progress
+    };
+
+    lower_priority();
+
+    // Evaluate each project as a shell freshly entering it would, not on top
+    // of whatever project the caller has loaded, or that project's PATH and
+    // variables end up in every cached env
+    if !baseline::unload(direnv_cmd) {
+        debug_log("prewarm: failed to unload the current project, skipping");
+        return;
+    }
+
+    for project in projects::top(PREWARM_COUNT) {
+        if !project.envrc_dir.join(".envrc").exists() {
+            continue;
+        }
+        let mut ctx = DaemonContext::new(None, project.envrc_dir);
+        if freshness::is_fresh(&ctx.cache_dir) {
+            continue;
+        }
+        if UnixStream::connect(&ctx.socket_path).is_ok() {
+            continue; // Already being evaluated
+        }
+        let _ = remove_file(&ctx.socket_path); // Stale socket
+        if chdir(&ctx.envrc_dir).is_err() {
+            continue;
+        }
+
+        // Nobody is waiting for this evaluation, so never pop up a pane
+        ctx.multiplexer = None;
+        debug_log(&format!("prewarming {}", ctx.envrc_dir.display()));
+        run_direnv(direnv_cmd, &ctx);
+    }
+}
+
+/// Nice the process and, on Linux, put its IO in the idle class. Both are
+/// inherited by direnv and everything it runs.
+fn lower_priority() {
+    unsafe { libc::setpriority(libc::PRIO_PROCESS, 0, 19) };
+
+    #[cfg(target_os = "linux")]
+    {
+        const IOPRIO_WHO_PROCESS: libc::c_long = 1;
+        const IOPRIO_CLASS_IDLE: libc::c_long = 3;
+        const IOPRIO_CLASS_SHIFT: libc::c_long = 13;
+        unsafe {
+            libc::syscall(
+                libc::SYS_ioprio_set,
+                IOPRIO_WHO_PROCESS,
+                0,
+                IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT,
+            )
+        };
+    }
+}
@@ -0,0 +1,211 @@
+use std::collections::HashMap;
+use std::path::Path;
+
+use crate::stats::quote;
+
+/// Sourced by every bash direnv runs, through `BASH_ENV`. The first `bash -c`,
+/// the one direnv evaluates its stdlib and the .envrc in, traces every command
+/// with a timestamp and its call depth to `$__DIRENV_INSTANT_TRACE` and unsets
+/// both, so scripts the .envrc runs aren't traced themselves. Wrapper scripts
+/// around direnv pass them on. Needs bash 5 for `EPOCHREALTIME`.
+pub const TRACE_RC: &str = r#"if [ -n "${BASH_EXECUTION_STRING:-}" ]; then
+  unset BASH_ENV
+  if [ -n "${EPOCHREALTIME:-}" ] && exec {__direnv_instant_trace}>>"$__DIRENV_INSTANT_TRACE"; then
+    BASH_XTRACEFD=$__direnv_instant_trace
+    PS4='+${EPOCHREALTIME} ${#FUNCNAME[@]} ${BASH_SOURCE[0]:-}:${LINENO}: '
+    set -x
+  fi
+  unset __DIRENV_INSTANT_TRACE
+fi
+"#;
+
+/// One command bash traced
+pub struct TraceEvent {
+    /// Seconds since the epoch
+    pub at: f64,
+    /// How many function calls and sourced files deep it ran
+    pub depth: usize,
+    pub source: String,
+    pub line: u32,
+    pub command: String,
+}
+
+/// Parse the trace written through `TRACE_RC`, in the order things happened.
+/// Continuation lines of multi-line commands are skipped.
+pub fn parse_trace(trace: &str) -> Vec<TraceEvent> {
+    let mut events: Vec<TraceEvent> = trace.lines().filter_map(parse_trace_line).collect();
+    events.sort_by(|a, b| a.at.total_cmp(&b.at));
+    events
+}
+
+fn parse_trace_line(line: &str) -> Option<TraceEvent> {
+    let rest = line.strip_prefix('+')?.trim_start_matches('+');
+    let (at, rest) = rest.split_once(' ')?;
+    let (depth, rest) = rest.split_once(' ')?;
+    let (location, command) = rest
+        .split_once(": ")
+        .unwrap_or((rest.trim_end_matches(':'), ""));
+    let (source, line) = location.rsplit_once(':')?;
+    Some(TraceEvent {
+        // EPOCHREALTIME follows the locale's decimal separator
+        at: at.replace(',', ".").parse().ok()?,
+        depth: depth.parse().ok()?,
+        source: source.to_string(),
+        line: line.parse().ok()?,
+        command: command.to_string(),
+    })
+}
+
+/// Time spent on one step of the evaluation
+pub struct Step {
+    pub name: String,
+    pub seconds: f64,
+    pub count: usize,
+}
+
+/// Where an evaluation spent its time
+pub struct Breakdown {
+    /// By stdlib function or command the .envrc runs, plus direnv's own work
+    /// before and after it
+    pub phases: Vec<Step>,
+    /// By .envrc line, including everything it called
+    pub lines: Vec<Step>,
+}
+
+const BEFORE_ENVRC: &str = "direnv (before .envrc)";
+const AFTER_ENVRC: &str = "direnv (after .envrc)";
+
+/// The step a .envrc command belongs to: the stdlib function, or the command
+/// run, along with what is used or laid out
+fn phase(command: &str) -> String {
+    let mut words = command.split_whitespace();
+    match words.next() {
+        Some(first @ ("use" | "layout")) => match words.next() {
+            Some(second) => format!("{} {}", first, second),
+            None => first.to_string(),
+        },
+        Some(first) => first.to_string(),
+        None => "(empty)".to_string(),
+    }
+}
+
+fn is_envrc(source: &str) -> bool {
+    Path::new(source)
+        .file_name()
+        .is_some_and(|name| name == ".envrc" || name == ".env")
+}
+
+/// Attribute the time between each traced command and the next to the
+/// .envrc line it ran for. `finished` is when the evaluation exited.
+pub fn attribute(events: &[TraceEvent], started: f64, finished: f64) -> Breakdown {
+    let mut phases: HashMap<String, Step> = HashMap::new();
+    let mut lines: HashMap<String, Step> = HashMap::new();
+    let add = |steps: &mut HashMap<String, Step>, name: String, seconds: f64, new: bool| {
+        let step = steps.entry(name.clone()).or_insert(Step {
+            name,
+            seconds: 0.0,
+            count: 0,
+        });
+        step.seconds += seconds;
+        step.count += usize::from(new);
+    };
+
+    // Whatever ran before the first trace line counts as direnv's setup
+    let first = events.first().map_or(finished, |e| e.at);
+    add(
+        &mut phases,
+        BEFORE_ENVRC.to_string(),
+        (first - started).max(0.0),
+        true,
+    );
+
+    // The .envrc line everything runs for, and how deep the .envrc itself is
+    let mut current: Option<(String, String)> = None;
+    let mut envrc_depth = None;
+    let mut after = false;
+    for (i, event) in events.iter().enumerate() {
+        let next = events.get(i + 1).map_or(finished, |e| e.at);
+        let seconds = (next - event.at).max(0.0);
+
+        let mut new = false;
+        if is_envrc(&event.source) && envrc_depth.is_none_or(|d| event.depth >= d) {
+            envrc_depth.get_or_insert(event.depth);
+            let line = format!("{}:{}: {}", event.source, event.line, event.command);
+            new = current.as_ref().is_none_or(|(l, _)| *l != line);
+            current = Some((line, phase(&event.command)));
+            after = false;
+        } else if envrc_depth.is_some_and(|d| event.depth < d) {
+            // Returned from sourcing the .envrc
+            new = !after;
+            after = true;
+        }
+
+        match (&current, after) {
+            (Some((line, phase)), false) => {
+                add(&mut lines, line.clone(), seconds, new);
+                add(&mut phases, phase.clone(), seconds, new);
+            }
+            (None, _) => add(&mut phases, BEFORE_ENVRC.to_string(), seconds, false),
+            (_, true) => add(&mut phases, AFTER_ENVRC.to_string(), seconds, new),
+        }
+    }
+
+    let sorted = |steps: HashMap<String, Step>| {
+        let mut steps: Vec<Step> = steps.into_values().filter(|s| s.count > 0).collect();
+        steps.sort_by(|a, b| b.seconds.total_cmp(&a.seconds));
+        steps
+    };
+    Breakdown {
+        phases: sorted(phases),
+        lines: sorted(lines),
+    }
+}
+
+/// A line direnv printed, with when it did relative to the start
+pub struct OutputLine {
+    pub seconds: f64,
+    pub text: String,
+}
+
+pub fn to_json(
+    envrc: &Path,
+    total: f64,
+    status: i32,
+    breakdown: &Breakdown,
+    output: &[OutputLine],
+) -> String {
+    let steps = |steps: &[Step]| {
+        steps
+            .iter()
+            .map(|s| {
+                format!(
+                    "{{\"name\":{},\"seconds\":{:.6},\"count\":{}}}",
+                    quote(&s.name),
+                    s.seconds,
+                    s.count
+                )
+            })
+            .collect::<Vec<_>>()
+            .join(",")
+    };
+    let output = output
+        .iter()
+        .map(|l| {
+            format!(
+                "{{\"seconds\":{:.6},\"text\":{}}}",
+                l.seconds,
+                quote(&l.text)
+            )
+        })
+        .collect::<Vec<_>>()
+        .join(",");
+    format!(
+        "{{\"envrc\":{},\"seconds\":{:.6},\"status\":{},\"phases\":[{}],\"lines\":[{}],\"output\":[{}]}}",
+        quote(&envrc.to_string_lossy()),
+        total,
+        status,
+        steps(&breakdown.phases),
+        steps(&breakdown.lines),
+        output
+    )
+}
@@ -0,0 +1,101 @@
+use std::fs::{self, File};
+use std::io::Write;
+use std::path::{Path, PathBuf};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::daemon::get_cache_dir;
+
+const PROJECTS_FILE: &str = "projects";
+const MAX_PROJECTS: usize = 64;
+
+const HOUR: u64 = 60 * 60;
+const DAY: u64 = 24 * HOUR;
+
+/// An envrc root the user has entered, with how often and how recently
+pub struct Project {
+    pub envrc_dir: PathBuf,
+    visits: u64,
+    last_visit: u64,
+}
+
+impl Project {
+    fn parse(line: &str) -> Option<Self> {
+        let mut fields = line.splitn(3, ' ');
+        Some(Self {
+            visits: fields.next()?.parse().ok()?,
+            last_visit: fields.next()?.parse().ok()?,
+            envrc_dir: PathBuf::from(fields.next()?),
+        })
+    }
+
+    /// Visits weighted by recency, like shell directory jumpers do it
+    fn frecency(&self, now: u64) -> u64 {
+        let age = now.saturating_sub(self.last_visit);
+        let weight = match age {
+            a if a < HOUR => 8,
+            a if a < DAY => 4,
+            a if a < 7 * DAY => 2,
+            _ => 1,
+        };
+        self.visits * weight
+    }
+}
+
+fn now() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map(|d| d.as_secs())
+        .unwrap_or(0)
+}
+
+fn load(path: &Path) -> Vec<Project> {
+    fs::read_to_string(path)
+        .unwrap_or_default()
+        .lines()
+        .filter_map(Project::parse)
+        .collect()
+}
+
+/// Count a visit to `envrc_dir`
+pub fn record_visit(envrc_dir: &Path) -> std::io::Result<()> {
+    let Some(dir) = envrc_dir.to_str().filter(|s| !s.contains('\n')) else {
+        return Ok(()); // Not representable in the file
+    };
+
+    let path = get_cache_dir().join(PROJECTS_FILE);
+    let now = now();
+    let mut projects = load(&path);
+    match projects.iter_mut().find(|p| p.envrc_dir == envrc_dir) {
+        Some(project) => {
+            project.visits += 1;
+            project.last_visit = now;
+        }
+        None => projects.push(Project {
+            envrc_dir: PathBuf::from(dir),
+            visits: 1,
+            last_visit: now,
+        }),
+    }
+
+    // Forget the least used projects
+    projects.sort_by_key(|p| std::cmp::Reverse(p.frecency(now)));
+    projects.truncate(MAX_PROJECTS);
+
+    let content: String = projects
+        .iter()
+        .map(|p| format!("{} {} {}\n", p.visits, p.last_visit, p.envrc_dir.display()))
+        .collect();
+    fs::create_dir_all(get_cache_dir())?;
+    let tmp = path.with_extension(format!("{}.tmp", std::process::id()));
+    File::create(&tmp)?.write_all(content.as_bytes())?;
+    fs::rename(&tmp, &path)
+}
+
+/// The `count` most frecent projects, best first
+pub fn top(count: usize) -> Vec<Project> {
+    let now = now();
+    let mut projects = load(&get_cache_dir().join(PROJECTS_FILE));
+    projects.sort_by_key(|p| std::cmp::Reverse(p.frecency(now)));
+    projects.truncate(count);
+    projects
+}
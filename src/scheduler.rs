@@ -0,0 +1,191 @@
+use nix::fcntl::{Flock, FlockArg};
+use std::env;
+use std::ffi::OsString;
+use std::fs::{self, File};
+use std::io::{self, ErrorKind};
+use std::os::fd::OwnedFd;
+use std::os::unix::ffi::OsStrExt;
+use std::path::{Path, PathBuf};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::daemon::get_runtime_base;
+
+/// How many evaluations may run at once across all shells: one per CPU,
+/// unless `DIRENV_INSTANT_MAX_JOBS` says otherwise. 0 lifts the limit.
+pub fn max_jobs() -> Option<usize> {
+    let configured = env::var("DIRENV_INSTANT_MAX_JOBS")
+        .ok()
+        .and_then(|v| v.parse().ok());
+    match configured {
+        Some(0) => None,
+        Some(n) => Some(n),
+        None => Some(std::thread::available_parallelism().map_or(1, |n| n.get())),
+    }
+}
+
+fn slots_dir() -> PathBuf {
+    get_runtime_base().join("slots")
+}
+
+fn queue_dir() -> PathBuf {
+    slots_dir().join("queue")
+}
+
+/// Open `path` read-only for flock()ing, creating it if needed. Waiting
+/// daemons wake up when a file in the slot or queue directory is closed after
+/// writing, which merely checking a lock never causes.
+fn open_lock(path: &Path) -> io::Result<File> {
+    match File::open(path) {
+        Err(e) if e.kind() == ErrorKind::NotFound => {
+            File::options()
+                .create(true)
+                .truncate(false)
+                .write(true)
+                .open(path)?;
+            File::open(path)
+        }
+        result => result,
+    }
+}
+
+/// Permission to run an evaluation, held until dropped. The slots are
+/// flock()ed files, so a daemon that dies frees its slot.
+pub struct Slot {
+    _lock: Option<Flock<File>>,
+    /// Closed after the lock is released, waking the daemons waiting for it
+    _release: Option<File>,
+}
+
+impl Slot {
+    /// A slot when evaluations aren't limited, or the slots are unusable:
+    /// evaluations are never held back because of that
+    pub fn unlimited() -> Self {
+        Slot {
+            _lock: None,
+            _release: None,
+        }
+    }
+}
+
+/// Take a free slot, if any
+fn acquire_slot(max_jobs: usize) -> Option<Slot> {
+    let mut usable = false;
+    for slot in 0..max_jobs {
+        let path = slots_dir().join(format!("{slot}.lock"));
+        let Ok(file) = fs::create_dir_all(slots_dir()).and_then(|_| open_lock(&path)) else {
+            continue;
+        };
+        usable = true;
+        if let Ok(lock) = Flock::lock(file, FlockArg::LockExclusiveNonblock) {
+            return Some(Slot {
+                _lock: Some(lock),
+                _release: File::options().write(true).open(&path).ok(),
+            });
+        }
+    }
+    (!usable).then(Slot::unlimited)
+}
+
+/// A daemon's place in line for a slot: a file in the queue directory, named
+/// so that daemons a shell is waiting for come first and otherwise in order of
+/// arrival. It is flock()ed while we wait, so the tickets of daemons that died
+/// can be told apart.
+pub struct Ticket {
+    path: PathBuf,
+    arrival: String,
+    _lock: Flock<File>,
+}
+
+fn ticket_name(foreground: bool, arrival: &str) -> String {
+    format!("{}-{}", if foreground { 0 } else { 1 }, arrival)
+}
+
+impl Ticket {
+    pub fn new(foreground: bool) -> Option<Self> {
+        let dir = queue_dir();
+        fs::create_dir_all(&dir).ok()?;
+        let now = SystemTime::now()
+            .duration_since(UNIX_EPOCH)
+            .map_or(0, |d| d.as_nanos());
+        let arrival = format!("{:020}-{}", now, std::process::id());
+
+        // Only put in line once locked, so nobody takes it for a dead daemon's
+        let tmp = dir.join(format!(".{}", arrival));
+        let lock = File::create(&tmp)
+            .ok()
+            .and_then(|file| Flock::lock(file, FlockArg::LockExclusiveNonblock).ok());
+        let path = dir.join(ticket_name(foreground, &arrival));
+        match lock {
+            Some(lock) if fs::rename(&tmp, &path).is_ok() => Some(Self {
+                path,
+                arrival,
+                _lock: lock,
+            }),
+            _ => {
+                let _ = fs::remove_file(&tmp);
+                None
+            }
+        }
+    }
+
+    /// Move ahead of the background work in line, or back behind it
+    pub fn set_foreground(&mut self, foreground: bool) {
+        let path = queue_dir().join(ticket_name(foreground, &self.arrival));
+        if path != self.path && fs::rename(&self.path, &path).is_ok() {
+            self.path = path;
+        }
+    }
+
+    /// Take a free slot, unless a live ticket is ahead of ours
+    pub fn try_acquire(&self, max_jobs: usize) -> Option<Slot> {
+        let ours = self.path.file_name()?;
+        let ahead: Vec<OsString> = fs::read_dir(queue_dir())
+            .ok()?
+            .filter_map(|entry| entry.ok().map(|entry| entry.file_name()))
+            .filter(|name| !name.as_bytes().starts_with(b".") && name.as_os_str() < ours)
+            .collect();
+        for name in ahead {
+            let path = queue_dir().join(name);
+            let Ok(file) = File::open(&path) else {
+                continue; // Left the line in the meantime
+            };
+            if Flock::lock(file, FlockArg::LockExclusiveNonblock).is_err() {
+                return None;
+            }
+            // Its daemon died
+            let _ = fs::remove_file(&path);
+        }
+        acquire_slot(max_jobs)
+    }
+}
+
+impl Drop for Ticket {
+    fn drop(&mut self) {
+        let _ = fs::remove_file(&self.path);
+    }
+}
+
+/// An fd that becomes readable when a slot may have been freed or a ticket
+/// ahead of ours may have left the line
+#[cfg(target_os = "linux")]
+pub fn notifier() -> Option<OwnedFd> {
+    use nix::sys::inotify::{AddWatchFlags, InitFlags, Inotify};
+
+    fs::create_dir_all(queue_dir()).ok()?;
+    let inotify = Inotify::init(InitFlags::IN_NONBLOCK | InitFlags::IN_CLOEXEC).ok()?;
+    inotify
+        .add_watch(&slots_dir(), AddWatchFlags::IN_CLOSE_WRITE)
+        .ok()?;
+    inotify
+        .add_watch(
+            &queue_dir(),
+            AddWatchFlags::IN_CLOSE_WRITE | AddWatchFlags::IN_DELETE | AddWatchFlags::IN_MOVED_FROM,
+        )
+        .ok()?;
+    Some(inotify.into())
+}
+
+#[cfg(not(target_os = "linux"))]
+pub fn notifier() -> Option<OwnedFd> {
+    None
+}
@@ -0,0 +1,158 @@
+use std::env;
+use std::fs::{self, OpenOptions};
+use std::io::Write;
+use std::path::{Path, PathBuf};
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+
+use crate::daemon::get_cache_dir;
+
+const STATS_FILE: &str = "stats.jsonl";
+/// Past this size the file is rotated to `stats.jsonl.old`, so the events of
+/// at most twice this take up space
+const MAX_STATS_BYTES: u64 = 1 << 20;
+
+pub fn enabled() -> bool {
+    env::var("DIRENV_INSTANT_STATS").is_ok_and(|v| v == "1")
+}
+
+pub fn stats_file() -> PathBuf {
+    get_cache_dir().join(STATS_FILE)
+}
+
+/// One timing, as a line of JSON
+pub struct Event {
+    pub event: String,
+    pub project: Option<PathBuf>,
+    pub micros: u64,
+}
+
+impl Event {
+    fn format(&self, timestamp_ms: u128) -> String {
+        let project = match &self.project {
+            Some(project) => quote(&project.to_string_lossy()),
+            None => "null".to_string(),
+        };
+        format!(
+            "{{\"ts\":{},\"event\":{},\"us\":{},\"project\":{}}}\n",
+            timestamp_ms,
+            quote(&self.event),
+            self.micros,
+            project
+        )
+    }
+
+    /// Parse a line in the format we write, not JSON in general
+    pub fn parse(line: &str) -> Option<Self> {
+        let rest = line.strip_prefix("{\"ts\":")?;
+        let (_, rest) = rest.split_once(",\"event\":")?;
+        let (event, rest) = unquote(rest)?;
+        let rest = rest.strip_prefix(",\"us\":")?;
+        let (micros, rest) = rest.split_once(",\"project\":")?;
+        let project = match rest.strip_suffix('}')? {
+            "null" => None,
+            quoted => Some(PathBuf::from(unquote(quoted)?.0)),
+        };
+        Some(Self {
+            event,
+            project,
+            micros: micros.parse().ok()?,
+        })
+    }
+}
+
+pub fn quote(s: &str) -> String {
+    let mut out = String::with_capacity(s.len() + 2);
+    out.push('"');
+    for c in s.chars() {
+        match c {
+            '"' => out.push_str("\\\""),
+            '\\' => out.push_str("\\\\"),
+            c if c.is_control() => out.push_str(&format!("\\u{:04x}", u32::from(c))),
+            c => out.push(c),
+        }
+    }
+    out.push('"');
+    out
+}
+
+/// The string at the start of `s`, and what follows it
+fn unquote(s: &str) -> Option<(String, &str)> {
+    let mut chars = s.strip_prefix('"')?.char_indices();
+    let mut out = String::new();
+    while let Some((i, c)) = chars.next() {
+        match c {
+            '"' => return Some((out, &s[i + 2..])),
+            '\\' => match chars.next()?.1 {
+                'u' => {
+                    let hex: String = (0..4)
+                        .filter_map(|_| chars.next())
+                        .map(|(_, c)| c)
+                        .collect();
+                    out.push(char::from_u32(u32::from_str_radix(&hex, 16).ok()?)?);
+                }
+                escaped => out.push(escaped),
+            },
+            c => out.push(c),
+        }
+    }
+    None
+}
+
+/// Append a timing to the stats file, if `DIRENV_INSTANT_STATS` is set
+pub fn record(event: &str, project: Option<&Path>, duration: Duration) {
+    if !enabled() {
+        return;
+    }
+    let event = Event {
+        event: event.to_string(),
+        project: project.map(Path::to_path_buf),
+        micros: duration.as_micros().try_into().unwrap_or(u64::MAX),
+    };
+    let timestamp_ms = SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map(|d| d.as_millis())
+        .unwrap_or(0);
+
+    let path = stats_file();
+    if fs::metadata(&path).is_ok_and(|m| m.len() > MAX_STATS_BYTES) {
+        let _ = fs::rename(&path, path.with_extension("jsonl.old"));
+    }
+    let _ = fs::create_dir_all(get_cache_dir());
+    // A single short O_APPEND write, so concurrent writers don't interleave
+    if let Ok(mut file) = OpenOptions::new().create(true).append(true).open(&path) {
+        let _ = file.write_all(event.format(timestamp_ms).as_bytes());
+    }
+}
+
+/// Every recorded event, oldest first
+pub fn load() -> Vec<Event> {
+    let path = stats_file();
+    [path.with_extension("jsonl.old"), path]
+        .iter()
+        .filter_map(|path| fs::read_to_string(path).ok())
+        .flat_map(|content| content.lines().filter_map(Event::parse).collect::<Vec<_>>())
+        .collect()
+}
+
+/// Records the time from its creation until it is dropped
+pub struct Span {
+    event: &'static str,
+    started: Instant,
+    pub project: Option<PathBuf>,
+}
+
+impl Span {
+    pub fn start(event: &'static str) -> Self {
+        Self {
+            event,
+            started: Instant::now(),
+            project: None,
+        }
+    }
+}
+
+impl Drop for Span {
+    fn drop(&mut self) {
+        record(self.event, self.project.as_deref(), self.started.elapsed());
+    }
+}
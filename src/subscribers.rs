@@ -0,0 +1,150 @@
+use nix::errno::Errno;
+use nix::sys::signal::{Signal, kill};
+use nix::unistd::Pid;
+use std::os::fd::{AsFd, BorrowedFd, OwnedFd};
+
+#[cfg(target_os = "linux")]
+use nix::libc;
+#[cfg(target_os = "linux")]
+use nix::poll::{PollFd, PollFlags, PollTimeout, poll};
+#[cfg(target_os = "linux")]
+use std::os::fd::FromRawFd;
+
+/// A shell waiting for the result of an evaluation
+struct Subscriber {
+    pid: i32,
+    /// Keeps referring to this shell after it exits, so its PID being reused
+    /// doesn't matter. `None` where pidfds are not supported.
+    pidfd: Option<OwnedFd>,
+    /// Signalled since it last subscribed
+    notified: bool,
+}
+
+impl Subscriber {
+    fn alive(&self) -> bool {
+        match &self.pidfd {
+            Some(pidfd) => !pidfd_exited(pidfd),
+            None => kill(Pid::from_raw(self.pid), None) != Err(Errno::ESRCH),
+        }
+    }
+
+    fn notify(&mut self) {
+        let _ = match &self.pidfd {
+            Some(pidfd) => pidfd_send_signal(pidfd, Signal::SIGUSR1),
+            None => kill(Pid::from_raw(self.pid), Signal::SIGUSR1),
+        };
+        self.notified = true;
+    }
+}
+
+/// The shells to notify once an evaluation finishes, each one once
+#[derive(Default)]
+pub struct Subscribers {
+    shells: Vec<Subscriber>,
+}
+
+impl Subscribers {
+    /// Subscribe the shell `pid`, unless it is already gone. A shell that
+    /// subscribes again is due another notification.
+    pub fn add(&mut self, pid: i32) {
+        if let Some(shell) = self.shells.iter_mut().find(|s| s.pid == pid) {
+            shell.notified = false;
+            return;
+        }
+        let pidfd = match pidfd_open(pid) {
+            Ok(pidfd) => Some(pidfd),
+            Err(Errno::ESRCH) => return,
+            Err(_) => None,
+        };
+        self.shells.push(Subscriber {
+            pid,
+            pidfd,
+            notified: false,
+        });
+    }
+
+    pub fn remove(&mut self, pid: i32) {
+        self.shells.retain(|s| s.pid != pid);
+    }
+
+    pub fn len(&self) -> usize {
+        self.shells.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.shells.is_empty()
+    }
+
+    /// Drop the shells that have exited. Returns whether there were any.
+    pub fn forget_exited(&mut self) -> bool {
+        let before = self.shells.len();
+        self.shells.retain(Subscriber::alive);
+        self.shells.len() != before
+    }
+
+    /// Fds that become readable when their shell exits
+    pub fn pidfds(&self) -> impl Iterator<Item = BorrowedFd<'_>> {
+        self.shells
+            .iter()
+            .filter_map(|s| s.pidfd.as_ref().map(AsFd::as_fd))
+    }
+
+    /// Signal every shell that the new env is ready
+    pub fn notify_all(&mut self) {
+        for shell in &mut self.shells {
+            shell.notify();
+        }
+    }
+
+    /// Signal the shells that subscribed after `notify_all`
+    pub fn notify_pending(&mut self) {
+        for shell in self.shells.iter_mut().filter(|s| !s.notified) {
+            shell.notify();
+        }
+    }
+}
+
+#[cfg(target_os = "linux")]
+fn pidfd_open(pid: i32) -> nix::Result<OwnedFd> {
+    // SAFETY: pidfd_open takes no pointers and returns a new fd we own
+    let fd = unsafe { libc::syscall(libc::SYS_pidfd_open, pid, 0) };
+    Errno::result(fd).map(|fd| unsafe { OwnedFd::from_raw_fd(fd as i32) })
+}
+
+#[cfg(not(target_os = "linux"))]
+fn pidfd_open(_pid: i32) -> nix::Result<OwnedFd> {
+    Err(Errno::ENOSYS)
+}
+
+#[cfg(target_os = "linux")]
+fn pidfd_send_signal(pidfd: &OwnedFd, signal: Signal) -> nix::Result<()> {
+    use std::os::fd::AsRawFd;
+    // SAFETY: no siginfo is passed
+    let res = unsafe {
+        libc::syscall(
+            libc::SYS_pidfd_send_signal,
+            pidfd.as_raw_fd(),
+            signal as libc::c_int,
+            std::ptr::null::<libc::siginfo_t>(),
+            0,
+        )
+    };
+    Errno::result(res).map(drop)
+}
+
+#[cfg(not(target_os = "linux"))]
+fn pidfd_send_signal(_pidfd: &OwnedFd, _signal: Signal) -> nix::Result<()> {
+    Err(Errno::ENOSYS)
+}
+
+/// A pidfd is readable once its process has exited
+#[cfg(target_os = "linux")]
+fn pidfd_exited(pidfd: &OwnedFd) -> bool {
+    let mut fds = [PollFd::new(pidfd.as_fd(), PollFlags::POLLIN)];
+    poll(&mut fds, PollTimeout::ZERO).is_ok_and(|n| n > 0)
+}
+
+#[cfg(not(target_os = "linux"))]
+fn pidfd_exited(_pidfd: &OwnedFd) -> bool {
+    false
+}
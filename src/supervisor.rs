@@ -0,0 +1,361 @@
+use nix::errno::Errno;
+use nix::fcntl::{Flock, FlockArg};
+use nix::poll::{PollFd, PollFlags, PollTimeout, poll};
+use nix::sys::wait::{WaitPidFlag, WaitStatus, waitpid};
+use nix::unistd::{ForkResult, chdir, fork};
+use std::ffi::{OsStr, OsString};
+use std::fs::{self, File, remove_file};
+use std::io::{ErrorKind, Read, Write};
+use std::os::fd::{AsFd, AsRawFd};
+use std::os::unix::ffi::{OsStrExt, OsStringExt};
+use std::os::unix::fs::PermissionsExt;
+use std::os::unix::net::{UnixListener, UnixStream};
+use std::path::{Path, PathBuf};
+use std::time::{Duration, Instant};
+use std::{env, io};
+
+use crate::daemon::{
+    DaemonContext, bind_socket, daemonize, get_runtime_base, get_socket_path, notify_daemon,
+    serve as serve_project,
+};
+
+/// How long a client gets to send its request
+const REQUEST_TIMEOUT: Duration = Duration::from_secs(1);
+/// Requests carry the shell's environment, which direnv is exec'd with, so
+/// they can't usefully be longer than the kernel allows for exec's arguments
+/// and environment together
+fn max_request_len() -> usize {
+    let arg_max = unsafe { nix::libc::sysconf(nix::libc::_SC_ARG_MAX) };
+    usize::try_from(arg_max).unwrap_or(2 * 1024 * 1024)
+}
+
+/// The shell's own bookkeeping, which evaluations never read
+const SHELL_STATE_PREFIX: &str = "__DIRENV_INSTANT_";
+
+pub fn enabled() -> bool {
+    env::var("DIRENV_INSTANT_SUPERVISOR").is_ok_and(|v| v == "1")
+}
+
+pub fn get_supervisor_socket() -> PathBuf {
+    get_runtime_base().join("supervisor.sock")
+}
+
+/// Everything the supervisor needs to run `direnv export` as if the shell did it
+struct EvalRequest {
+    shell_pid: i32,
+    envrc_dir: PathBuf,
+    cwd: PathBuf,
+    env: Vec<(OsString, OsString)>,
+}
+
+enum Request {
+    Eval(EvalRequest),
+    Stop,
+}
+
+/// Wire format: `EVAL <pid>\n` followed by NUL-terminated envrc dir, cwd and
+/// `KEY=VALUE` environment entries, or just `STOP\n`.
+fn encode_eval_request(shell_pid: i32, envrc_dir: &Path) -> io::Result<Vec<u8>> {
+    let mut request = format!("EVAL {shell_pid}\n").into_bytes();
+    for field in [envrc_dir.as_os_str(), env::current_dir()?.as_os_str()] {
+        request.extend_from_slice(field.as_bytes());
+        request.push(0);
+    }
+    for (key, value) in env::vars_os() {
+        if key.as_bytes().starts_with(SHELL_STATE_PREFIX.as_bytes()) {
+            continue;
+        }
+        request.extend_from_slice(key.as_bytes());
+        request.push(b'=');
+        request.extend_from_slice(value.as_bytes());
+        request.push(0);
+    }
+    Ok(request)
+}
+
+fn parse_request(request: &[u8]) -> Option<Request> {
+    if request.starts_with(b"STOP") {
+        return Some(Request::Stop);
+    }
+
+    let rest = request.strip_prefix(b"EVAL ")?;
+    let newline = rest.iter().position(|&b| b == b'\n')?;
+    let shell_pid = std::str::from_utf8(&rest[..newline]).ok()?.parse().ok()?;
+
+    let mut fields = rest[newline + 1..].split(|&b| b == 0);
+    let envrc_dir = PathBuf::from(OsStr::from_bytes(fields.next()?));
+    let cwd = PathBuf::from(OsStr::from_bytes(fields.next()?));
+    let env = fields
+        .filter_map(|entry| {
+            let eq = entry.iter().position(|&b| b == b'=')?;
+            Some((
+                OsString::from_vec(entry[..eq].to_vec()),
+                OsString::from_vec(entry[eq + 1..].to_vec()),
+            ))
+        })
+        .collect();
+
+    Some(Request::Eval(EvalRequest {
+        shell_pid,
+        envrc_dir,
+        cwd,
+        env,
+    }))
+}
+
+/// Hand an evaluation of `envrc_dir` to the per-user supervisor, starting it
+/// if it isn't running. Returns false if the request could not be delivered,
+/// or the environment is too large to evaluate with.
+pub fn request_eval(shell_pid: i32, envrc_dir: &Path) -> bool {
+    let request = encode_eval_request(shell_pid, envrc_dir);
+    let Some(request) = request.ok().filter(|r| r.len() <= max_request_len()) else {
+        return false;
+    };
+
+    let socket_path = get_supervisor_socket();
+    let stream = match UnixStream::connect(&socket_path) {
+        Ok(stream) => Ok(stream),
+        Err(_) => spawn_supervisor(&socket_path),
+    };
+
+    match stream {
+        Ok(mut stream) => stream.write_all(&request).is_ok(),
+        Err(e) => {
+            eprintln!("direnv-instant: Failed to start supervisor: {}", e);
+            false
+        }
+    }
+}
+
+pub fn stop_supervisor() {
+    if let Ok(mut stream) = UnixStream::connect(get_supervisor_socket()) {
+        let _ = stream.write_all(b"STOP\n");
+    }
+}
+
+fn bind_supervisor_socket(socket_path: &Path) -> io::Result<UnixListener> {
+    let runtime_base = get_runtime_base();
+    fs::create_dir_all(&runtime_base)?;
+    fs::set_permissions(&runtime_base, PermissionsExt::from_mode(0o700))?;
+
+    let _ = remove_file(socket_path); // Stale socket
+    UnixListener::bind(socket_path)
+}
+
+/// Bind the socket before forking so the caller can connect right away
+fn spawn_supervisor(socket_path: &Path) -> io::Result<UnixStream> {
+    // Serialise concurrent spawns from several shells
+    fs::create_dir_all(get_runtime_base())?;
+    let lock_file = File::create(get_runtime_base().join("supervisor.lock"))?;
+    let lock = Flock::lock(lock_file, FlockArg::LockExclusive).map_err(|(_, e)| e)?;
+
+    if let Ok(stream) = UnixStream::connect(socket_path) {
+        return Ok(stream); // Another shell won the race
+    }
+
+    let listener = bind_supervisor_socket(socket_path)?;
+    daemonize(|| {
+        // Close without unlocking, the lock is released when we return
+        unsafe { nix::libc::close(lock.as_raw_fd()) };
+        serve("direnv", listener, socket_path)
+    });
+    UnixStream::connect(socket_path)
+}
+
+/// Run the supervisor in the foreground, e.g. as a systemd user service
+pub fn run_foreground() {
+    let socket_path = get_supervisor_socket();
+    if UnixStream::connect(&socket_path).is_ok() {
+        eprintln!("direnv-instant: Supervisor already running");
+        std::process::exit(1);
+    }
+    match bind_supervisor_socket(&socket_path) {
+        Ok(listener) => serve("direnv", listener, &socket_path),
+        Err(e) => {
+            eprintln!("direnv-instant: Failed to bind supervisor socket: {}", e);
+            std::process::exit(1);
+        }
+    }
+}
+
+/// A connection that hasn't sent its whole request yet
+struct Client {
+    stream: UnixStream,
+    request: Vec<u8>,
+    deadline: Instant,
+}
+
+/// Serve requests from any number of shells at once: nothing a client does or
+/// doesn't send holds up the others
+fn serve(direnv_cmd: &str, listener: UnixListener, socket_path: &Path) {
+    if let Err(e) = listener.set_nonblocking(true) {
+        eprintln!(
+            "direnv-instant: Failed to make supervisor socket non-blocking: {}",
+            e
+        );
+        return;
+    }
+    let max_len = max_request_len();
+    let mut clients: Vec<Client> = Vec::new();
+
+    'serve: loop {
+        let now = Instant::now();
+        clients.retain(|c| c.deadline > now);
+        let timeout =
+            clients
+                .iter()
+                .map(|c| c.deadline)
+                .min()
+                .map_or(PollTimeout::NONE, |deadline| {
+                    PollTimeout::try_from(deadline - now + Duration::from_micros(999))
+                        .unwrap_or(PollTimeout::MAX)
+                });
+
+        let ready: Vec<bool> = {
+            let mut fds = vec![PollFd::new(listener.as_fd(), PollFlags::POLLIN)];
+            for client in &clients {
+                fds.push(PollFd::new(client.stream.as_fd(), PollFlags::POLLIN));
+            }
+            match poll(&mut fds, timeout) {
+                Ok(_) => {}
+                Err(Errno::EINTR) => continue,
+                Err(e) => {
+                    eprintln!("direnv-instant: Supervisor poll failed: {}", e);
+                    break;
+                }
+            }
+            fds.iter()
+                .map(|fd| fd.revents().is_some_and(|r| !r.is_empty()))
+                .collect()
+        };
+        reap_finished();
+
+        let mut requests = Vec::new();
+        let mut ready_clients = ready[1..].iter();
+        clients.retain_mut(|client| {
+            if !ready_clients.next().is_some_and(|r| *r) {
+                return true;
+            }
+            match read_available(client, max_len) {
+                Some(true) => {
+                    requests.push(std::mem::take(&mut client.request));
+                    false
+                }
+                Some(false) => true,
+                None => false,
+            }
+        });
+        if ready[0] {
+            accept_clients(&listener, &mut clients);
+        }
+
+        for request in requests {
+            match parse_request(&request) {
+                Some(Request::Eval(eval)) => handle_eval(direnv_cmd, &listener, &clients, eval),
+                Some(Request::Stop) => break 'serve,
+                None => eprintln!("direnv-instant: Invalid supervisor request"),
+            }
+        }
+    }
+
+    let _ = remove_file(socket_path);
+}
+
+fn accept_clients(listener: &UnixListener, clients: &mut Vec<Client>) {
+    loop {
+        match listener.accept() {
+            Ok((stream, _)) => {
+                if stream.set_nonblocking(true).is_ok() {
+                    clients.push(Client {
+                        stream,
+                        request: Vec::new(),
+                        deadline: Instant::now() + REQUEST_TIMEOUT,
+                    });
+                }
+            }
+            Err(e) if e.kind() == ErrorKind::WouldBlock => break,
+            Err(e) => {
+                eprintln!("direnv-instant: Supervisor accept failed: {}", e);
+                break;
+            }
+        }
+    }
+}
+
+/// Read what the client has sent so far. Returns whether its request is
+/// complete, which the client signals by closing its end, or `None` if the
+/// client is to be dropped.
+fn read_available(client: &mut Client, max_len: usize) -> Option<bool> {
+    let mut buf = [0u8; 64 * 1024];
+    loop {
+        match client.stream.read(&mut buf) {
+            Ok(0) => return Some(true),
+            Ok(n) => {
+                client.request.extend_from_slice(&buf[..n]);
+                if client.request.len() > max_len {
+                    return None;
+                }
+            }
+            Err(e) if e.kind() == ErrorKind::WouldBlock => return Some(false),
+            Err(e) if e.kind() == ErrorKind::Interrupted => {}
+            Err(_) => return None,
+        }
+    }
+}
+
+fn reap_finished() {
+    while let Ok(status) = waitpid(None, Some(WaitPidFlag::WNOHANG)) {
+        if status == WaitStatus::StillAlive {
+            break;
+        }
+    }
+}
+
+fn handle_eval(direnv_cmd: &str, listener: &UnixListener, clients: &[Client], eval: EvalRequest) {
+    // An evaluation is already in flight: just subscribe the shell to it
+    let socket_path = get_socket_path(&eval.envrc_dir);
+    if socket_path.exists() && notify_daemon(&socket_path, eval.shell_pid) {
+        return;
+    }
+    let _ = remove_file(&socket_path); // Stale socket
+
+    // Bind the evaluation's socket before forking, so shells asking for this
+    // project from now on subscribe to it right away
+    let Some(project_listener) = bind_socket(&DaemonContext::new(None, eval.envrc_dir.clone()))
+    else {
+        return;
+    };
+
+    match unsafe { fork() } {
+        Ok(ForkResult::Parent { .. }) => {}
+        Ok(ForkResult::Child) => {
+            // Don't keep the supervisor socket or its clients alive if the
+            // supervisor goes away
+            unsafe { nix::libc::close(listener.as_raw_fd()) };
+            for client in clients {
+                unsafe { nix::libc::close(client.stream.as_raw_fd()) };
+            }
+
+            // Evaluate with the requesting shell's environment and cwd.
+            // Safe because this forked child is single-threaded.
+            for (key, _) in env::vars_os() {
+                unsafe { env::remove_var(key) };
+            }
+            for (key, value) in eval.env {
+                unsafe { env::set_var(key, value) };
+            }
+            let _ = chdir(&eval.cwd);
+
+            serve_project(
+                direnv_cmd,
+                &DaemonContext::new(Some(eval.shell_pid), eval.envrc_dir),
+                project_listener,
+            );
+            std::process::exit(0);
+        }
+        Err(e) => {
+            eprintln!("direnv-instant: Supervisor fork failed: {}", e);
+            let _ = remove_file(&socket_path);
+        }
+    }
+}
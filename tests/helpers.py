@@ -5,10 +5,13 @@ from __future__ import annotations
 import os
 import shutil
 import subprocess
+import sys
+import time
+from pathlib import Path
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from pathlib import Path
+    from collections.abc import Callable
 
     from _pytest.monkeypatch import MonkeyPatch
 
@@ -35,6 +38,107 @@ def setup_stub_tmux(tmp_path: Path, script_body: str = "exit 0") -> Path:
     return stub_tmux
 
 
+def setup_stub_direnv(tmp_path: Path, script_body: str) -> Path:
+    """Create stub direnv script that shadows the real one."""
+    bash = shutil.which("bash")
+    if not bash:
+        msg = "bash not found in PATH"
+        raise RuntimeError(msg)
+
+    stub_dir = tmp_path / "stub-bin"
+    stub_dir.mkdir(exist_ok=True)
+    stub_direnv = stub_dir / "direnv"
+    stub_direnv.write_text(f"#!{bash}\n{script_body}\n")
+    stub_direnv.chmod(0o755)
+    return stub_dir
+
+
+# Enough of direnv for tests that don't need the real thing: sources the .envrc
+# from a function in `bash -c` like direnv's stdlib, with `watch_file`, exports
+# what changed, and reverts it again on unload. DIRENV_DIFF maps each variable
+# the project set to its previous value, DIRENV_WATCHES the watched files to
+# their mtimes, both as JSON.
+FAKE_DIRENV = """
+import json, os, shlex, subprocess, sys, tempfile, time
+
+LOAD = 'watch_file() { for f; do echo "$PWD/$f" >> "$w"; done; }; '
+LOAD += 'load() { source "$1" >&2; }; w=$2; load "$1"; env -0'
+SHELL_VARS = {"_", "PWD", "OLDPWD", "SHLVL"}
+DIRENV_VARS = {"DIRENV_DIR", "DIRENV_FILE", "DIRENV_DIFF", "DIRENV_WATCHES"}
+
+def mtime(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+if sys.argv[1:2] == ["watch-print"]:
+    watches = json.loads(os.environ.get("DIRENV_WATCHES") or "{}")
+    sys.stdout.write("".join(path + "\\0" for path in watches))
+if sys.argv[1:2] != ["export"]:
+    sys.exit(0)
+
+env = dict(os.environ)
+root = os.getcwd()
+while not os.path.exists(os.path.join(root, ".envrc")) and root != "/":
+    root = os.path.dirname(root)
+envrc = os.path.join(root, ".envrc")
+watches = json.loads(env.get("DIRENV_WATCHES") or "{}")
+if env.get("DIRENV_DIR") == "-" + root and all(
+    mtime(path) == stamp for path, stamp in watches.items()
+):
+    sys.exit(0)
+
+base = {k: v for k, v in env.items() if k not in DIRENV_VARS}
+for key, previous in json.loads(env.get("DIRENV_DIFF") or "{}").items():
+    if previous is None:
+        base.pop(key, None)
+    else:
+        base[key] = previous
+target, status = base, 0
+if os.path.exists(envrc):
+    print(f"direnv: loading {envrc}", file=sys.stderr, flush=True)
+    time.sleep(DELAY)
+    with tempfile.NamedTemporaryFile("r") as watched:
+        result = subprocess.run(
+            ["bash", "-c", LOAD, "bash", envrc, watched.name],
+            cwd=root, env=base, stdout=subprocess.PIPE, check=False,
+        )
+        paths = [envrc, *watched.read().splitlines()]
+    status = result.returncode
+    if status == 0:
+        entries = result.stdout.decode().split("\\0")
+        loaded = dict(e.split("=", 1) for e in entries if "=" in e)
+        target = {k: v for k, v in loaded.items() if k not in SHELL_VARS}
+        target |= {k: v for k, v in base.items() if k in SHELL_VARS}
+        changed = {k for k in target.keys() ^ base.keys() if k not in SHELL_VARS}
+        changed |= {k for k in target.keys() & base.keys() if target[k] != base[k]}
+        target["DIRENV_DIFF"] = json.dumps({k: base.get(k) for k in changed})
+        target["DIRENV_DIR"] = "-" + root
+    else:
+        print(f"direnv: error exit status {status}", file=sys.stderr)
+        target = dict(env)
+    target["DIRENV_WATCHES"] = json.dumps({p: mtime(p) for p in paths})
+
+out = [f"unset {k};" for k in env if k not in target and k not in SHELL_VARS]
+out += [f"export {k}={shlex.quote(v)};" for k, v in target.items() if env.get(k) != v]
+print("".join(out))
+sys.exit(status)
+"""
+
+
+def setup_fake_direnv(tmp_path: Path, delay: float = 0) -> Path:
+    """Create a fake direnv that shadows the real one, taking `delay` to load."""
+    stub_dir = tmp_path / "stub-bin"
+    stub_dir.mkdir(exist_ok=True)
+    fake_direnv = stub_dir / "direnv"
+    fake_direnv.write_text(f"#!{sys.executable}\nDELAY = {delay}\n{FAKE_DIRENV}")
+    fake_direnv.chmod(0o755)
+    return stub_dir
+
+
+def count_runs(runs: Path) -> int:
+    """Count the lines an .envrc appended to `runs` each time it was loaded."""
+    return len(runs.read_text().splitlines()) if runs.exists() else 0
+
+
 def setup_test_env(
     tmp_path: Path, shell_pid: int, mux_delay: str = "1"
 ) -> dict[str, str]:
@@ -47,6 +151,28 @@ def setup_test_env(
     return env
 
 
+def exported_path(result: subprocess.CompletedProcess[str], name: str) -> Path:
+    """Get the path `direnv-instant start` exported as `name`."""
+    prefix = f"export {name}="
+    for line in result.stdout.splitlines():
+        if line.startswith(prefix):
+            return Path(line.removeprefix(prefix).strip().strip("'\""))
+    msg = f"Could not find {name} in output"
+    raise AssertionError(msg)
+
+
+def wait_until(
+    condition: Callable[[], object], timeout: float = 10, interval: float = 0.05
+) -> bool:
+    """Poll until condition() holds, returning whether it did in time."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
 def allow_direnv(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
     """Change to test directory and allow direnv."""
     monkeypatch.chdir(tmp_path)
@@ -0,0 +1,449 @@
+"""Simulate many shells prompting in many projects at once.
+
+Each simulated shell is a forked process that only waits for SIGUSR1, and is
+driven by a thread that runs `start` the way the hooks do: it applies the
+exports, waits for the daemon's notification, thinks for a while, sometimes
+edits the .envrc or changes to another project, and runs `stop --leave` at
+the end. direnv and the multiplexer are stubs, so this runs offline.
+
+    python -m tests.load_harness --shells 50 --projects 10 --duration 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from tests.helpers import setup_fake_direnv, setup_stub_tmux
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# mkstemp() names, but not the log that shells pick up, env.stderr
+TEMP_FILE = re.compile(r"^(env|env_stderr)\.(?!stderr$)\w{6}$|\.tmp$")
+
+
+@dataclass
+class Report:
+    """What a load run measured."""
+
+    shells: int
+    projects: int
+    seconds: float
+    prompts: int = 0
+    cached_envs: int = 0
+    notifications: int = 0
+    missed_notifications: int = 0
+    start_ms: list[float] = field(default_factory=list)
+    notify_ms: list[float] = field(default_factory=list)
+    peak_daemons: int = 0
+    peak_daemon_rss_kb: int = 0
+    peak_total_rss_kb: int = 0
+    leaked_processes: list[str] = field(default_factory=list)
+    leaked_sockets: list[str] = field(default_factory=list)
+    leaked_temp_files: list[str] = field(default_factory=list)
+
+    @property
+    def leaks(self) -> int:
+        return (
+            len(self.leaked_processes)
+            + len(self.leaked_sockets)
+            + len(self.leaked_temp_files)
+        )
+
+    def summary(self) -> dict[str, object]:
+        summary: dict[str, object] = asdict(self)
+        del summary["start_ms"], summary["notify_ms"]
+        summary["prompts_per_second"] = self.prompts / self.seconds
+        summary["evaluations_per_second"] = self.notifications / self.seconds
+        for name, samples in [("start", self.start_ms), ("notify", self.notify_ms)]:
+            for p in [50, 90, 99, 100]:
+                summary[f"{name}_p{p}_ms"] = percentile(samples, p)
+        return summary
+
+    def format(self) -> str:
+        s = self.summary()
+        lines = [
+            f"{self.shells} shells, {self.projects} projects, "
+            f"{self.seconds:.1f}s",
+            f"  prompts       {self.prompts:>8} ({s['prompts_per_second']:.1f}/s), "
+            f"{self.cached_envs} given the cached env",
+            f"  evaluations   {self.notifications:>8} "
+            f"({s['evaluations_per_second']:.1f}/s), "
+            f"{self.missed_notifications} missed",
+        ]
+        for name in ["start", "notify"]:
+            lines.append(
+                f"  {name + ' ms':<14}"
+                + "".join(f"p{p}={s[f'{name}_p{p}_ms']:.1f} " for p in [50, 90, 99])
+                + f"max={s[f'{name}_p100_ms']:.1f}"
+            )
+        lines += [
+            f"  daemons       {self.peak_daemons:>8} at peak, "
+            f"{self.peak_daemon_rss_kb}KiB largest, "
+            f"{self.peak_total_rss_kb}KiB total",
+            f"  leaked        {len(self.leaked_processes)} processes, "
+            f"{len(self.leaked_sockets)} sockets, "
+            f"{len(self.leaked_temp_files)} temp files",
+        ]
+        lines += [f"    {leak}" for leak in self.leaked_processes]
+        lines += [f"    {leak}" for leak in self.leaked_sockets]
+        lines += [f"    {leak}" for leak in self.leaked_temp_files]
+        return "\n".join(lines)
+
+
+def percentile(samples: list[float], p: int) -> float:
+    """Nearest-rank percentile, 0 without samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[rank - 1]
+
+
+def spawn_listener() -> tuple[int, int]:
+    """Fork a stand-in shell that reports each SIGUSR1 on a pipe."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+        try:
+            while True:
+                signal.sigwait({signal.SIGUSR1})
+                os.write(write_fd, b".")
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def daemon_pids(binary: str) -> list[int]:
+    """Running processes of `binary`, except the harness's own `start`s."""
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            if os.readlink(entry / "exe") != binary:
+                continue
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid != os.getpid():
+            pids.append(int(entry.name))
+    return pids
+
+
+def rss_kb(pid: int) -> int:
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return 0
+    match = re.search(r"^VmRSS:\s+(\d+)", status, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def processes_mentioning(needle: str) -> list[str]:
+    """Command lines of running processes that contain `needle`."""
+    found = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit() or int(entry.name) == os.getpid():
+            continue
+        try:
+            cmdline = (entry / "cmdline").read_bytes().replace(b"\0", b" ")
+        except OSError:
+            continue
+        if needle.encode() in cmdline:
+            found.append(f"{entry.name}: {cmdline.decode(errors='replace').strip()}")
+    return found
+
+
+class Shell:
+    """One simulated interactive shell and its prompt loop."""
+
+    def __init__(
+        self, harness: Harness, projects: list[Path], rng: random.Random
+    ) -> None:
+        self.harness = harness
+        self.projects = projects
+        self.rng = rng
+        self.cwd = rng.choice(projects)
+        self.pid, self.notifications = spawn_listener()
+        self.env = dict(harness.env)
+        self.env["DIRENV_INSTANT_SHELL_PID"] = str(self.pid)
+
+    def run_command(self, args: list[str]) -> subprocess.CompletedProcess[str]:
+        return subprocess.run(
+            [self.harness.binary, *args],
+            check=False,
+            cwd=self.cwd,
+            env=self.env,
+            capture_output=True,
+            text=True,
+        )
+
+    def prompt(self) -> None:
+        # Notifications for prompts that timed out must not count for this one
+        while select.select([self.notifications], [], [], 0)[0]:
+            os.read(self.notifications, 64)
+
+        started = time.monotonic()
+        result = self.run_command(["start"])
+        self.harness.record_start((time.monotonic() - started) * 1000)
+        for line in result.stdout.splitlines():
+            if line.startswith("export "):
+                name, value = line[len("export ") :].split("=", 1)
+                self.env[name] = value.strip("'")
+            elif line.startswith("unset "):
+                self.env.pop(line[len("unset ") :], None)
+
+        if "__DIRENV_INSTANT_ENV_FILE" not in result.stdout:
+            return
+        if "__DIRENV_INSTANT_ENV_GEN=" in result.stdout:
+            self.harness.record_cached_env()
+            # Unless it is stale, no daemon runs after handing out the cache
+            runtime_dir = Path(self.env["__DIRENV_INSTANT_STDERR_FILE"]).parent
+            if not (runtime_dir / "daemon.sock").exists():
+                return
+        ready = select.select(
+            [self.notifications], [], [], self.harness.notify_timeout
+        )[0]
+        if ready:
+            os.read(self.notifications, 64)
+        self.harness.record_notify(
+            (time.monotonic() - started) * 1000 if ready else None
+        )
+
+    def run(
+        self, until: float, interval: float, edit_rate: float, cd_rate: float
+    ) -> None:
+        while time.monotonic() < until:
+            if self.rng.random() < edit_rate:
+                self.harness.edit(self.cwd)
+            if self.rng.random() < cd_rate:
+                self.cwd = self.rng.choice(self.projects)
+            self.prompt()
+            time.sleep(self.rng.expovariate(1 / interval))
+        self.run_command(["stop", "--leave"])
+
+    def exit(self) -> None:
+        os.kill(self.pid, signal.SIGKILL)
+        os.waitpid(self.pid, 0)
+        os.close(self.notifications)
+
+
+class Harness:
+    """Shared state of a load run."""
+
+    def __init__(
+        self, binary: str, root: Path, eval_seconds: float, notify_timeout: float
+    ) -> None:
+        self.binary = os.path.realpath(binary)
+        self.root = root
+        self.notify_timeout = notify_timeout
+        self.lock = threading.Lock()
+        self.report: Report
+
+        stub_dir = setup_fake_direnv(root, delay=eval_seconds)
+        setup_stub_tmux(stub_dir)
+
+        self.env = os.environ.copy()
+        for var in ["DIRENV_DIR", "DIRENV_DIFF", "DIRENV_WATCHES"]:
+            self.env.pop(var, None)
+        self.env["PATH"] = f"{stub_dir}:{self.env['PATH']}"
+        self.env["XDG_CACHE_HOME"] = str(root / "cache")
+        (root / "run").mkdir()
+        self.env["XDG_RUNTIME_DIR"] = str(root / "run")
+        self.env["TMUX"] = "test"
+        self.env["DIRENV_INSTANT_MUX_DELAY"] = "60"
+        self.env["DIRENV_INSTANT_DETACH_BUDGET"] = str(int(notify_timeout))
+
+    def edit(self, project: Path) -> None:
+        # Backdated, or the result would not be cached
+        mtime = time.time_ns() - 10**9
+        os.utime(project / ".envrc", ns=(mtime, mtime))
+
+    def record_start(self, ms: float) -> None:
+        with self.lock:
+            self.report.prompts += 1
+            self.report.start_ms.append(ms)
+
+    def record_cached_env(self) -> None:
+        with self.lock:
+            self.report.cached_envs += 1
+
+    def record_notify(self, ms: float | None) -> None:
+        with self.lock:
+            if ms is None:
+                self.report.missed_notifications += 1
+            else:
+                self.report.notifications += 1
+                self.report.notify_ms.append(ms)
+
+    def sample_daemons(self, stop: threading.Event) -> None:
+        while not stop.wait(0.1):
+            rss = [rss_kb(pid) for pid in daemon_pids(self.binary)]
+            with self.lock:
+                report = self.report
+                report.peak_daemons = max(report.peak_daemons, len(rss))
+                report.peak_daemon_rss_kb = max(
+                    report.peak_daemon_rss_kb, max(rss, default=0)
+                )
+                report.peak_total_rss_kb = max(report.peak_total_rss_kb, sum(rss))
+
+    def find_leaks(self, settle_seconds: float) -> None:
+        deadline = time.monotonic() + settle_seconds
+        while daemon_pids(self.binary) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        report = self.report
+        report.leaked_processes = [
+            f"{pid}: direnv-instant daemon" for pid in daemon_pids(self.binary)
+        ] + processes_mentioning(str(self.root / "bin"))
+        files = [
+            path
+            for state_dir in ["cache", "run"]
+            for path in (self.root / state_dir).rglob("*")
+            if path.is_file() or path.is_socket()
+        ]
+        report.leaked_sockets = sorted(str(p) for p in files if p.suffix == ".sock")
+        report.leaked_temp_files = sorted(
+            str(p) for p in files if TEMP_FILE.search(p.name)
+        )
+
+    def run(
+        self,
+        shells: int,
+        projects: int,
+        duration: float,
+        interval: float,
+        edit_rate: float,
+        cd_rate: float,
+        seed: int,
+    ) -> Report:
+        rng = random.Random(seed)
+        dirs = []
+        for i in range(projects):
+            project = self.root / f"project-{i}"
+            project.mkdir()
+            (project / ".envrc").write_text("export FOO=bar\n")
+            self.edit(project)
+            dirs.append(project)
+
+        self.report = Report(shells=shells, projects=projects, seconds=duration)
+        # Fork the listeners before any thread exists
+        simulated = [
+            Shell(self, dirs, random.Random(rng.random())) for _ in range(shells)
+        ]
+        stop_sampling = threading.Event()
+        sampler = threading.Thread(target=self.sample_daemons, args=(stop_sampling,))
+        sampler.start()
+
+        started = time.monotonic()
+        until = started + duration
+        threads = [
+            threading.Thread(
+                target=shell.run, args=(until, interval, edit_rate, cd_rate)
+            )
+            for shell in simulated
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.report.seconds = time.monotonic() - started
+        finally:
+            stop_sampling.set()
+            sampler.join()
+            for shell in simulated:
+                shell.exit()
+
+        self.find_leaks(settle_seconds=self.notify_timeout + 5)
+        return self.report
+
+
+def run(  # noqa: PLR0913
+    binary: str,
+    *,
+    shells: int = 20,
+    projects: int = 5,
+    duration: float = 10,
+    interval: float = 1.0,
+    edit_rate: float = 0.2,
+    cd_rate: float = 0.1,
+    eval_seconds: float = 0.2,
+    notify_timeout: float = 30,
+    seed: int = 0,
+) -> Report:
+    """Run a simulation in a scratch directory and report what it measured."""
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as root:
+        harness = Harness(binary, Path(root), eval_seconds, notify_timeout)
+        return harness.run(
+            shells, projects, duration, interval, edit_rate, cd_rate, seed
+        )
+
+
+def main() -> None:
+    default_binary = os.environ.get(
+        "DIRENV_INSTANT_BIN", str(PROJECT_ROOT / "target" / "debug" / "direnv-instant")
+    )
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--binary", default=default_binary)
+    parser.add_argument("--shells", type=int, default=20)
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="mean seconds between prompts"
+    )
+    parser.add_argument(
+        "--edit-rate", type=float, default=0.2, help="share of prompts after an edit"
+    )
+    parser.add_argument(
+        "--cd-rate", type=float, default=0.1, help="share of prompts after a cd"
+    )
+    parser.add_argument("--eval-seconds", type=float, default=0.2)
+    parser.add_argument(
+        "--notify-timeout",
+        type=float,
+        default=30,
+        help="seconds until a notification counts as missed",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON summary")
+    args = parser.parse_args()
+
+    report = run(
+        args.binary,
+        shells=args.shells,
+        projects=args.projects,
+        duration=args.duration,
+        interval=args.interval,
+        edit_rate=args.edit_rate,
+        cd_rate=args.cd_rate,
+        eval_seconds=args.eval_seconds,
+        notify_timeout=args.notify_timeout,
+        seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(report.summary(), indent=2))  # noqa: T201
+    else:
+        print(report.format())  # noqa: T201
+    sys.exit(1 if report.leaks or report.missed_notifications else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Benchmark the prompt path of start and gate it against stored baselines.
+
+Latencies are measured as the median overhead of start above spawning a
+trivial process in the same conditions, which keeps the baselines portable
+between machines. Timings are only meaningful on an otherwise idle machine, so
+the benchmark is opt-in and never runs in parallel with other tests: run it
+with DIRENV_INSTANT_BENCH=1 and `-n 0`. Add DIRENV_INSTANT_BENCH_UPDATE=1 to
+raise the baselines to the measured values. Baselines are kept per direnv
+flavour, as the real direnv is slower than the stub.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_fake_direnv,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get("DIRENV_INSTANT_BENCH") != "1"
+    or "PYTEST_XDIST_WORKER" in os.environ,
+    reason="set DIRENV_INSTANT_BENCH=1 and run with -n 0 to benchmark",
+)
+
+ITERATIONS = 40
+TREE_DEPTH = 40
+BASELINES = Path(__file__).parent / "benchmark_baselines.json"
+
+
+class Bench:
+    """A project environment for one direnv flavour."""
+
+    def __init__(
+        self,
+        tmp_path: Path,
+        cache_dir: str,
+        shell_pid: int,
+        monkeypatch: MonkeyPatch,
+        direnv_instant: DirenvInstantRunner,
+        *,
+        stub: bool,
+    ) -> None:
+        self.tmp_path = tmp_path
+        self.cache_dir = Path(cache_dir)
+        self.monkeypatch = monkeypatch
+        self.direnv_instant = direnv_instant
+        self.stub = stub
+        self.env = os.environ.copy()
+        for var in ["DIRENV_DIR", "DIRENV_DIFF", "DIRENV_WATCHES"]:
+            self.env.pop(var, None)
+        self.env["XDG_CACHE_HOME"] = cache_dir
+        self.env["XDG_RUNTIME_DIR"] = cache_dir
+        self.env["TMUX"] = "test"
+        self.env["DIRENV_INSTANT_MUX_DELAY"] = "60"
+        self.env["DIRENV_INSTANT_SHELL_PID"] = str(shell_pid)
+        if stub:
+            stub_dir = setup_fake_direnv(tmp_path)
+            self.env["PATH"] = f"{stub_dir}:{self.env['PATH']}"
+
+    def project(self, name: str, envrc: str = "export FOO=bar\n") -> Path:
+        project = self.tmp_path / name
+        project.mkdir(parents=True)
+        setup_envrc(project, envrc)
+        # Written just before the evaluation starts, it would not be cached
+        past = time.time() - 60
+        os.utime(project / ".envrc", (past, past))
+        if not self.stub:
+            allow_direnv(project, self.monkeypatch)
+        return project
+
+    def start(self, cwd: Path) -> subprocess.CompletedProcess[str]:
+        self.monkeypatch.chdir(cwd)
+        result = self.direnv_instant.run(["start"], self.env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        return result
+
+    def evaluated(self, project: Path, cwd: Path | None = None) -> None:
+        """Evaluate `project` and make the next prompts hit the fresh cache."""
+        result = self.start(cwd or project)
+        env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+        assert wait_until(
+            lambda: (env_file.parent / "watches").exists(), timeout=30
+        ), "Evaluation did not finish"
+        self.env["__DIRENV_INSTANT_CURRENT_DIR"] = str(project)
+        self.env["__DIRENV_INSTANT_ENV_FILE"] = str(env_file)
+
+    def settle(self) -> None:
+        """Wait for the daemons started by the scenario to exit."""
+        assert wait_until(
+            lambda: not any(self.cache_dir.glob("direnv-instant/*/daemon.sock")),
+            timeout=60,
+        ), "Daemons did not exit"
+
+    def overhead_ms(self, cwds: list[Path], command: list[str] | None = None) -> float:
+        """Median latency of start, or `command`, above spawning `true`."""
+        true = shutil.which("true")
+        assert true, "true not found in PATH"
+        overheads = []
+        for cwd in cwds:
+            self.monkeypatch.chdir(cwd)
+            begin = time.perf_counter()
+            subprocess.run(
+                [true], check=True, env=self.env, capture_output=True, text=True
+            )
+            spawn = time.perf_counter() - begin
+            begin = time.perf_counter()
+            if command is None:
+                result = self.direnv_instant.run(["start"], self.env)
+            else:
+                result = subprocess.run(
+                    command, check=False, env=self.env, capture_output=True, text=True
+                )
+            overheads.append((time.perf_counter() - begin - spawn) * 1000)
+            assert result.returncode == 0, f"Failed: {result.stderr}"
+        return statistics.median(overheads)
+
+
+def scenario_no_envrc(bench: Bench) -> float:
+    cwd = bench.tmp_path / "no-project"
+    cwd.mkdir()
+    measured = bench.overhead_ms([cwd] * ITERATIONS)
+    # start used to exec direnv on every prompt outside a project, so that
+    # path cost at least a direnv run
+    direnv_exec = bench.overhead_ms([cwd] * ITERATIONS, ["direnv", "export", "zsh"])
+    assert measured < direnv_exec, (
+        f"start outside a project ({measured:.2f}ms) is no faster than "
+        f"running direnv ({direnv_exec:.2f}ms)"
+    )
+    return measured
+
+
+def scenario_running_daemon(bench: Bench) -> float:
+    marker = bench.tmp_path / "done"
+    project = bench.project(
+        "busy", f"while [ ! -f {marker} ]; do sleep 0.1; done\nexport FOO=bar\n"
+    )
+    bench.start(project)
+    bench.env["__DIRENV_INSTANT_CURRENT_DIR"] = str(project)
+    try:
+        return bench.overhead_ms([project] * ITERATIONS)
+    finally:
+        marker.touch()
+
+
+def scenario_fresh_cache(bench: Bench) -> float:
+    project = bench.project("fresh")
+    bench.evaluated(project)
+    return bench.overhead_ms([project] * ITERATIONS)
+
+
+def scenario_cold_evaluation(bench: Bench) -> float:
+    samples = []
+    for i in range(ITERATIONS):
+        samples.append(bench.overhead_ms([bench.project(f"cold-{i}")]))
+        # Keep earlier evaluations from competing with the next prompt
+        bench.settle()
+    return statistics.median(samples)
+
+
+def scenario_deep_tree(bench: Bench) -> float:
+    project = bench.project("deep")
+    cwd = project.joinpath(*[f"d{i}" for i in range(TREE_DEPTH)])
+    cwd.mkdir(parents=True)
+    bench.evaluated(project, cwd)
+    return bench.overhead_ms([cwd] * ITERATIONS)
+
+
+SCENARIOS = {
+    "no_envrc": scenario_no_envrc,
+    "running_daemon": scenario_running_daemon,
+    "fresh_cache": scenario_fresh_cache,
+    "cold_evaluation": scenario_cold_evaluation,
+    "deep_tree": scenario_deep_tree,
+}
+
+
+@pytest.fixture
+def shell_pid() -> Generator[int]:
+    """A long-lived stand-in for the shell that ignores the daemons' SIGUSR1."""
+    shell = subprocess.Popen(["bash", "-c", "trap '' USR1; while :; do sleep 1; done"])
+    try:
+        yield shell.pid
+    finally:
+        shell.kill()
+        shell.wait()
+
+
+@pytest.mark.parametrize("flavour", ["stub", "real"])
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_benchmark_start_latency(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    shell_pid: int,
+    scenario: str,
+    flavour: str,
+) -> None:
+    """Test the median start overhead of a scenario stays within its baseline."""
+    if flavour == "real" and not shutil.which("direnv"):
+        pytest.skip("direnv is not installed")
+
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        bench = Bench(
+            tmp_path,
+            cache_dir,
+            shell_pid,
+            monkeypatch,
+            direnv_instant,
+            stub=flavour == "stub",
+        )
+        try:
+            measured = SCENARIOS[scenario](bench)
+        finally:
+            bench.settle()
+
+    baselines = json.loads(BASELINES.read_text())
+    recorded = baselines.setdefault(flavour, {})
+    if os.environ.get("DIRENV_INSTANT_BENCH_UPDATE") == "1":
+        recorded[scenario] = max(recorded.get(scenario, 0), round(measured, 2))
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+    if scenario not in recorded:
+        pytest.skip(f"no {flavour} baseline, set DIRENV_INSTANT_BENCH_UPDATE=1")
+
+    tolerance = float(os.environ.get("DIRENV_INSTANT_BENCH_TOLERANCE", "2"))
+    # Timer noise dominates below a millisecond
+    budget = recorded[scenario] * tolerance + 1
+    assert measured <= budget, (
+        f"{scenario} ({flavour} direnv) regressed: {measured:.2f}ms over "
+        f"spawning a process, budget {budget:.2f}ms"
+    )
@@ -0,0 +1,85 @@
+"""Stress test the daemon's control socket with many concurrent clients."""
+
+from __future__ import annotations
+
+import signal
+import socket
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+CLIENTS = 200
+
+
+def notify(socket_path: Path, pid: int) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(10)
+        sock.connect(str(socket_path))
+        sock.sendall(f"NOTIFY {pid}\n".encode())
+
+
+def test_daemon_serves_many_clients(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test hundreds of NOTIFY clients are served despite a stalled client."""
+    done_marker = tmp_path / "envrc_done"
+    setup_envrc(
+        tmp_path,
+        f"while [ ! -f {done_marker} ]; do sleep 0.1; done\nexport FOO=bar\n",
+    )
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    assert wait_until(socket_path.exists), "Daemon socket not created"
+
+    # Subscribers that SIGUSR1 terminates, so we can tell they were notified
+    subscribers = [subprocess.Popen(["sleep", "60"]) for _ in range(CLIENTS)]
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # Connects but never finishes its request
+        stalled.connect(str(socket_path))
+        stalled.sendall(b"NOT")
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            for future in [
+                pool.submit(notify, socket_path, p.pid) for p in subscribers
+            ]:
+                future.result()
+        assert time.time() - start < 5, "NOTIFY clients were served too slowly"
+
+        done_marker.touch()
+        assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+        for subscriber in subscribers:
+            assert subscriber.wait(timeout=10) == -signal.SIGUSR1
+    finally:
+        stalled.close()
+        for subscriber in subscribers:
+            subscriber.kill()
+            subscriber.wait()
@@ -0,0 +1,99 @@
+"""Test that the .envrc lookup is memoised and notices created/deleted files."""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import TYPE_CHECKING
+
+from tests.helpers import setup_envrc, setup_stub_direnv
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_envrc_lookup_is_cached(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test lookup results are reused cheaply and invalidated when stale."""
+    project = tmp_path / "project"
+    deep_dir = project / "a" / "b" / "c" / "d"
+    deep_dir.mkdir(parents=True)
+    monkeypatch.chdir(deep_dir)
+
+    # Keep our own writes out of the directories being searched
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    debug_log = state_dir / "debug.log"
+    stub_dir = setup_stub_direnv(state_dir, "exit 0")
+    env = os.environ.copy()
+    env["PATH"] = f"{stub_dir}:{env['PATH']}"
+    env["XDG_CACHE_HOME"] = str(state_dir / "cache")
+    env["DIRENV_INSTANT_DEBUG_LOG"] = str(debug_log)
+    for var in ["TMUX", "ZELLIJ", "TERM_PROGRAM", "KITTY_LISTEN_ON", "DIRENV_DIR"]:
+        env.pop(var, None)
+
+    def start() -> tuple[str, str]:
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        lookups = re.findall(r"envrc lookup .*", debug_log.read_text())
+        return result.stdout, lookups[-1]
+
+    cache_file = state_dir / "cache" / "direnv-instant" / "envrc-lookup"
+
+    def stats(lookup: str) -> int:
+        return int(re.search(r"(\d+) stats", lookup).group(1))
+
+    stdout, lookup = start()
+    assert "unset __DIRENV_INSTANT_CURRENT_DIR" in stdout
+    assert "(walked)" in lookup
+
+    # A hit stats each ancestor instead of looking for an .envrc in it
+    stdout, lookup = start()
+    assert "unset __DIRENV_INSTANT_CURRENT_DIR" in stdout
+    assert "(cached)" in lookup
+    ancestors = len(deep_dir.parents) + 1
+    assert stats(lookup) == ancestors
+
+    # Unrelated changes in the directory keep the entry usable, without
+    # rewriting the cache
+    written = cache_file.stat().st_mtime_ns
+    (deep_dir / "notes.txt").write_text("hello")
+    stdout, lookup = start()
+    assert "unset __DIRENV_INSTANT_CURRENT_DIR" in stdout
+    assert "(cached)" in lookup
+    assert stats(lookup) == ancestors + 1
+    assert cache_file.stat().st_mtime_ns == written
+
+    # Creating an .envrc in the directory invalidates the negative entry
+    setup_envrc(deep_dir, "export FOO=bar\n")
+    stdout, lookup = start()
+    assert f"export __DIRENV_INSTANT_CURRENT_DIR='{deep_dir}'" in stdout
+    assert "(walked)" in lookup
+
+    # ...and deleting it the positive one
+    (deep_dir / ".envrc").unlink()
+    stdout, lookup = start()
+    assert "unset __DIRENV_INSTANT_CURRENT_DIR" in stdout
+    assert "(walked)" in lookup
+
+    # Creating one in an ancestor is noticed right away too
+    setup_envrc(project / "a", "export FOO=bar\n")
+    stdout, lookup = start()
+    assert f"export __DIRENV_INSTANT_CURRENT_DIR='{project / 'a'}'" in stdout
+    assert "(walked)" in lookup
+
+    stdout, lookup = start()
+    assert f"export __DIRENV_INSTANT_CURRENT_DIR='{project / 'a'}'" in stdout
+    assert "(cached)" in lookup
+    assert stats(lookup) == 4
+
+    # Deleting the root's .envrc invalidates the positive entry right away
+    (project / "a" / ".envrc").unlink()
+    stdout, lookup = start()
+    assert "unset __DIRENV_INSTANT_CURRENT_DIR" in stdout
+    assert "(walked)" in lookup
@@ -0,0 +1,66 @@
+"""Test that concurrent evaluations are capped by DIRENV_INSTANT_MAX_JOBS."""
+
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_evaluations_share_job_slots(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test three projects entered at once are evaluated in turn, in order."""
+    setup_stub_tmux(tmp_path)
+    log = tmp_path / "log"
+    projects = []
+    for name in ["a", "b", "c"]:
+        project = tmp_path / name
+        project.mkdir()
+        setup_envrc(
+            project,
+            f"echo start {name} >> {log}\nsleep 0.3\necho end >> {log}\n"
+            f"export P={name}\n",
+        )
+        allow_direnv(project, monkeypatch)
+        projects.append(project)
+
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        waiters = [SignalWaiter() for _ in projects]
+        try:
+            for project, waiter in zip(projects, waiters, strict=True):
+                env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+                env["XDG_CACHE_HOME"] = cache_dir
+                env["XDG_RUNTIME_DIR"] = cache_dir
+                env["DIRENV_INSTANT_MAX_JOBS"] = "1"
+                monkeypatch.chdir(project)
+                result = direnv_instant.run(["start"], env)
+                assert result.returncode == 0, f"Failed: {result.stderr}"
+                # Let its daemon get in line before the next one
+                time.sleep(0.1)
+
+            for waiter in waiters:
+                assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+        finally:
+            for waiter in waiters:
+                waiter.cleanup()
+
+    # Each evaluation ended before the next one started, in order of arrival
+    assert log.read_text().splitlines() == [
+        line for name in ["a", "b", "c"] for line in [f"start {name}", "end"]
+    ]
@@ -0,0 +1,102 @@
+"""Test that an .envrc direnv failed on isn't evaluated again until it changes."""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    import subprocess
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def write_envrc(tmp_path: Path, monkeypatch: MonkeyPatch, content: str) -> None:
+    # Backdated, so the result isn't dismissed as racing with the edit
+    envrc = setup_envrc(tmp_path, content)
+    allow_direnv(tmp_path, monkeypatch)
+    past = time.time() - 10
+    os.utime(envrc, (past, past))
+
+
+def prompt(
+    tmp_path: Path,
+    direnv_instant: DirenvInstantRunner,
+    waiter: SignalWaiter,
+    failed: str | None = None,
+) -> subprocess.CompletedProcess[str]:
+    env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    if failed is not None:
+        env["__DIRENV_INSTANT_FAILED"] = failed
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    return result
+
+
+def failed_key(stdout: str) -> str:
+    return next(
+        line.split("=", 1)[1].strip("'")
+        for line in stdout.splitlines()
+        if line.startswith("__DIRENV_INSTANT_FAILED=")
+    )
+
+
+def test_failed_envrc_is_not_retried(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the failure is cached, shown once per shell, and retried on edits."""
+    write_envrc(tmp_path, monkeypatch, "echo broken-envrc >&2\nexit 1\n")
+    setup_stub_tmux(tmp_path)
+
+    waiter = SignalWaiter()
+    try:
+        result = prompt(tmp_path, direnv_instant, waiter)
+        key = failed_key(result.stdout)
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+    assert "broken-envrc" in stderr_file.read_text()
+
+    # The shell that saw the error from the hook isn't shown it again, and
+    # neither it nor a new shell starts another evaluation
+    for failed, shown in [(key, False), (None, True)]:
+        waiter = SignalWaiter()
+        try:
+            result = prompt(tmp_path, direnv_instant, waiter, failed)
+            assert ("broken-envrc" in result.stderr) == shown
+            assert not socket_path.exists(), "Daemon was started for a failed envrc"
+            assert not waiter.wait(timeout=0.5), "Failed envrc was evaluated again"
+        finally:
+            waiter.cleanup()
+
+    # Fixing the .envrc evaluates it again
+    write_envrc(tmp_path, monkeypatch, "export FIXED=1\n")
+    waiter = SignalWaiter()
+    try:
+        result = prompt(tmp_path, direnv_instant, waiter, key)
+        assert failed_key(result.stdout) != key
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+        assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+        assert "FIXED" in env_file.read_text()
+        assert not env_file.with_suffix(".failed").exists()
+    finally:
+        waiter.cleanup()
@@ -0,0 +1,98 @@
+"""Test that a failed evaluation is retried once a file direnv watches changes."""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    count_runs,
+    exported_path,
+    setup_envrc,
+    setup_fake_direnv,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    import subprocess
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+# Fails while `dep`, which it watches, says so
+ENVRC = """watch_file dep
+echo run >> runs
+if grep -q broken dep; then echo dep-is-broken >&2; exit 1; fi
+export FIXED=1
+"""
+
+
+def write_backdated(path: Path, content: str) -> None:
+    # Backdated, so the result isn't dismissed as racing with the edit
+    path.write_text(content)
+    past = time.time() - 10
+    os.utime(path, (past, past))
+
+
+def prompt(
+    tmp_path: Path, direnv_instant: DirenvInstantRunner, waiter: SignalWaiter
+) -> subprocess.CompletedProcess[str]:
+    env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+    env["PATH"] = f"{setup_fake_direnv(tmp_path)}:{env['PATH']}"
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    return result
+
+
+def test_failure_is_retried_when_watched_file_changes(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the failure is cached until a watched file other than .envrc changes."""
+    setup_envrc(tmp_path, ENVRC)
+    write_backdated(tmp_path / "dep", "broken\n")
+    past = time.time() - 10
+    os.utime(tmp_path / ".envrc", (past, past))
+    setup_stub_tmux(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    runs = tmp_path / "runs"
+
+    waiter = SignalWaiter()
+    try:
+        result = prompt(tmp_path, direnv_instant, waiter)
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+    assert "dep-is-broken" in stderr_file.read_text()
+    assert count_runs(runs) == 1
+
+    waiter = SignalWaiter()
+    try:
+        prompt(tmp_path, direnv_instant, waiter)
+        assert not socket_path.exists(), "Daemon was started for a failed envrc"
+        assert count_runs(runs) == 1
+    finally:
+        waiter.cleanup()
+
+    # Fixing the file the .envrc depends on evaluates it again
+    write_backdated(tmp_path / "dep", "fixed\n")
+    waiter = SignalWaiter()
+    try:
+        prompt(tmp_path, direnv_instant, waiter)
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+        assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+        assert count_runs(runs) == 2
+        assert "FIXED" in env_file.read_text()
+    finally:
+        waiter.cleanup()
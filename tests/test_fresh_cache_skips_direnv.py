@@ -0,0 +1,74 @@
+"""Test that start does not re-run direnv while nothing it watches changed."""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    count_runs,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def wait_for_runs(counter: Path, expected: int) -> int:
+    wait_until(lambda: count_runs(counter) >= expected)
+    return count_runs(counter)
+
+
+def test_fresh_cache_skips_direnv(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test that a fresh cache short-circuits start without spawning a daemon."""
+    counter = tmp_path / "runs"
+    envrc_content = f"echo run >> {counter}\nexport FOO=bar\n"
+    setup_envrc(tmp_path, envrc_content)
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+
+    assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+    assert wait_for_runs(counter, 1) == 1
+
+    assert wait_until(lambda: not socket_path.exists()), (
+        "Daemon did not exit after evaluation"
+    )
+
+    # Next prompt in the same project with the env applied
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    env["__DIRENV_INSTANT_ENV_FILE"] = str(env_file)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert not socket_path.exists(), "Daemon was started despite a fresh cache"
+    time.sleep(1)
+    assert count_runs(counter) == 1, "direnv was re-run"
+
+    # Changing the .envrc makes the cache stale again
+    setup_envrc(tmp_path, envrc_content + "export BAZ=qux\n")
+    allow_direnv(tmp_path, monkeypatch)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert wait_for_runs(counter, 2) == 2, "direnv was not re-run after a change"
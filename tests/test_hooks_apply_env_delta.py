@@ -0,0 +1,97 @@
+"""Test that shells behind by one generation only apply the changed variables."""
+
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import PROJECT_ROOT, SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def evaluate(direnv_instant: DirenvInstantRunner, env: dict[str, str]) -> Path:
+    waiter = SignalWaiter()
+    try:
+        env["DIRENV_INSTANT_SHELL_PID"] = str(waiter.pid)
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+
+    return exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+
+
+def test_hooks_apply_env_delta(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the daemon writes a delta and the hook prefers it over the full env."""
+    setup_envrc(tmp_path, "export SAME=same\nexport FOO=one\nexport GONE=gone\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+    env = setup_test_env(tmp_path, 0)
+
+    env_file = evaluate(direnv_instant, env)
+    gen_file = Path(f"{env_file}.gen")
+    delta_file = Path(f"{env_file}.delta")
+    first_gen = gen_file.read_text().strip()
+    assert not delta_file.exists()
+
+    setup_envrc(tmp_path, "export SAME=same\nexport FOO=two\nexport BAR=new\n")
+    allow_direnv(tmp_path, monkeypatch)
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    assert evaluate(direnv_instant, env) == env_file
+    second_gen = gen_file.read_text().strip()
+
+    header, *statements = delta_file.read_text().splitlines()
+    assert header == f"# {first_gen} {second_gen}"
+    assert any("FOO=two" in s for s in statements)
+    assert any("BAR=new" in s for s in statements)
+    assert not any("SAME" in s for s in statements)
+    assert "unset GONE;" in statements
+
+    # Tell whether the hook evaluated the full env or just the delta
+    with env_file.open("a") as f:
+        f.write("FULL=1\n")
+
+    stub_dir = tmp_path / "stub-bin"
+    stub_dir.mkdir()
+    stub = stub_dir / "direnv-instant"
+    stub.write_text("#!/usr/bin/env bash\nexit 0\n")
+    stub.chmod(0o755)
+
+    script = f"""
+source {PROJECT_ROOT / "hooks" / "bash.sh"}
+__DIRENV_INSTANT_ENV_FILE={env_file}
+SAME=stale FOO=one GONE=gone __DIRENV_INSTANT_ENV_GEN={first_gen}
+_direnv_hook
+echo "$SAME $FOO $BAR ${{GONE:-unset}} ${{FULL:-delta}}"
+SAME=stale __DIRENV_INSTANT_ENV_GEN=unrelated
+_direnv_hook
+echo "$SAME $FOO $BAR ${{GONE:-unset}} ${{FULL:-delta}}"
+"""
+    shell_env = env | {"PATH": f"{stub_dir}:{env['PATH']}"}
+    result = subprocess.run(
+        ["bash", "-c", script],
+        check=False,
+        env=shell_env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert result.stdout.splitlines() == [
+        "stale two new unset delta",
+        "same two new unset 1",
+    ]
@@ -0,0 +1,76 @@
+"""Test that the bash hook only re-evaluates the cached env when it changed."""
+
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import PROJECT_ROOT
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def test_hooks_skip_unchanged_env(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test the daemon stamps the env and prompts skip an applied generation."""
+    setup_envrc(tmp_path, "export FOO=bar\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid)
+
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+
+    gen_file = Path(f"{env_file}.gen")
+    assert gen_file.read_text().strip(), "Env generation was not written"
+
+    # Count how often the shell evaluates the cached env
+    with env_file.open("a") as f:
+        f.write("EVALS=$((EVALS + 1))\n")
+
+    # Stand-in for the real binary, the hook only evals what start prints
+    stub_dir = tmp_path / "stub-bin"
+    stub_dir.mkdir()
+    stub = stub_dir / "direnv-instant"
+    stub.write_text("#!/usr/bin/env bash\nexit 0\n")
+    stub.chmod(0o755)
+
+    script = f"""
+source {PROJECT_ROOT / "hooks" / "bash.sh"}
+__DIRENV_INSTANT_ENV_FILE={env_file}
+_direnv_hook; _direnv_hook; _direnv_hook
+echo "$FOO $EVALS"
+echo changed > {gen_file}
+_direnv_hook; _direnv_hook
+echo "$FOO $EVALS"
+"""
+    shell_env = env | {"PATH": f"{stub_dir}:{env['PATH']}"}
+    result = subprocess.run(
+        ["bash", "-c", script],
+        check=False,
+        env=shell_env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert result.stderr == ""
+    assert result.stdout.splitlines() == ["bar 1", "bar 2"]
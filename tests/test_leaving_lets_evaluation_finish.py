@@ -0,0 +1,77 @@
+"""Test that leaving a project lets its evaluation finish in the background."""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def enter(
+    project: Path,
+    env: dict[str, str],
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+) -> tuple[Path, Path]:
+    """Run start in `project` like a prompt would.
+
+    Returns its env file and the socket of its daemon.
+    """
+    monkeypatch.chdir(project)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(project)
+    paths = {}
+    for line in result.stdout.splitlines():
+        name, _, value = line.removeprefix("export ").partition("=")
+        paths[name] = Path(value.strip("'\""))
+    env_file = paths.get("__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = paths.get("__DIRENV_INSTANT_STDERR_FILE")
+    assert env_file, "Could not find __DIRENV_INSTANT_ENV_FILE in output"
+    assert stderr_file, "Could not find __DIRENV_INSTANT_STDERR_FILE in output"
+    return env_file, stderr_file.parent / "daemon.sock"
+
+
+def test_leaving_lets_evaluation_finish(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test detaching by default, and cancelling with DIRENV_INSTANT_ON_LEAVE=stop."""
+    setup_stub_tmux(tmp_path)
+    projects = {}
+    for name in ["detached", "stopped", "other"]:
+        project = tmp_path / name
+        project.mkdir()
+        slow = "" if name == "other" else "sleep 1\n"
+        setup_envrc(project, f"{slow}export P={name}\n")
+        allow_direnv(project, monkeypatch)
+        projects[name] = project
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+    detached_env, _ = enter(projects["detached"], env, monkeypatch, direnv_instant)
+    enter(projects["other"], env, monkeypatch, direnv_instant)
+
+    env["DIRENV_INSTANT_ON_LEAVE"] = "stop"
+    stopped_env, stopped_socket = enter(
+        projects["stopped"], env, monkeypatch, direnv_instant
+    )
+    enter(projects["other"], env, monkeypatch, direnv_instant)
+
+    time.sleep(2)
+    assert "detached" in detached_env.read_text(), "Detached evaluation was killed"
+    assert not stopped_env.exists(), "Evaluation kept running after leaving"
+    assert not stopped_socket.exists()
@@ -0,0 +1,36 @@
+"""Test that many shells across projects leave nothing behind."""
+
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from tests import load_harness
+
+if TYPE_CHECKING:
+    from tests.conftest import DirenvInstantRunner
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="inspects /proc")
+def test_load_harness_finds_no_leaks(direnv_instant: DirenvInstantRunner) -> None:
+    """Test a short simulated load notifies every shell and leaks nothing."""
+    report = load_harness.run(
+        direnv_instant.binary_path,
+        shells=8,
+        projects=3,
+        duration=3,
+        interval=0.3,
+        eval_seconds=0.1,
+        notify_timeout=10,
+    )
+    summary = report.format()
+
+    assert report.prompts >= 8, summary
+    assert report.notifications > 0, summary
+    assert report.missed_notifications == 0, summary
+    assert report.peak_daemons > 0, summary
+    assert not report.leaked_processes, summary
+    assert not report.leaked_sockets, summary
+    assert not report.leaked_temp_files, summary
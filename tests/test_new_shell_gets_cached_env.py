@@ -0,0 +1,86 @@
+"""Test that a shell entering a project gets its cached env on the first prompt."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    import subprocess
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def new_shell_prompt(
+    tmp_path: Path, direnv_instant: DirenvInstantRunner, waiter: SignalWaiter
+) -> subprocess.CompletedProcess[str]:
+    """Run start for a shell that has no env applied."""
+    env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+    for var in [
+        "__DIRENV_INSTANT_CURRENT_DIR",
+        "__DIRENV_INSTANT_ENV_FILE",
+        "DIRENV_DIR",
+        "DIRENV_DIFF",
+    ]:
+        env.pop(var, None)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    return result
+
+
+def test_new_shell_gets_cached_env(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the cached env is printed inline and revalidated only when stale."""
+    setup_envrc(tmp_path, "export FOO=first\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    # Nothing cached yet, the first shell has to wait for the daemon
+    waiter = SignalWaiter()
+    try:
+        result = new_shell_prompt(tmp_path, direnv_instant, waiter)
+        assert "FOO" not in result.stdout
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    generation = env_file.with_suffix(".gen").read_text().strip()
+    assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+
+    # A new pane gets the env right away, and as it is fresh no daemon runs
+    waiter = SignalWaiter()
+    try:
+        result = new_shell_prompt(tmp_path, direnv_instant, waiter)
+        assert "FOO=first" in result.stdout
+        assert f"__DIRENV_INSTANT_ENV_GEN='{generation}'" in result.stdout
+        assert not socket_path.exists(), "Daemon was started despite a fresh cache"
+    finally:
+        waiter.cleanup()
+
+    # A stale cache is still shown at once, then replaced in the background
+    setup_envrc(tmp_path, "export FOO=second\n")
+    allow_direnv(tmp_path, monkeypatch)
+    waiter = SignalWaiter()
+    try:
+        result = new_shell_prompt(tmp_path, direnv_instant, waiter)
+        assert "FOO=first" in result.stdout
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+        assert "FOO=second" in env_file.read_text()
+        assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+    finally:
+        waiter.cleanup()
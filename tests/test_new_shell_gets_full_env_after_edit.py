@@ -0,0 +1,77 @@
+"""Test that re-evaluating from a loaded shell caches the project's whole env."""
+
+from __future__ import annotations
+
+import subprocess
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    exported_path,
+    setup_envrc,
+    setup_fake_direnv,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+ENVRC = "export FOO=bar\n"
+
+
+def apply_env(env: dict[str, str], env_file: Path) -> dict[str, str]:
+    """Evaluate the env file the way a shell's hook does."""
+    result = subprocess.run(
+        ["bash", "-c", 'eval "$(cat "$0")" && exec env -0', env_file],
+        env=env,
+        capture_output=True,
+        check=True,
+    )
+    entries = result.stdout.decode().split("\0")
+    return dict(entry.split("=", 1) for entry in entries if "=" in entry)
+
+
+def test_new_shell_gets_full_env_after_edit(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test a new shell gets FOO after a loaded shell re-evaluated an edit."""
+    setup_envrc(tmp_path, ENVRC)
+    stub_dir = setup_fake_direnv(tmp_path)
+    setup_stub_tmux(stub_dir)
+    monkeypatch.chdir(tmp_path)
+
+    with subprocess.Popen(["sleep", "60"]) as shell:
+        env = setup_test_env(stub_dir, shell.pid, mux_delay="60")
+
+        # Shell A loads the project
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+        socket_path = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE").parent
+        socket_path /= "daemon.sock"
+        assert wait_until(env_file.exists), "The project was never evaluated"
+        assert wait_until(lambda: not socket_path.exists())
+        shell_a = apply_env(env, env_file)
+        assert shell_a["FOO"] == "bar"
+        shell_a["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+        shell_a["__DIRENV_INSTANT_ENV_FILE"] = str(env_file)
+
+        # ...and re-evaluates it after an edit
+        setup_envrc(tmp_path, ENVRC + "export BAZ=qux\n")
+        result = direnv_instant.run(["start"], shell_a)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert wait_until(lambda: "BAZ" in env_file.read_text())
+        assert wait_until(lambda: not socket_path.exists())
+
+        # Shell B opens in the project with nothing loaded
+        result = direnv_instant.run(["start"], env)
+        shell.kill()
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert "export FOO=bar;" in result.stdout
+    assert "export BAZ=qux;" in result.stdout
+    assert "export DIRENV_DIR=" in result.stdout
@@ -0,0 +1,50 @@
+"""Test that start outside of any project doesn't run direnv when it has no work.
+
+How much that saves is measured by the no_envrc scenario of
+test_benchmark_start_latency.py.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from tests.helpers import setup_stub_direnv
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+PROMPTS = 5
+
+
+def test_no_envrc_skips_direnv(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test prompts outside projects only exec direnv to unload an environment."""
+    project_free_dir = tmp_path / "no-project"
+    project_free_dir.mkdir()
+    monkeypatch.chdir(project_free_dir)
+
+    calls = tmp_path / "direnv_calls"
+    stub_dir = setup_stub_direnv(tmp_path, f'echo "$@" >> {calls}')
+
+    env = os.environ.copy()
+    env["PATH"] = f"{stub_dir}:{env['PATH']}"
+    for var in ["DIRENV_DIR", "DIRENV_DIFF", "__DIRENV_INSTANT_CURRENT_DIR"]:
+        env.pop(var, None)
+
+    for _ in range(PROMPTS):
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert not calls.exists(), "direnv was executed outside of any project"
+
+    # Having just left a project, direnv has to run to unload the environment
+    env["DIRENV_DIR"] = f"-{tmp_path}"
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    (call,) = calls.read_text().splitlines()
+    assert call.startswith("export "), f"Unexpected direnv call: {call}"
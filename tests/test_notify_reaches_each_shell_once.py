@@ -0,0 +1,100 @@
+"""Test that every waiting shell is notified exactly once."""
+
+from __future__ import annotations
+
+import os
+import select
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+from tests.load_harness import spawn_listener
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def subscribers(socket_path: Path) -> int:
+    """Ask the daemon how many shells it would notify."""
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.settimeout(5)
+        sock.connect(str(socket_path))
+        sock.sendall(b"STATUS\n")
+        reply = sock.makefile().readline()
+    assert reply.startswith("subscribers "), reply
+    return int(reply.split()[1])
+
+
+def notifications(fd: int) -> int:
+    """Count the SIGUSR1s a listener has reported so far."""
+    count = 0
+    while select.select([fd], [], [], 0)[0]:
+        count += len(os.read(fd, 64))
+    return count
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="exits are noticed via pidfds")
+def test_notify_reaches_each_shell_once(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test repeated prompts subscribe once and exited shells are dropped."""
+    marker = tmp_path / "done"
+    setup_envrc(tmp_path, f"while [ ! -f {marker} ]; do sleep 0.1; done\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    shells = [spawn_listener() for _ in range(3)]
+    try:
+        # Keep socket paths short enough for sockaddr_un
+        with tempfile.TemporaryDirectory() as cache_dir:
+            socket_path = None
+            for (pid, _), prompts in zip(shells, [3, 2, 1], strict=True):
+                env = setup_test_env(tmp_path, pid, mux_delay="60")
+                env["XDG_CACHE_HOME"] = cache_dir
+                env["XDG_RUNTIME_DIR"] = cache_dir
+                env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+                for _ in range(prompts):
+                    result = direnv_instant.run(["start"], env)
+                    assert result.returncode == 0, f"Failed: {result.stderr}"
+                socket_path = next(Path(cache_dir).glob("*/*/daemon.sock"))
+            assert socket_path is not None
+            assert subscribers(socket_path) == 3
+
+            # The last shell exits without telling the daemon
+            exited_pid, exited_fd = shells.pop()
+            os.kill(exited_pid, signal.SIGKILL)
+            os.waitpid(exited_pid, 0)
+            os.close(exited_fd)
+            assert wait_until(lambda: subscribers(socket_path) == 2, timeout=5), (
+                "Exited shell was not dropped"
+            )
+
+            marker.touch()
+            for _, fd in shells:
+                assert select.select([fd], [], [], 10)[0], "Shell was not notified"
+            # Give duplicates time to arrive
+            time.sleep(0.5)
+            assert [notifications(fd) for _, fd in shells] == [1, 1]
+            assert wait_until(lambda: not socket_path.exists()), (
+                "Daemon did not exit"
+            )
+    finally:
+        for pid, fd in shells:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            os.close(fd)
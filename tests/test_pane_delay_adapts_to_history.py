@@ -0,0 +1,69 @@
+"""Test that the pane delay follows how long a project usually takes."""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def start(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    seconds: float,
+    waiter: SignalWaiter,
+) -> None:
+    """Start evaluating an .envrc that takes `seconds`."""
+    (tmp_path / "panes").unlink(missing_ok=True)
+    setup_envrc(tmp_path, f"sleep {seconds}\nexport TOOK={seconds}\n")
+    allow_direnv(tmp_path, monkeypatch)
+    env = setup_test_env(tmp_path, waiter.pid, mux_delay="2")
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+
+def test_pane_delay_adapts_to_history(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test a quick project overrunning the delay gets no pane, slow ones at once."""
+    pane_log = tmp_path / "panes"
+    setup_stub_tmux(tmp_path, f"echo pane >> {pane_log}")
+
+    # Without history the fixed delay applies. The second run overruns the
+    # delay, but not twice the usual time.
+    for seconds in [1.5, 2.5]:
+        waiter = SignalWaiter()
+        try:
+            start(tmp_path, monkeypatch, direnv_instant, seconds, waiter)
+            assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+        finally:
+            waiter.cleanup()
+        assert not pane_log.exists(), f"Pane opened for a {seconds}s evaluation"
+
+    # Usually takes longer than the delay now, so the pane shows right away
+    waiter = SignalWaiter()
+    try:
+        started = time.monotonic()
+        start(tmp_path, monkeypatch, direnv_instant, 2.4, waiter)
+        while not pane_log.exists() and time.monotonic() - started < 2:
+            time.sleep(0.05)
+        assert pane_log.exists(), "Pane was not opened right away"
+        assert time.monotonic() - started < 1
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
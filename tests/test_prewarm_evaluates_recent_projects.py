@@ -0,0 +1,66 @@
+"""Test that prewarm re-evaluates recently used projects with a stale cache."""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+from tests.helpers import allow_direnv, count_runs, setup_envrc
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_prewarm_evaluates_recent_projects(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test visited projects are evaluated once, and again when they change."""
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = os.environ.copy()
+        env["XDG_CACHE_HOME"] = cache_dir
+        env["XDG_RUNTIME_DIR"] = cache_dir
+        for var in ["TMUX", "ZELLIJ", "TERM_PROGRAM", "KITTY_LISTEN_ON"]:
+            env.pop(var, None)
+
+        counters = {}
+        for name in ["project-a", "project-b", "never-visited"]:
+            project = tmp_path / name
+            project.mkdir()
+            counters[name] = project / "runs"
+            setup_envrc(project, f"echo run >> {counters[name]}\nexport P={name}\n")
+            allow_direnv(project, monkeypatch)
+
+        # Without a multiplexer start runs direnv synchronously, but still
+        # records the visit
+        for name in ["project-a", "project-b"]:
+            monkeypatch.chdir(tmp_path / name)
+            result = direnv_instant.run(["start"], env)
+            assert result.returncode == 0, f"Failed: {result.stderr}"
+            assert count_runs(counters[name]) == 1
+
+        monkeypatch.chdir(tmp_path)
+        result = direnv_instant.run(["prewarm"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert count_runs(counters["project-a"]) == 2
+        assert count_runs(counters["project-b"]) == 2
+        assert count_runs(counters["never-visited"]) == 0
+
+        # Fresh caches are left alone
+        result = direnv_instant.run(["prewarm"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert count_runs(counters["project-a"]) == 2
+        assert count_runs(counters["project-b"]) == 2
+
+        project_b = tmp_path / "project-b"
+        setup_envrc(project_b, f"echo run >> {counters['project-b']}\nexport P=new\n")
+        allow_direnv(project_b, monkeypatch)
+        result = direnv_instant.run(["prewarm"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert count_runs(counters["project-a"]) == 2
+        assert count_runs(counters["project-b"]) == 3
@@ -0,0 +1,58 @@
+"""Test that prewarm evaluates from the env the current project was loaded on."""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+from tests.helpers import setup_envrc, setup_fake_direnv
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+# Records the variable another project's .envrc sets
+ENVRC = """echo "${FROM_OTHER:-clean}" >> runs
+export P=1
+"""
+
+
+def test_prewarm_unloads_current_project(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test another project's variables don't end up in the prewarmed env."""
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        stub_dir = setup_fake_direnv(tmp_path)
+        env = os.environ.copy()
+        env["PATH"] = f"{stub_dir}:{env['PATH']}"
+        env["XDG_CACHE_HOME"] = cache_dir
+        env["XDG_RUNTIME_DIR"] = cache_dir
+        for var in ["TMUX", "ZELLIJ", "TERM_PROGRAM", "KITTY_LISTEN_ON"]:
+            env.pop(var, None)
+
+        project = tmp_path / "project"
+        project.mkdir()
+        setup_envrc(project, ENVRC)
+        runs = project / "runs"
+
+        monkeypatch.chdir(project)
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert runs.read_text().splitlines() == ["clean"]
+
+        # Prewarm from a shell that has another project loaded
+        other = tmp_path / "other"
+        other.mkdir()
+        env["DIRENV_DIR"] = f"-{other}"
+        env["DIRENV_DIFF"] = json.dumps({"FROM_OTHER": None})
+        env["FROM_OTHER"] = "polluted"
+        monkeypatch.chdir(other)
+        result = direnv_instant.run(["prewarm"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert runs.read_text().splitlines() == ["clean", "clean"]
@@ -0,0 +1,53 @@
+"""Test that profile attributes an evaluation's time to .envrc lines."""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING
+
+from tests.helpers import setup_envrc, setup_fake_direnv
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+def test_profile_breaks_down_envrc(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the slowest line comes first and direnv's output is timestamped."""
+    setup_envrc(tmp_path, "echo quick\nsleep 0.1\nsleep 0.5\necho slow done\n")
+    stub_dir = setup_fake_direnv(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    env = os.environ.copy()
+    env["PATH"] = f"{stub_dir}:{env['PATH']}"
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+    env["XDG_RUNTIME_DIR"] = str(tmp_path)
+
+    result = direnv_instant.run(["profile", "--json"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    profile = json.loads(result.stdout)
+
+    assert profile["status"] == 0
+    assert profile["seconds"] >= 0.6
+    slowest, second = profile["lines"][:2]
+    assert slowest["name"].endswith(".envrc:3: sleep 0.5")
+    assert slowest["seconds"] >= 0.5
+    assert second["name"].endswith(".envrc:2: sleep 0.1")
+    assert profile["phases"][0]["name"] == "sleep"
+    assert profile["phases"][0]["count"] == 2
+    phases = {phase["name"] for phase in profile["phases"]}
+    assert {"direnv (before .envrc)", "direnv (after .envrc)", "echo"} <= phases
+    texts = [line["text"] for line in profile["output"]]
+    assert texts.index("quick") < texts.index("slow done")
+    assert profile["output"][texts.index("slow done")]["seconds"] >= 0.6
+
+    # Without --json the breakdown is readable and nothing is left behind
+    result = direnv_instant.run(["profile"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert "sleep 0.5" in result.stdout
+    assert "slow done" in result.stderr
+    assert not list(tmp_path.glob("direnv-instant/*/*"))
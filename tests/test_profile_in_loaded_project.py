@@ -0,0 +1,47 @@
+"""Test that profile traces a project the shell has loaded already."""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+from typing import TYPE_CHECKING
+
+from tests.helpers import setup_envrc, setup_fake_direnv
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_profile_in_loaded_project(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test the .envrc is evaluated even though nothing changed since loading."""
+    setup_envrc(tmp_path, "sleep 0.1\nexport FOO=bar\n")
+    stub_dir = setup_fake_direnv(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    env = os.environ.copy()
+    env["PATH"] = f"{stub_dir}:{env['PATH']}"
+    env["XDG_CACHE_HOME"] = str(tmp_path / "cache")
+    env["XDG_RUNTIME_DIR"] = str(tmp_path)
+
+    # Load the project the way the shell hook does
+    loaded = subprocess.run(
+        ["bash", "-c", 'eval "$(direnv export bash)" && exec env -0'],
+        env=env,
+        capture_output=True,
+        check=True,
+    )
+    entries = loaded.stdout.decode().split("\0")
+    env = dict(entry.split("=", 1) for entry in entries if "=" in entry)
+    assert env["FOO"] == "bar"
+
+    result = direnv_instant.run(["profile", "--json"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    profile = json.loads(result.stdout)
+    assert profile["status"] == 0
+    assert profile["lines"][0]["name"].endswith(".envrc:1: sleep 0.1")
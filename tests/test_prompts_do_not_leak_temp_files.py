@@ -0,0 +1,76 @@
+"""Test that prompts hitting a running daemon don't allocate temp files."""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+PROMPTS = 50
+
+
+def temp_files(runtime_dir: Path) -> list[str]:
+    return sorted(
+        f.name
+        for f in runtime_dir.iterdir()
+        if f.name not in {"env", "env.stderr"}
+        and re.fullmatch(r"env(_stderr)?\.\w{6}", f.name)
+    )
+
+
+def test_prompts_do_not_leak_temp_files(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test the runtime dir stays the same size across many prompts."""
+    done_marker = tmp_path / "envrc_done"
+    setup_envrc(
+        tmp_path,
+        f"while [ ! -f {done_marker} ]; do sleep 0.1; done\nexport FOO=bar\n",
+    )
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    runtime_dir = stderr_file.parent
+    socket_path = runtime_dir / "daemon.sock"
+
+    assert socket_path.exists(), "Daemon socket not created"
+
+    # The daemon's own output files for the evaluation in progress
+    assert wait_until(lambda: len(temp_files(runtime_dir)) == 2)
+    files_before = sorted(f.name for f in runtime_dir.iterdir())
+
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    for _ in range(PROMPTS):
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    assert sorted(f.name for f in runtime_dir.iterdir()) == files_before
+
+    done_marker.touch()
+    assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+    assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+    assert temp_files(runtime_dir) == [], "Temp files left behind"
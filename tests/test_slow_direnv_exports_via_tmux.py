@@ -43,10 +43,8 @@ export BAZ=qux
     setup_stub_tmux(
         tmp_path,
         f"""touch {tmux_called_file}
-log_path="${{@: -2:1}}"
 socket_path="${{@: -1}}"
-{direnv_instant.binary_path} watch "$log_path" "$socket_path" \\
-  > {watch_output_file} 2>&1 &""",
+{direnv_instant.binary_path} watch "$socket_path" > {watch_output_file} 2>&1 &""",
     )
 
     allow_direnv(tmp_path, monkeypatch)
@@ -0,0 +1,71 @@
+"""Test that timings are recorded and summarised by the stats command."""
+
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def events_line(event: dict[str, object]) -> str:
+    return json.dumps(event, separators=(",", ":")) + "\n"
+
+
+def test_stats_reports_percentiles(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test an evaluation's phases show up in the file and the report."""
+    setup_envrc(tmp_path, "echo building >&2\nexport FOO=bar\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+        env["XDG_CACHE_HOME"] = cache_dir
+        stats_file = Path(cache_dir) / "direnv-instant" / "stats.jsonl"
+
+        result = direnv_instant.run(["stats"], env)
+        assert result.returncode != 0
+        assert "DIRENV_INSTANT_STATS=1" in result.stderr
+
+        env["DIRENV_INSTANT_STATS"] = "1"
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+
+        events = [json.loads(line) for line in stats_file.read_text().splitlines()]
+        recorded = {event["event"] for event in events}
+        expected = {"start", "lookup", "spawn", "first_output", "eval", "store_env"}
+        assert expected <= recorded
+        assert all(event["project"] == str(tmp_path) for event in events)
+
+        result = direnv_instant.run(["stats"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert str(tmp_path) in result.stdout
+        for event in expected:
+            assert f"  {event} " in result.stdout
+
+        # The file is rotated instead of growing without bound
+        stats_file.write_text(events_line(events[0]) * 20000)
+        monkeypatch.chdir(cache_dir)
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert stats_file.stat().st_size < 4096
+        assert stats_file.with_suffix(".jsonl.old").exists()
@@ -0,0 +1,85 @@
+"""Test that the log shown by the shell stays small for chatty builds."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+CHATTY_BUILD = """echo build-starts >&2
+for i in $(seq 100000); do echo "building step $i of a very chatty derivation" >&2; done
+echo build-ends >&2
+"""
+
+
+def evaluate(direnv_instant: DirenvInstantRunner, env: dict[str, str]) -> str:
+    waiter = SignalWaiter()
+    try:
+        env["DIRENV_INSTANT_SHELL_PID"] = str(waiter.pid)
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert waiter.wait(timeout=60), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    return stderr_file.read_text(errors="replace")
+
+
+def test_stderr_log_is_bounded(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test head/tail capping and the summary mode."""
+    setup_stub_tmux(tmp_path)
+    env = setup_test_env(tmp_path, 0, mux_delay="60")
+
+    project = tmp_path / "project"
+    project.mkdir()
+    setup_envrc(project, CHATTY_BUILD + "export FOO=bar\n")
+    allow_direnv(project, monkeypatch)
+
+    log = evaluate(direnv_instant, env)
+    assert len(log) < 40 * 1024, f"Shell log is {len(log)} bytes"
+    assert "build-starts" in log
+    assert "build-ends" in log
+    assert "bytes of output omitted" in log
+
+    # Output that fits the budget is shown in full
+    medium = tmp_path / "medium"
+    medium.mkdir()
+    setup_envrc(
+        medium,
+        'for i in $(seq 400); do echo "medium build line $i of 400" >&2; done\n',
+    )
+    allow_direnv(medium, monkeypatch)
+
+    log = evaluate(direnv_instant, env)
+    assert "bytes of output omitted" not in log
+    assert all(f"line {i} of 400" in log for i in range(1, 401))
+
+    # Summary mode only shows direnv's lines, and the end of a failed build
+    failing = tmp_path / "failing"
+    failing.mkdir()
+    setup_envrc(failing, CHATTY_BUILD + "echo last-words >&2\nexit 1\n")
+    allow_direnv(failing, monkeypatch)
+    env["DIRENV_INSTANT_STDERR"] = "summary"
+
+    log = evaluate(direnv_instant, env)
+    assert "direnv: loading" in log
+    assert "last-words" in log
+    assert "build-starts" not in log
+    assert len(log.splitlines()) < 30
@@ -0,0 +1,62 @@
+"""Test that stopping an evaluation also ends everything the .envrc started."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def is_running(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    # Zombies are dead, whether or not their parent got to reap them yet
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def test_stop_kills_whole_evaluation(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test a descendant ignoring SIGTERM and SIGHUP is killed eventually."""
+    pid_file = tmp_path / "stubborn.pid"
+    setup_envrc(
+        tmp_path,
+        "(trap '' TERM HUP; while :; do sleep 0.1; done) &\n"
+        f"echo $! > {pid_file}\n"
+        "sleep 3600\n",
+    )
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    assert wait_until(lambda: pid_file.exists() and pid_file.read_text().strip())
+    stubborn = int(pid_file.read_text())
+    assert is_running(stubborn)
+
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(tmp_path)
+    result = direnv_instant.run(["stop"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    assert wait_until(lambda: not is_running(stubborn)), (
+        "Evaluation outlived its cancellation"
+    )
@@ -0,0 +1,71 @@
+"""Test that supervisor mode evaluates several projects through one process."""
+
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_supervisor_serves_all_projects(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test that start hands evaluations to a single long-lived supervisor."""
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        supervisor_socket = Path(cache_dir) / "direnv-instant" / "supervisor.sock"
+        setup_stub_tmux(tmp_path)
+
+        waiters: list[SignalWaiter] = []
+        env: dict[str, str] = {}
+        try:
+            for name in ["project-a", "project-b"]:
+                project = tmp_path / name
+                project.mkdir()
+                setup_envrc(project, f"export PROJECT={name}\n")
+                allow_direnv(project, monkeypatch)
+
+                waiter = SignalWaiter()
+                waiters.append(waiter)
+                env = setup_test_env(tmp_path, waiter.pid)
+                env["XDG_CACHE_HOME"] = cache_dir
+                env["XDG_RUNTIME_DIR"] = cache_dir
+                env["DIRENV_INSTANT_SUPERVISOR"] = "1"
+
+                result = direnv_instant.run(["start"], env)
+                assert result.returncode == 0, f"Failed: {result.stderr}"
+                assert supervisor_socket.exists(), "Supervisor socket not created"
+
+                env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+
+                assert waiter.wait(timeout=30), f"SIGUSR1 not received for {name}"
+                assert name in env_file.read_text()
+
+            # The same supervisor is still serving after both evaluations
+            inode = supervisor_socket.stat().st_ino
+            time.sleep(0.5)
+            assert supervisor_socket.stat().st_ino == inode
+        finally:
+            for waiter in waiters:
+                waiter.cleanup()
+            direnv_instant.run(["supervisor", "stop"], env)
+
+        assert wait_until(lambda: not supervisor_socket.exists()), (
+            "Supervisor did not stop"
+        )
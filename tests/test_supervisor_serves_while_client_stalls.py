@@ -0,0 +1,78 @@
+"""Test that a client trickling its request doesn't hold up the supervisor."""
+
+from __future__ import annotations
+
+import socket
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def trickle(client: socket.socket, stop: threading.Event) -> None:
+    """Send a byte every so often, never finishing the request."""
+    with client:
+        while not stop.wait(0.2):
+            try:
+                client.sendall(b"E")
+            except OSError:
+                return
+
+
+def test_supervisor_serves_while_client_stalls(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test that shells are served while another client is still sending."""
+    # Keep socket paths short enough for sockaddr_un
+    with tempfile.TemporaryDirectory() as cache_dir:
+        supervisor_socket = Path(cache_dir) / "direnv-instant" / "supervisor.sock"
+        setup_stub_tmux(tmp_path)
+        projects = []
+        for name in ["project-a", "project-b"]:
+            project = tmp_path / name
+            project.mkdir()
+            setup_envrc(project, f"export PROJECT={name}\n")
+            allow_direnv(project, monkeypatch)
+            projects.append(project)
+
+        waiters = [SignalWaiter(), SignalWaiter()]
+        stop = threading.Event()
+        stalled = None
+        env: dict[str, str] = {}
+        try:
+            for project, waiter in zip(projects, waiters, strict=True):
+                monkeypatch.chdir(project)
+                env = setup_test_env(tmp_path, waiter.pid)
+                env["XDG_CACHE_HOME"] = cache_dir
+                env["XDG_RUNTIME_DIR"] = cache_dir
+                env["DIRENV_INSTANT_SUPERVISOR"] = "1"
+
+                result = direnv_instant.run(["start"], env)
+                assert result.returncode == 0, f"Failed: {result.stderr}"
+                assert waiter.wait(timeout=30), f"SIGUSR1 not received for {project}"
+
+                if stalled is None:
+                    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    client.connect(str(supervisor_socket))
+                    stalled = threading.Thread(target=trickle, args=(client, stop))
+                    stalled.start()
+        finally:
+            stop.set()
+            if stalled is not None:
+                stalled.join()
+            for waiter in waiters:
+                waiter.cleanup()
+            direnv_instant.run(["supervisor", "stop"], env)
@@ -0,0 +1,68 @@
+"""Test that a shell switching projects doesn't get the cached env inline."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from tests.conftest import SignalWaiter
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def test_switching_projects_skips_cached_env(
+    tmp_path: Path, monkeypatch: MonkeyPatch, direnv_instant: DirenvInstantRunner
+) -> None:
+    """Test direnv runs to unload the old project even if the new one is cached."""
+    projects = {}
+    for name in ["a", "b"]:
+        project = tmp_path / name
+        project.mkdir()
+        setup_envrc(project, f"export {name.upper()}_ONLY=1\n")
+        allow_direnv(project, monkeypatch)
+        projects[name] = project
+    setup_stub_tmux(tmp_path)
+    monkeypatch.chdir(projects["b"])
+
+    # A new shell in b leaves a fresh cache behind
+    waiter = SignalWaiter()
+    try:
+        env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+        for var in ["__DIRENV_INSTANT_CURRENT_DIR", "DIRENV_DIR", "DIRENV_DIFF"]:
+            env.pop(var, None)
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert waiter.wait(timeout=30), "SIGUSR1 was not received"
+    finally:
+        waiter.cleanup()
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    assert wait_until(lambda: not socket_path.exists()), "Daemon did not exit"
+
+    # A shell with a's env loaded changes into b
+    waiter = SignalWaiter()
+    try:
+        env = setup_test_env(tmp_path, waiter.pid, mux_delay="60")
+        env["__DIRENV_INSTANT_CURRENT_DIR"] = str(projects["a"])
+        env["DIRENV_DIR"] = f"-{projects['a']}"
+        env["DIRENV_DIFF"] = "a-diff"
+        env["A_ONLY"] = "1"
+        result = direnv_instant.run(["start"], env)
+        assert result.returncode == 0, f"Failed: {result.stderr}"
+        assert "B_ONLY" not in result.stdout, "Cached env was served inline"
+        assert "__DIRENV_INSTANT_ENV_GEN=" not in result.stdout
+        assert waiter.wait(timeout=30), "direnv was not run for the switch"
+    finally:
+        waiter.cleanup()
@@ -0,0 +1,84 @@
+"""Test that watch mode re-evaluates as soon as a watched file changes."""
+
+from __future__ import annotations
+
+import subprocess
+import time
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner
+
+
+def line_count(path: Path) -> int:
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_watch_mode_reevaluates_on_change(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    subprocess_runner: list[subprocess.Popen[str]],
+) -> None:
+    """Test an edited .envrc is picked up without a prompt, and STOP ends watching."""
+    project = tmp_path / "project"
+    project.mkdir()
+    runs = tmp_path / "runs"
+    setup_envrc(project, f"echo run >> {runs}\nexport SAME=same\nexport FOO=one\n")
+    setup_stub_tmux(tmp_path)
+    allow_direnv(project, monkeypatch)
+
+    # A long-lived stand-in for the shell that counts its SIGUSR1s
+    signals = tmp_path / "signals"
+    trap = f"trap 'echo usr1 >> {signals}' USR1; while :; do sleep 0.1; done"
+    shell = subprocess.Popen(["bash", "-c", trap], text=True)
+    subprocess_runner.append(shell)
+
+    env = setup_test_env(tmp_path, shell.pid, mux_delay="60")
+    env["DIRENV_INSTANT_WATCH"] = "1"
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    env_file = exported_path(result, "__DIRENV_INSTANT_ENV_FILE")
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+
+    assert wait_until(lambda: line_count(signals) == 1, timeout=30), (
+        "Shell was not notified"
+    )
+    assert "one" in env_file.read_text()
+    time.sleep(0.5)
+    assert socket_path.exists(), "Daemon exited instead of watching"
+
+    setup_envrc(project, f"echo run >> {runs}\nexport SAME=same\nexport FOO=two\n")
+    allow_direnv(project, monkeypatch)
+    assert wait_until(lambda: line_count(signals) == 2, timeout=30), (
+        "Shell was not notified again"
+    )
+    # Re-evaluated on top of the env shells hold, the env file still sets
+    # what didn't change for shells that enter the project later
+    assert "two" in env_file.read_text()
+    assert "SAME=same" in env_file.read_text()
+    # Writing and allowing the .envrc settle into a single re-evaluation
+    assert line_count(runs) == 2
+    assert socket_path.exists()
+
+    env["__DIRENV_INSTANT_CURRENT_DIR"] = str(project)
+    result = direnv_instant.run(["stop"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+    assert wait_until(lambda: not socket_path.exists(), timeout=30), (
+        "Daemon kept watching after STOP"
+    )
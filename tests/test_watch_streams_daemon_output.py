@@ -0,0 +1,122 @@
+"""Test that the daemon streams direnv's output to any number of watchers."""
+
+from __future__ import annotations
+
+import os
+import select
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tests.helpers import (
+    allow_direnv,
+    exported_path,
+    setup_envrc,
+    setup_stub_tmux,
+    setup_test_env,
+    wait_until,
+)
+
+if TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from tests.conftest import DirenvInstantRunner, SignalWaiter
+
+
+def read_until(watch: subprocess.Popen[bytes], text: bytes, timeout: float) -> bytes:
+    assert watch.stdout
+    output = b""
+    deadline = time.time() + timeout
+    while text not in output:
+        remaining = deadline - time.time()
+        assert remaining > 0, f"Timed out waiting for {text!r}, got {output!r}"
+        ready, _, _ = select.select([watch.stdout], [], [], remaining)
+        if ready:
+            chunk = os.read(watch.stdout.fileno(), 8192)
+            assert chunk, f"Watcher exited before {text!r}, got {output!r}"
+            output += chunk
+    return output
+
+
+def context_switches(pid: int) -> int | None:
+    status = Path(f"/proc/{pid}/status")
+    if sys.platform != "linux" or not status.exists():
+        return None
+    return sum(
+        int(line.split()[1])
+        for line in status.read_text().splitlines()
+        if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"))
+    )
+
+
+def test_watch_streams_daemon_output(
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+    direnv_instant: DirenvInstantRunner,
+    signal_waiter: SignalWaiter,
+) -> None:
+    """Test live streaming, replay for late watchers and the final stderr file."""
+    step_marker = tmp_path / "step"
+    done_marker = tmp_path / "done"
+    setup_envrc(
+        tmp_path,
+        f"""echo first-line >&2
+while [ ! -f {step_marker} ]; do sleep 0.1; done
+echo second-line >&2
+while [ ! -f {done_marker} ]; do sleep 0.1; done
+export FOO=bar
+""",
+    )
+    setup_stub_tmux(tmp_path)
+    allow_direnv(tmp_path, monkeypatch)
+
+    env = setup_test_env(tmp_path, signal_waiter.pid, mux_delay="60")
+    result = direnv_instant.run(["start"], env)
+    assert result.returncode == 0, f"Failed: {result.stderr}"
+
+    stderr_file = exported_path(result, "__DIRENV_INSTANT_STDERR_FILE")
+    socket_path = stderr_file.parent / "daemon.sock"
+    assert wait_until(socket_path.exists), "Daemon socket not created"
+
+    def watch() -> subprocess.Popen[bytes]:
+        return subprocess.Popen(
+            [direnv_instant.binary_path, "watch", str(socket_path)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+        )
+
+    watchers = [watch()]
+    try:
+        read_until(watchers[0], b"first-line", timeout=10)
+        # Nothing goes to disk while the evaluation runs
+        assert not stderr_file.exists()
+
+        # A quiet evaluation doesn't wake the watcher up
+        before = context_switches(watchers[0].pid)
+        time.sleep(1)
+        after = context_switches(watchers[0].pid)
+        if before is not None and after is not None:
+            assert after - before < 3
+
+        step_marker.touch()
+        read_until(watchers[0], b"second-line", timeout=10)
+
+        # A late watcher gets the output it missed
+        watchers.append(watch())
+        replay = read_until(watchers[1], b"second-line", timeout=10)
+        assert b"first-line" in replay
+
+        done_marker.touch()
+        for watcher in watchers:
+            assert watcher.wait(timeout=30) == 0
+        assert signal_waiter.wait(timeout=30), "SIGUSR1 was not received"
+
+        output = stderr_file.read_text()
+        assert "first-line" in output
+        assert "second-line" in output
+    finally:
+        for watcher in watchers:
+            watcher.kill()
+            watcher.wait()
@@ -0,0 +1,62 @@
+"""Test that watch sleeps until the daemon binds its socket instead of polling."""
+
+from __future__ import annotations
+
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from tests.conftest import DirenvInstantRunner
+
+
+def context_switches(pid: int) -> int:
+    status = Path(f"/proc/{pid}/status").read_text()
+    return sum(
+        int(line.split()[1])
+        for line in status.splitlines()
+        if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"))
+    )
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="needs inotify and /proc")
+def test_watch_waits_for_daemon_socket(direnv_instant: DirenvInstantRunner) -> None:
+    """Test watch is idle until the socket appears and connects right away."""
+    # Keep socket paths short enough for sockaddr_un
+    with (
+        tempfile.TemporaryDirectory() as socket_dir,
+        socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server,
+    ):
+        socket_path = Path(socket_dir) / "daemon.sock"
+        watch = subprocess.Popen(
+            [direnv_instant.binary_path, "watch", str(socket_path)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            time.sleep(0.2)
+            # A 100ms poll would wake up about 10 times here
+            before = context_switches(watch.pid)
+            time.sleep(1)
+            assert context_switches(watch.pid) - before < 3
+
+            server.bind(str(socket_path))
+            server.listen()
+            start = time.time()
+            server.settimeout(5)
+            daemon_side, _ = server.accept()
+            assert time.time() - start < 1
+            with daemon_side:
+                assert daemon_side.recv(64) == b"STREAM\n"
+                daemon_side.sendall(b"output\n")
+            assert watch.communicate(timeout=5)[0] == b"output\n"
+            assert watch.returncode == 0
+        finally:
+            watch.kill()
+            watch.wait()